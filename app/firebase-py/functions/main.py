@@ -5,10 +5,12 @@ from firebase_admin import initialize_app
 
 from loguru import logger
 
-from shared_functions.interface import ParsePostRequest
+from shared_functions.interface import ParsePostRequest, ParseBatchRequest
 from shared_functions.main import (
     SM_FUNCTION_post_parser_config,
     SM_FUNCTION_post_parser_imp,
+    SM_FUNCTION_batch_post_parser_imp,
+    SM_FUNCTION_warm_parser,
 )
 from env_config import (
     openai_api_key,
@@ -20,6 +22,19 @@ from env_config import (
 
 app = initialize_app()
 
+# we will handle credentials from here and also crendentials rotation if needed
+parser_config: SM_FUNCTION_post_parser_config = {
+    "openrouter_api_key": openai_api_key,
+    "openrouter_api_base": "https://openrouter.ai/api/v1",
+    "openrouter_referer": "https://127.0.0.1:3000/",
+    "ref_tagger_llm_type": ref_tagger_model,
+    "kw_llm_type": kw_model,
+    "topic_llm_type": topic_model,
+}
+
+# build the parser once per instance so requests reuse it
+SM_FUNCTION_warm_parser(parser_config)
+
 
 @https_fn.on_request(min_instances=min_instances, max_instances=100, memory=2048, timeout_sec=3600, concurrency=190)
 def SM_FUNCTION_post_parser(request):
@@ -30,26 +45,18 @@ def SM_FUNCTION_post_parser(request):
     post = request_json["post"]
     parameters = request_json["parameters"]
 
-    # we will handle credentials from here and also crendentials rotation if needed
     # input is going to be an array of posts to parse
 
-    config: SM_FUNCTION_post_parser_config = {
-        "openrouter_api_key": openai_api_key,
-        "openrouter_api_base": "https://openrouter.ai/api/v1",
-        "openrouter_referer": "https://127.0.0.1:3000/",
-        "ref_tagger_llm_type": ref_tagger_model,
-        "kw_llm_type": kw_model,
-        "topic_llm_type": topic_model,
-    }
-
-    logger.info(f"Calling SM_FUNCTION_post_parser_imp with config: {config}")
+    logger.info(
+        f"Calling SM_FUNCTION_post_parser_imp with models: ref_tagger={ref_tagger_model}, kw={kw_model}, topics={topic_model}"
+    )
 
     request: ParsePostRequest = {
         "post": post,
         "parameters": parameters,
     }
 
-    parser_result = SM_FUNCTION_post_parser_imp(request, config)
+    parser_result = SM_FUNCTION_post_parser_imp(request, parser_config)
     parser_json = parser_result.model_dump_json()
 
     return https_fn.Response(
@@ -57,3 +64,30 @@ def SM_FUNCTION_post_parser(request):
         status=200,
         headers={"Content-Type": "application/json"},
     )
+
+
+@https_fn.on_request(min_instances=min_instances, max_instances=100, memory=2048, timeout_sec=3600, concurrency=190)
+def SM_FUNCTION_batch_post_parser(request):
+    """
+    Wrapper on SM_FUNCTION_batch_post_parser_imp. Parses an array of posts
+    (each in the format of SM_FUNCTION_post_parser requests) in one call.
+    """
+    request_json = request.get_json()
+
+    logger.info(
+        f"Calling SM_FUNCTION_batch_post_parser_imp with models: ref_tagger={ref_tagger_model}, kw={kw_model}, topics={topic_model}"
+    )
+
+    batch_request: ParseBatchRequest = {
+        "requests": request_json["requests"],
+        "parameters": request_json.get("parameters", {}),
+    }
+
+    batch_response = SM_FUNCTION_batch_post_parser_imp(batch_request, parser_config)
+    batch_json = batch_response.model_dump_json()
+
+    return https_fn.Response(
+        batch_json,
+        status=200,
+        headers={"Content-Type": "application/json"},
+    )
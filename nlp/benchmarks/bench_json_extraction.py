@@ -0,0 +1,106 @@
+"""Benchmark extraction of JSON objects from recorded LLM completions.
+
+Compares the single-pass extractor (`utils.extract_json_object`) with the
+previous approach of trying to parse every balanced brace substring
+(with `jsoncomment` if installed, plain `json` otherwise).
+Completions are optionally padded with noisy text containing braces, as
+produced by models echoing prompt templates.
+
+Usage:
+  bench_json_extraction.py [--data=<data> --repeat=<repeat> --noise=<noise>]
+  bench_json_extraction.py (-h | --help)
+
+
+Options:
+  -h --help     Show this screen.
+  --data=<data>  jsonl file of recorded completions [default: benchmarks/data/llm_completions.jsonl].
+  --repeat=<repeat>  Number of times to extract each completion [default: 200].
+  --noise=<noise>  Number of noisy `{...}` fragments to prepend to each completion [default: 50].
+
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import json
+import time
+from docopt import docopt
+
+from desci_sense.shared_functions.utils import clean_comments, extract_json_object
+
+try:
+    from jsoncomment import JsonComment
+
+    legacy_loads = JsonComment().loads
+except ImportError:
+    legacy_loads = json.loads
+
+NOISE_FRAGMENT = "Tag format: {<tag>: reason} "
+
+
+def legacy_find_json_object(input_string: str):
+    # previous implementation: parse each balanced substring from the first `{`
+    input_string = clean_comments(input_string)
+    input_string = input_string.replace("\\_", "_")
+    input_string = input_string.replace("\\[", "[")
+    input_string = input_string.replace("\\]", "]")
+    start = input_string.find("{")
+    if start == -1:
+        return None
+    stack = []
+    for i in range(start, len(input_string)):
+        if input_string[i] == "{":
+            stack.append(i)
+        elif input_string[i] == "}":
+            if stack:
+                stack.pop()
+                if not stack:
+                    try:
+                        return legacy_loads(input_string[start : i + 1])
+                    except json.JSONDecodeError:
+                        continue
+    return None
+
+
+def try_extract(text: str):
+    try:
+        return extract_json_object(text)
+    except ValueError:
+        return None
+
+
+def time_fn(fn, completions, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for c in completions:
+            fn(c)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    repeat = int(arguments["--repeat"])
+    noise = int(arguments["--noise"])
+
+    with open(ROOT / arguments["--data"]) as f:
+        completions = [json.loads(line)["completion"] for line in f]
+
+    for num_noise in sorted({0, noise}):
+        inputs = [NOISE_FRAGMENT * num_noise + c for c in completions]
+        found = sum(try_extract(c) is not None for c in inputs)
+        legacy_found = sum(legacy_find_json_object(c) is not None for c in inputs)
+        new_time = time_fn(try_extract, inputs, repeat)
+        legacy_time = time_fn(legacy_find_json_object, inputs, repeat)
+        num_calls = repeat * len(inputs)
+        print(f"noise fragments: {num_noise}")
+        print(
+            f"  single-pass: {1e6 * new_time / num_calls:.1f} us/completion, "
+            f"parsed {found}/{len(inputs)}"
+        )
+        print(
+            f"  legacy:      {1e6 * legacy_time / num_calls:.1f} us/completion, "
+            f"parsed {legacy_found}/{len(inputs)}"
+        )
@@ -0,0 +1,278 @@
+"""Benchmark the parser end to end without network access.
+
+Runs the parser against local fake services (see `offline_bench`): a chat
+completions server returning deterministic answers for each chain after a
+configurable latency, and a Citoid server. Requests are threads built from
+the sample post in `parser_result_sample.pkl` and reference URLs used by
+the tests.
+
+Measures three phases, each with a new parser:
+  - `process_parse_request`: requests processed one at a time, with per-stage
+    latencies from request traces.
+  - `batch_process_parser_inputs`: all requests processed as a batch.
+  - `firebase_post_process`: post processing of recorded chain outputs to the
+    Firebase format.
+
+Reports throughput, latency percentiles and peak RSS, and saves them as JSON
+named after the current commit, so results of different commits can be
+compared (`--compare`).
+
+Usage:
+  bench_offline_parser.py [options]
+  bench_offline_parser.py (-h | --help)
+
+
+Options:
+  -h --help     Show this screen.
+  --num-requests=<num>  Number of parse requests [default: 50].
+  --batch-size=<size>  Concurrency of the batch phase [default: 5].
+  --llm-latency=<seconds>  Latency of fake model responses [default: 0.05].
+  --llm-jitter=<fraction>  Model latencies vary by up to this fraction [default: 0.5].
+  --citoid-latency=<seconds>  Latency of fake Citoid responses [default: 0.02].
+  --rpm=<rpm>  Model rate limit in requests per minute, 0 to disable [default: 0].
+  --repeat=<repeat>  Times to post process each chain output [default: 20].
+  --seed=<seed>  Seed of generated requests [default: 0].
+  --output=<dir>  Directory of JSON results [default: benchmarks/results].
+  --compare=<path>  JSON results to compare with.
+
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import copy
+import json
+import os
+import time
+from docopt import docopt
+from loguru import logger
+
+from desci_sense.shared_functions.configs import (
+    LLMRateLimitConfig,
+    OpenrouterAPIConfig,
+    PostProcessType,
+    TracingConfig,
+)
+from desci_sense.shared_functions.init import init_multi_chain_parser_config
+from desci_sense.shared_functions.interface import ParserResult
+from desci_sense.shared_functions.parsers.multi_chain_parser import MultiChainParser
+from desci_sense.shared_functions.preprocessing import (
+    convert_parse_request_to_parser_input,
+)
+from desci_sense.shared_functions.web_extractors.citoid import get_citoid_client
+from desci_sense.shared_functions.web_extractors.metadata_extractors import (
+    extract_posts_ref_metadata_dict,
+)
+
+from offline_bench.servers import fake_chat_server, fake_citoid_server
+from offline_bench.stats import (
+    compare_reports,
+    create_report,
+    git_commit,
+    peak_rss_mb,
+    save_report,
+    summarize,
+    summarize_stages,
+)
+from offline_bench.workload import create_parse_requests, load_parser_result_sample
+
+
+def create_parser(api_base: str, rpm: int) -> MultiChainParser:
+    config = init_multi_chain_parser_config(
+        OpenrouterAPIConfig(
+            openrouter_api_base=api_base,
+            openrouter_api_key="offline",
+            openrouter_referer="offline",
+        ),
+        ref_tagger_llm_type="offline/multi-refs-tagger",
+        kw_llm_type="offline/keywords",
+        topic_llm_type="offline/topics",
+    )
+    config.llm_rate_limit_config = LLMRateLimitConfig(
+        enabled=rpm > 0, requests_per_minute=max(rpm, 1)
+    )
+    config.tracing_config = TracingConfig(enabled=True, log=False)
+    return MultiChainParser(config)
+
+
+def bench_process_parse_request(parser: MultiChainParser, requests) -> dict:
+    latencies = []
+    timings = []
+    errors = 0
+    start = time.perf_counter()
+    for request in requests:
+        request_start = time.perf_counter()
+        result = parser.process_parse_request(request)
+        latencies.append(1000 * (time.perf_counter() - request_start))
+        if isinstance(result, ParserResult):
+            timings.append(result.metadata["timings_ms"])
+        else:
+            errors += 1
+    wall = time.perf_counter() - start
+    return {
+        "num_items": len(requests),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(requests) / wall, 3),
+        "latency_ms": summarize(latencies),
+        "stages_ms": summarize_stages(timings),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_batch(parser: MultiChainParser, requests, batch_size: int) -> dict:
+    inputs = [convert_parse_request_to_parser_input(r) for r in requests]
+    start = time.perf_counter()
+    results = parser.batch_process_parser_inputs(
+        inputs, batch_size=batch_size, return_exceptions=True
+    )
+    wall = time.perf_counter() - start
+    return {
+        "num_items": len(requests),
+        "errors": sum(not isinstance(r, ParserResult) for r in results),
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(requests) / wall, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def record_chain_outputs(parser: MultiChainParser, requests) -> list:
+    # inputs of the post processing of each request
+    parallel_chain = parser.create_parallel_chain(list(parser.pparsers))
+    recorded = []
+    for request in requests:
+        parser_input = convert_parse_request_to_parser_input(request)
+        preproc_input = parser.preproc_parser_input(parser_input)
+        post = preproc_input.post_to_parse
+        md_dict = extract_posts_ref_metadata_dict(
+            [post],
+            parser.config.metadata_extract_config.extraction_method,
+            extra_urls=[preproc_input.unparsed_urls],
+            cache=parser.metadata_cache,
+        )
+        inst_prompts = parser.instantiate_prompts(post, md_dict)
+        raw_results = parallel_chain.invoke(inst_prompts)
+        recorded.append(
+            (post, inst_prompts, raw_results, md_dict, preproc_input.unparsed_urls)
+        )
+    return recorded
+
+
+def bench_firebase_post_process(parser: MultiChainParser, requests, repeat: int):
+    recorded = record_chain_outputs(parser, requests)
+    latencies = []
+    errors = 0
+    for post, inst_prompts, raw_results, md_dict, unprocessed_urls in recorded:
+        for _ in range(repeat):
+            # post processing updates the chain outputs
+            raw_results_copy = copy.deepcopy(raw_results)
+            start = time.perf_counter()
+            result = parser.post_process_raw_results(
+                post,
+                inst_prompts,
+                raw_results_copy,
+                md_dict,
+                parser.ontology,
+                PostProcessType.FIREBASE,
+                unprocessed_urls,
+            )
+            latencies.append(1000 * (time.perf_counter() - start))
+            errors += not isinstance(result, ParserResult)
+    total_s = sum(latencies) / 1000
+    return {
+        "num_items": len(latencies),
+        "errors": errors,
+        "wall_s": round(total_s, 3),
+        "throughput_per_s": round(len(latencies) / total_s, 3),
+        "latency_ms": summarize(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_phase(name: str, phase: dict):
+    print(
+        f"{name}: {phase['num_items']} items in {phase['wall_s']:.2f}s "
+        f"({phase['throughput_per_s']:.1f}/s), {phase['errors']} errors, "
+        f"peak rss {phase['peak_rss_mb']}MB"
+    )
+    if "latency_ms" in phase:
+        print("  latency ms: " + json.dumps(phase["latency_ms"]))
+    for stage, summary in phase.get("stages_ms", {}).items():
+        print(f"  {stage}: p50={summary['p50']} p95={summary['p95']}")
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    num_requests = int(arguments["--num-requests"])
+    batch_size = int(arguments["--batch-size"])
+    llm_latency = float(arguments["--llm-latency"])
+    llm_jitter = float(arguments["--llm-jitter"])
+    citoid_latency = float(arguments["--citoid-latency"])
+    rpm = int(arguments["--rpm"])
+    repeat = int(arguments["--repeat"])
+    seed = int(arguments["--seed"])
+
+    logger.disable("desci_sense")
+    # never route requests to the local servers through a proxy
+    os.environ["NO_PROXY"] = "127.0.0.1,localhost"
+
+    sample = load_parser_result_sample(ROOT / "parser_result_sample.pkl")
+    reasoning = sample["answer"]["reasoning"]
+    requests = create_parse_requests(sample, num_requests, seed)
+    warmup_requests = create_parse_requests(sample, 2, seed + 1)
+
+    with fake_chat_server(llm_latency, llm_jitter, reasoning) as api_base:
+        with fake_citoid_server(citoid_latency) as citoid_base:
+            # read by the shared Citoid client when first used
+            os.environ["CITOID_BASE_URL"] = citoid_base
+
+            phases = {}
+            parser = create_parser(api_base, rpm)
+            for request in warmup_requests:
+                parser.process_parse_request(request)
+            phases["process_parse_request"] = bench_process_parse_request(
+                parser, requests
+            )
+            print_phase("process_parse_request", phases["process_parse_request"])
+
+            parser = create_parser(api_base, rpm)
+            phases["batch_process_parser_inputs"] = bench_batch(
+                parser, requests, batch_size
+            )
+            print_phase(
+                "batch_process_parser_inputs", phases["batch_process_parser_inputs"]
+            )
+
+            parser = create_parser(api_base, rpm)
+            phases["firebase_post_process"] = bench_firebase_post_process(
+                parser, requests, repeat
+            )
+            print_phase("firebase_post_process", phases["firebase_post_process"])
+            get_citoid_client().close()
+
+    params = {
+        "num_requests": num_requests,
+        "batch_size": batch_size,
+        "llm_latency": llm_latency,
+        "llm_jitter": llm_jitter,
+        "citoid_latency": citoid_latency,
+        "rpm": rpm,
+        "repeat": repeat,
+        "seed": seed,
+    }
+    commit = git_commit(str(ROOT))
+    report = create_report(commit, params, phases)
+
+    output_dir = ROOT / arguments["--output"]
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / f"offline_parser_{commit or 'unknown'}.json"
+    save_report(report, str(output_path))
+    print(f"saved results to {output_path}")
+
+    if arguments["--compare"]:
+        with open(arguments["--compare"]) as f:
+            baseline = json.load(f)
+        print("\n".join(compare_reports(baseline, report)))
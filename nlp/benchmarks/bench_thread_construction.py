@@ -0,0 +1,149 @@
+"""Benchmark memory allocated while building and trimming long threads.
+
+Compares thread construction with shared immutable posts
+(`create_thread_from_posts` and `trim_thread_by_length`) with the previous
+approach of deep copying every post (and its quoted post) when building
+a thread, and again when trimming it.
+
+Usage:
+  bench_thread_construction.py [--num-posts=<num_posts> --post-length=<post_length> --repeat=<repeat>]
+  bench_thread_construction.py (-h | --help)
+
+
+Options:
+  -h --help     Show this screen.
+  --num-posts=<num_posts>  Number of posts in the thread [default: 100].
+  --post-length=<post_length>  Number of chars in each post and quoted post [default: 2000].
+  --repeat=<repeat>  Number of times to build the thread for timing [default: 50].
+
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import time
+import tracemalloc
+from docopt import docopt
+from loguru import logger
+
+from desci_sense.shared_functions.schema.post import (
+    RefPost,
+    QuoteRefPost,
+    ThreadRefPost,
+)
+from desci_sense.shared_functions.preprocessing import trim_thread_by_length
+from desci_sense.shared_functions.preprocessing.threads import (
+    concat_post_content,
+    create_thread_from_posts,
+)
+from desci_sense.shared_functions.utils import trim_parts_to_length
+
+
+def make_post(i: int, post_length: int) -> QuoteRefPost:
+    url = f"https://example.org/paper/{i}"
+    padding = "x" * (post_length - len(url) - 1)
+    quoted_post = RefPost(
+        author="quoted author",
+        url=f"https://x.com/quoted/status/{i}",
+        content=f"{padding} {url}",
+        ref_urls=[url],
+        ref_url_spans=[(len(padding) + 1, post_length, url)],
+    )
+    return QuoteRefPost(
+        author="author",
+        url=f"https://x.com/author/status/{i}",
+        content=f"{padding} {url}",
+        ref_urls=[url],
+        ref_url_spans=[(len(padding) + 1, post_length, url)],
+        quoted_post=quoted_post,
+        quoted_url=quoted_post.url,
+        source_network="twitter",
+    )
+
+
+def legacy_create_thread_from_posts(posts):
+    # previous implementation: deep copy of each post
+    posts_copy = [p.copy(deep=True) for p in posts]
+    all_ref_urls = []
+    for post in posts:
+        all_ref_urls += post.md_ref_urls()
+    return ThreadRefPost(
+        author=posts[0].author,
+        content=concat_post_content(posts),
+        url=posts[0].url,
+        quoted_url=posts[0].quoted_url,
+        source_network=posts[0].source_network,
+        ref_urls=all_ref_urls,
+        posts=posts_copy,
+    )
+
+
+def legacy_trim_thread_by_length(thread, max_chars: int):
+    # previous implementation: deep copy the trimmed post, then copy the
+    # kept posts again when building the trimmed thread
+    part_lengths = [p.char_length() for p in thread.posts]
+    trimmed_lengths = trim_parts_to_length(part_lengths, max_chars)
+    trimmed_index = len(trimmed_lengths) - 1
+    trimmed_post = thread.posts[trimmed_index].copy(deep=True)
+    # posts are immutable now, set the trimmed content on the copy directly
+    object.__setattr__(
+        trimmed_post,
+        "content",
+        trimmed_post.content[: trimmed_lengths[trimmed_index]],
+    )
+    trimmed_thread = legacy_create_thread_from_posts(
+        thread.posts[: len(trimmed_lengths)]
+    )
+    trimmed_thread.posts[trimmed_index] = trimmed_post
+    return trimmed_thread
+
+
+def build_and_trim(create_fn, trim_fn, posts, max_chars: int):
+    thread = create_fn(posts)
+    return thread, trim_fn(thread, max_chars)
+
+
+def measure(create_fn, trim_fn, posts, max_chars: int, repeat: int):
+    tracemalloc.start()
+    start_size, _ = tracemalloc.get_traced_memory()
+    result = build_and_trim(create_fn, trim_fn, posts, max_chars)
+    end_size, peak_size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        build_and_trim(create_fn, trim_fn, posts, max_chars)
+    elapsed = time.perf_counter() - start
+
+    return end_size - start_size, peak_size - start_size, elapsed / repeat
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    num_posts = int(arguments["--num-posts"])
+    post_length = int(arguments["--post-length"])
+    repeat = int(arguments["--repeat"])
+    # trimming logs a warning for every thread
+    logger.disable("desci_sense")
+
+    posts = [make_post(i, post_length) for i in range(num_posts)]
+    # keep about half of the thread, cutting the last kept post in the middle
+    max_chars = num_posts * post_length + post_length // 2
+
+    print(
+        f"{num_posts} posts of {post_length} chars (+ quoted posts), "
+        f"trimmed to {max_chars} chars"
+    )
+    for name, create_fn, trim_fn in [
+        ("shared", create_thread_from_posts, trim_thread_by_length),
+        ("legacy", legacy_create_thread_from_posts, legacy_trim_thread_by_length),
+    ]:
+        retained, peak, elapsed = measure(create_fn, trim_fn, posts, max_chars, repeat)
+        print(
+            f"  {name}: retained {retained / 1024:.0f} KiB, "
+            f"peak {peak / 1024:.0f} KiB, {1e3 * elapsed:.2f} ms/thread"
+        )
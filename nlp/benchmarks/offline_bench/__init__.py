@@ -0,0 +1,4 @@
+"""
+Fake services and workloads for benchmarking the parser offline
+(see `bench_offline_parser.py`).
+"""
@@ -0,0 +1,229 @@
+"""
+Local stand-ins for the network services used by the parser: an
+OpenAI-compatible chat completions server returning deterministic
+answers for each parser chain, and a Citoid server returning a metadata
+record for any URL. Both respond after a configurable latency.
+"""
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List
+from urllib.parse import unquote
+import hashlib
+import json
+import re
+import threading
+import time
+
+from desci_sense.shared_functions.prompting.jinja.topics_template import (
+    ALLOWED_TOPICS,
+)
+
+KEYWORDS = [
+    "open-science",
+    "psychiatry",
+    "machine-learning",
+    "replication",
+    "peer-review",
+    "clinical-trials",
+    "climate-models",
+    "genomics",
+    "nlp",
+    "publishing",
+]
+
+LABEL_REGEX = re.compile(r"^\s*<([a-z][\w-]*)>:", re.MULTILINE)
+REF_REGEX = re.compile(r"<ref_(\d+)>")
+
+
+def prompt_seed(prompt: str) -> int:
+    return int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+
+
+def pick(items: List[str], seed: int, k: int) -> List[str]:
+    # k distinct items chosen deterministically from `seed`
+    start = seed % len(items)
+    return [items[(start + i * 3) % len(items)] for i in range(min(k, len(items)))]
+
+
+def multi_ref_answer(prompt: str, reasoning: str, seed: int) -> str:
+    labels = [l for l in LABEL_REGEX.findall(prompt) if not l.startswith("ref_")]
+    # zero and single reference prompts expect a single sub answer
+    num_refs = max([1] + [int(n) for n in REF_REGEX.findall(prompt)])
+    sub_answers = []
+    for ref_number in range(1, num_refs + 1):
+        tags = [f"<{label}>" for label in pick(labels, seed + ref_number, 2)]
+        sub_answers.append(
+            {
+                "ref_number": ref_number,
+                "reasoning_steps": reasoning,
+                "candidate_tags": ", ".join(tags),
+                "final_answer": tags[: 1 + (seed + ref_number) % 2],
+            }
+        )
+    return json.dumps({"sub_answers": sub_answers}, indent=2)
+
+
+def keywords_answer(seed: int) -> str:
+    keywords = " ".join(f"#{kw}" for kw in pick(KEYWORDS, seed, 4))
+    academic = "#academic" if seed % 3 else "#not-academic"
+    return (
+        "Reasoning Steps: The post discusses research.\n"
+        f"Candidate Keywords: {keywords}\n"
+        f"Final Answer: {keywords} {academic}"
+    )
+
+
+def topics_answer(seed: int) -> str:
+    topics = ", ".join(pick(ALLOWED_TOPICS, seed, 2))
+    return (
+        "Reasoning Steps: The post discusses research.\n"
+        f"Candidate Topics: {topics}\n"
+        f"Final Answer: {topics}"
+    )
+
+
+def fake_completion(prompt: str, reasoning: str) -> str:
+    """
+    Deterministic answer to `prompt`, in the output format of the chain
+    the prompt was instantiated by.
+    """
+    seed = prompt_seed(prompt)
+    if "SubAnswer" in prompt:
+        return multi_ref_answer(prompt, reasoning, seed)
+    if "Candidate Keywords" in prompt:
+        return keywords_answer(seed)
+    return topics_answer(seed)
+
+
+def message_text(message: Dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        # content parts (eg with cache-control hints)
+        return "".join(part.get("text", "") for part in content)
+    return content
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    # keep-alive connections
+    protocol_version = "HTTP/1.1"
+    # response latency in seconds
+    latency = 0.0
+
+    def send_json(self, response):
+        data = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeChatHandler(JSONHandler):
+    jitter = 0.0
+    reasoning = ""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = "\n".join(message_text(m) for m in body["messages"])
+        seed = prompt_seed(prompt)
+        # deterministic latency in [latency * (1 - jitter), latency * (1 + jitter)]
+        spread = (seed % 1001) / 500 - 1
+        time.sleep(max(0.0, self.latency * (1 + self.jitter * spread)))
+
+        content = fake_completion(prompt, self.reasoning)
+        response = {
+            "id": f"fake-{seed:x}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        }
+        self.send_json(response)
+
+
+def citoid_record(target_url: str) -> Dict:
+    seed = prompt_seed(target_url)
+    return {
+        "itemType": "journalArticle",
+        "title": f"Study of {target_url.rstrip('/').split('/')[-1]}",
+        "url": target_url,
+        "creators": [
+            {
+                "firstName": "Ada",
+                "lastName": f"Author{seed % 100}",
+                "creatorType": "author",
+            }
+        ],
+        "date": f"{2000 + seed % 25}-01-01",
+        "abstractNote": " ".join(KEYWORDS[seed % len(KEYWORDS) :] + KEYWORDS) * 5,
+    }
+
+
+class FakeCitoidHandler(JSONHandler):
+    def do_GET(self):
+        time.sleep(self.latency)
+        target_url = unquote(self.path.split("/")[-1])
+        self.send_json([citoid_record(target_url)])
+
+
+def _handler_class(base, **attrs):
+    # subclass of `base` with its own settings
+    return type(base.__name__, (base,), attrs)
+
+
+@contextmanager
+def serve(handler_class) -> Iterator[str]:
+    """
+    Run a local HTTP server with `handler_class` in a daemon thread, and
+    yield its base URL.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def fake_chat_server(
+    latency: float = 0.0, jitter: float = 0.0, reasoning: str = ""
+) -> Iterator[str]:
+    """
+    Run a fake chat completions server, yielding its API base URL (to be used
+    as `openrouter_api_base`).
+    """
+    handler = _handler_class(
+        FakeChatHandler, latency=latency, jitter=jitter, reasoning=reasoning
+    )
+    with serve(handler) as url:
+        yield url
+
+
+@contextmanager
+def fake_citoid_server(latency: float = 0.0) -> Iterator[str]:
+    """
+    Run a fake Citoid server, yielding its base URL (to be used as
+    `CitoidClientConfig.base_url`).
+    """
+    handler = _handler_class(FakeCitoidHandler, latency=latency)
+    with serve(handler) as url:
+        yield url + "/citation/"
@@ -0,0 +1,109 @@
+"""
+Summaries of benchmark measurements, and JSON reports comparable between
+commits.
+"""
+
+from typing import Dict, List, Optional
+import json
+import math
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+PERCENTILES = [50, 95, 99]
+
+
+def percentile(values: List[float], p: float) -> float:
+    # nearest-rank percentile
+    values = sorted(values)
+    rank = math.ceil(p / 100 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    summary = {f"p{p}": round(percentile(values, p), 3) for p in PERCENTILES}
+    summary["mean"] = round(sum(values) / len(values), 3)
+    summary["max"] = round(max(values), 3)
+    return summary
+
+
+def summarize_stages(timings: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """
+    Latency summary of each stage, from the `timings_ms` of traced requests.
+    """
+    stages: Dict[str, List[float]] = {}
+    for request_timings in timings:
+        for stage, duration in request_timings.items():
+            stages.setdefault(stage, []).append(duration)
+    return {stage: summarize(durations) for stage, durations in stages.items()}
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of the process so far, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(peak * scale / 2**20, 1)
+
+
+def git_commit(cwd: str) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def create_report(commit: Optional[str], params: Dict, phases: Dict) -> Dict:
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "phases": phases,
+    }
+
+
+def compare_reports(baseline: Dict, report: Dict) -> List[str]:
+    """
+    Lines with the relative change of the throughput and latency percentiles
+    of each phase of `report` compared to `baseline`.
+    """
+    lines = [f"compared to {baseline.get('commit')} ({baseline.get('timestamp')}):"]
+    for name, phase in report["phases"].items():
+        base = baseline["phases"].get(name)
+        if base is None:
+            continue
+        changes = []
+        if base.get("throughput_per_s") and phase.get("throughput_per_s"):
+            change = phase["throughput_per_s"] / base["throughput_per_s"] - 1
+            changes.append(f"throughput {100 * change:+.1f}%")
+        for p in PERCENTILES:
+            key = f"p{p}"
+            old = base.get("latency_ms", {}).get(key)
+            new = phase.get("latency_ms", {}).get(key)
+            if old and new:
+                changes.append(f"{key} {100 * (new / old - 1):+.1f}%")
+        if "peak_rss_mb" in base:
+            changes.append(
+                f"peak rss {phase['peak_rss_mb'] - base['peak_rss_mb']:+.1f}MB"
+            )
+        lines.append(f"  {name}: " + ", ".join(changes))
+    return lines
+
+
+def save_report(report: Dict, path: str):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
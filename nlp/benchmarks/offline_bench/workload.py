@@ -0,0 +1,111 @@
+"""
+Deterministic parse requests built from the sample post in
+`parser_result_sample.pkl` and reference URLs used by the test suite.
+"""
+
+from pathlib import Path
+from typing import Dict, List
+import pickle
+import random
+
+from url_normalize import url_normalize
+
+from desci_sense.shared_functions.interface import ParsePostRequest
+from desci_sense.shared_functions.utils import extract_urls
+from desci_sense.shared_functions.web_extractors.url_resolver import url_resolver
+
+REF_URLS = [
+    "https://arxiv.org/abs/2402.04607",
+    "https://journals.sagepub.com/doi/10.1177/20451253231198466",
+    "https://royalsocietypublishing.org/doi/10.1098/rstb.2022.0267",
+    "https://aclanthology.org/2024.lrec-main.464.pdf",
+    "https://www.biorxiv.org/content/10.1101/2024.06.05.597547v1",
+]
+
+POST_TEMPLATES = [
+    "{content}",
+    "New preprint on replication in psychiatry research {url}",
+    "Great thread on open peer review, worth reading {url}",
+    "We release our dataset and code today {url} feedback welcome!",
+    "Disagree with the framing here, the evidence in {url} points elsewhere",
+    "Listening to this podcast about climate models",
+]
+
+
+class _SampleUnpickler(pickle.Unpickler):
+    # the sample was pickled when `shared_functions` was a top level package
+    def find_class(self, module: str, name: str):
+        if module.startswith("shared_functions"):
+            module = "desci_sense." + module
+        return super().find_class(module, name)
+
+
+def load_parser_result_sample(path: Path) -> Dict:
+    with open(path, "rb") as f:
+        return _SampleUnpickler(f).load()
+
+
+def create_raw_requests(sample: Dict, num_requests: int, seed: int = 0) -> List[Dict]:
+    """
+    Return `num_requests` parse requests (as dicts) of threads of 1-3 posts.
+    Each post refers to 0-2 URLs: the sample post's reference, URLs shared by
+    many requests, and URLs unique to a request (so metadata caching only
+    helps for some of them).
+    """
+    rng = random.Random(seed)
+    sample_post = sample["post"]
+    requests = []
+    for i in range(num_requests):
+        author = f"author{i % 20}"
+        posts = []
+        for j in range(rng.randint(1, 3)):
+            url = rng.choice(REF_URLS + sample_post.ref_urls)
+            if rng.random() < 0.5:
+                url = f"https://example.org/papers/{i}-{j}"
+            content = rng.choice(POST_TEMPLATES).format(
+                content=sample_post.content, url=url
+            )
+            if rng.random() < 0.3:
+                content += f" see also {rng.choice(REF_URLS)}"
+            posts.append(
+                {
+                    "content": content,
+                    "url": f"https://x.com/{author}/status/{1000 * i + j}",
+                    "quotedThread": None,
+                }
+            )
+        requests.append(
+            {
+                "post": {
+                    "author": {
+                        "id": str(i % 20),
+                        "name": author,
+                        "username": author,
+                        "platformId": "twitter",
+                    },
+                    "url": posts[0]["url"],
+                    "thread": posts,
+                }
+            }
+        )
+    return requests
+
+
+def prime_url_resolver(raw_requests: List[Dict]):
+    """
+    Mark all URLs of `raw_requests` as resolving to themselves, so no requests
+    are made to resolve them.
+    """
+    for request in raw_requests:
+        for post in request["post"]["thread"]:
+            for url in extract_urls(post["content"]):
+                url_resolver.add_to_cache(url, url)
+                url_resolver.add_to_cache(url_normalize(url), url_normalize(url))
+
+
+def create_parse_requests(
+    sample: Dict, num_requests: int, seed: int = 0
+) -> List[ParsePostRequest]:
+    raw_requests = create_raw_requests(sample, num_requests, seed)
+    prime_url_resolver(raw_requests)
+    return [ParsePostRequest.model_validate(r) for r in raw_requests]
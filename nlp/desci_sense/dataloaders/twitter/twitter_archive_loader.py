@@ -1,9 +1,12 @@
 import zipfile
-import os
+import io
+import json
+import fnmatch
+import posixpath
 import pytz
 import pandas as pd
 from datetime import datetime
-from typing import List
+from typing import IO, Dict, Iterator, List, Optional
 
 
 from ...shared_functions.schema.post import RefPost
@@ -11,9 +14,131 @@ from ...dataloaders.twitter.twitter_archive_parser import (
     parse_tweets,
     PathConfig,
     extract_username,
-    read_json_from_js_file,
 )
-from ...dataloaders.twitter.twitter_utils import convert_archive_tweet_to_ref_post
+from ...dataloaders.twitter.twitter_utils import (
+    convert_archive_tweet_to_ref_post,
+    convert_twitter_time_to_datetime,
+)
+
+# names of the files holding tweets in the archive's `data` folder
+TWEETS_FILE_TEMPLATES = ["tweet.js", "tweets.js", "tweets-part*.js"]
+
+CHUNK_SIZE = 1 << 20
+
+
+def iter_js_records(f: IO[str], chunk_size: int = CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Yield the items of the array in a Twitter-produced .js file
+    (`window.YTD.tweets.part0 = [{...}, ...]`) one at a time, reading `f`
+    in chunks of `chunk_size` chars, so the whole file is never in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        # read the next chunk, dropping what was already parsed
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    # skip the variable assignment before the array
+    while True:
+        start = buffer.find("[", pos)
+        if start != -1:
+            pos = start + 1
+            break
+        pos = len(buffer)
+        if not fill():
+            return
+
+    while True:
+        # skip separators between items
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos == len(buffer):
+            if not fill():
+                raise ValueError("Unterminated array in .js file")
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # item continues in the next chunk
+            if not eof and fill():
+                continue
+            raise
+        if end == len(buffer) and not eof:
+            # a number or literal may continue in the next chunk
+            if fill():
+                continue
+        yield item
+        pos = end
+
+
+def parse_cutoff_date(cutoff_date: Optional[str]) -> Optional[datetime]:
+    if cutoff_date is None:
+        return None
+    return datetime.strptime(cutoff_date, "%Y-%m-%d").replace(tzinfo=pytz.UTC)
+
+
+def created_before(created_at: str, cutoff_datetime: datetime) -> bool:
+    """
+    True if Twitter time `created_at` is before `cutoff_datetime` (or invalid).
+    """
+    # the year ends the string ("Mon Jan 01 10:00:00 +0000 2024"), which is
+    # enough to compare times a year apart without parsing them
+    year = created_at[-4:]
+    if year.isdigit() and abs(int(year) - cutoff_datetime.year) > 1:
+        return int(year) < cutoff_datetime.year
+    created_datetime = convert_twitter_time_to_datetime(created_at)
+    return created_datetime is None or created_datetime < cutoff_datetime
+
+
+def iter_ref_posts_from_tweets(
+    tweets: Iterator[Dict], username: str, cutoff_datetime: datetime = None
+) -> Iterator[RefPost]:
+    """
+    Convert archive `tweets` to RefPosts, skipping tweets created before
+    `cutoff_datetime` without converting them.
+    """
+    for tweet in tweets:
+        if cutoff_datetime is not None and created_before(
+            tweet["tweet"]["created_at"], cutoff_datetime
+        ):
+            continue
+        yield convert_archive_tweet_to_ref_post(tweet, username)
+
+
+def batched(posts: Iterator[RefPost], batch_size: int) -> Iterator[List[RefPost]]:
+    batch = []
+    for post in posts:
+        batch.append(post)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def find_archive_members(names: List[str], template: str) -> List[str]:
+    """
+    Names of the zip archive members matching `template` in a `data` folder
+    (at the root of the archive or in a top level folder).
+    """
+    return sorted(
+        name
+        for name in names
+        if posixpath.basename(posixpath.dirname(name)) == "data"
+        and fnmatch.fnmatch(posixpath.basename(name), template)
+    )
 
 
 def create_dataframe_from_refposts(ref_posts: List[RefPost]):
@@ -44,32 +169,70 @@ class TwitterArchiveLoader:
         """
         Loads tweets found at path specified by `archive_dir` and converts them to a list of RefPosts.
         """
+        return list(self.iter_ref_posts_from_archive_dir(archive_dir, cutoff_date))
+
+    def iter_ref_posts_from_archive_dir(
+        self, archive_dir: str, cutoff_date: str = None
+    ) -> Iterator[RefPost]:
+        """
+        Generator version of `load_ref_posts_from_archive_dir`: tweet files are
+        parsed incrementally and tweets older than `cutoff_date` are skipped
+        before conversion.
+        """
         paths = PathConfig(dir_archive=archive_dir)
         username = extract_username(paths)
+        cutoff_datetime = parse_cutoff_date(cutoff_date)
 
-        tweets = []
         for tweets_js_filename in paths.files_input_tweets:
-            json = read_json_from_js_file(tweets_js_filename)
-            tweets += json
-
-        ref_posts = []
-        for tweet in tweets:
-            ref_post = convert_archive_tweet_to_ref_post(tweet, username)
-            ref_posts.append(ref_post)
-
-        # Filter by cutoff_date if provided
-        if cutoff_date is not None:
-            cutoff_datetime = datetime.strptime(cutoff_date, "%Y-%m-%d").replace(
-                tzinfo=pytz.UTC
-            )
-            ref_posts = [
-                post for post in ref_posts if post.created_at >= cutoff_datetime
-            ]
+            with open(tweets_js_filename, "r", encoding="utf8") as f:
+                yield from iter_ref_posts_from_tweets(
+                    iter_js_records(f), username, cutoff_datetime
+                )
+
+    def iter_archive(
+        self, path_to_zip: str, cutoff_date: str = None
+    ) -> Iterator[RefPost]:
+        """
+        Yield the tweets of zip archive `path_to_zip` as RefPosts. Tweet files are
+        read directly from the archive (nothing is extracted) and parsed
+        incrementally, and tweets older than `cutoff_date` are skipped before
+        conversion, so memory use doesn't grow with the archive size.
 
-        return ref_posts
+        Args:
+            path_to_zip (str): zip archive of tweets to be converted.
+            cutoff_date (str, optional): yields only posts with creation date equal to or greater than `cutoff_date` (YYYY-MM-DD). Defaults to None.
+        """
+        cutoff_datetime = parse_cutoff_date(cutoff_date)
+        with zipfile.ZipFile(path_to_zip, "r") as zip_ref:
+            names = zip_ref.namelist()
+            account_files = find_archive_members(names, "account.js")
+            if not account_files:
+                raise ValueError(f"No data/account.js in archive {path_to_zip}")
+            with zip_ref.open(account_files[0]) as f:
+                account = next(iter_js_records(io.TextIOWrapper(f, encoding="utf8")))
+            username = account["account"]["username"]
+
+            for template in TWEETS_FILE_TEMPLATES:
+                for name in find_archive_members(names, template):
+                    with zip_ref.open(name) as f:
+                        yield from iter_ref_posts_from_tweets(
+                            iter_js_records(io.TextIOWrapper(f, encoding="utf8")),
+                            username,
+                            cutoff_datetime,
+                        )
+
+    def iter_archive_batches(
+        self, path_to_zip: str, batch_size: int = 50, cutoff_date: str = None
+    ) -> Iterator[List[RefPost]]:
+        """
+        Like `iter_archive`, but yields lists of at most `batch_size` RefPosts,
+        eg to be passed to `MultiChainParser.batch_process_ref_posts`.
+        """
+        return batched(self.iter_archive(path_to_zip, cutoff_date), batch_size)
 
     def load_archive(self, path_to_zip: str, cutoff_date: str = None) -> List[RefPost]:
-        """Extracts zip archive of tweets `path_to_zip` and converts them into RefPosts.
+        """Converts the tweets of zip archive `path_to_zip` into RefPosts, without extracting it
+        (see `iter_archive`).
         If optional `cutoff_date` is provided, returns only posts with creation date equal to or greater than `cutoff_date`.
 
         Args:
@@ -79,12 +242,4 @@ class TwitterArchiveLoader:
         Returns:
             List[RefPost]: list of tweets converted to RefPosts
         """
-        # Extract the zip archive
-        with zipfile.ZipFile(path_to_zip, "r") as zip_ref:
-            extract_path = os.path.splitext(path_to_zip)[0]
-            zip_ref.extractall(extract_path)
-
-        # Load tweets from the extracted directory
-        ref_posts = self.load_ref_posts_from_archive_dir(extract_path, cutoff_date)
-
-        return ref_posts
+        return list(self.iter_archive(path_to_zip, cutoff_date))
@@ -4,7 +4,7 @@
 """Script to run evaluation of label prediction models.
 
 Usage:
-  filter_evaluation.py [--config=<config>] [--dataset=<dataset>] [--dataset_file=<file>] [--handle_file=<file>]
+  filter_evaluation.py [--config=<config>] [--dataset=<dataset>] [--dataset_file=<file>] [--handle_file=<file>] [--checkpoint=<path>]
 
 
 Options:
@@ -12,6 +12,7 @@ Options:
 --dataset=<dataset> Optional path to a wandb artifact.
 --dataset_file=<file> Optional dataset file name e.g. labeled_dataset.table.json indeed it should be a table.json format
 --handle_file=<file> Optional file name e.g. labeled_dataset.table.json indeed it should be a table.json format
+--checkpoint=<path> Optional JSONL file where parser results are saved as they complete, rerunning with the same file skips posts already parsed
 
 """
 from datetime import datetime
@@ -33,6 +34,7 @@ sys.path.append(str(Path(__file__).parents[2]))
 
 from desci_sense.evaluation.utils import get_dataset, create_custom_confusion_matrix, posts_to_refPosts, obj_str_to_dict
 from desci_sense.shared_functions.parsers.multi_chain_parser import MultiChainParser
+from desci_sense.shared_functions.parsers.checkpoint import CheckpointedBatchRunner
 from desci_sense.shared_functions.init import init_multi_chain_parser_config
 
 class CustomLabelBinarizer(LabelBinarizer):
@@ -82,12 +84,17 @@ def prepare_parser_input(df):
     
 
 #function for predicting labels
-def pred_labels(df,config):
+def pred_labels(df,config,checkpoint_path=None):
     model = MultiChainParser(config)
 
     inputs = prepare_parser_input(df)
 
-    results = model.batch_process_ref_posts(inputs=inputs,active_list=["keywords", "topics"],batch_size=10)
+    if checkpoint_path:
+        # results are saved as they complete, so an interrupted run can be resumed
+        runner = CheckpointedBatchRunner(model,checkpoint_path,active_list=["keywords", "topics"],batch_size=10)
+        results = runner.run(inputs)
+    else:
+        results = model.batch_process_ref_posts(inputs=inputs,active_list=["keywords", "topics"],batch_size=10)
     try:
         df['Predicted Label'] = [x.filter_classification.value for x in results]
         df['Reasoning Steps'] = ["Keywords: "+str(x.debug['topics']['reasoning'])+"Topics: "+str(x.debug['keywords']['reasoning']) for x in results]
@@ -212,6 +219,7 @@ if __name__ == "__main__":
     dataset_path = arguments.get("--dataset")
     dataset_file = arguments.get("--dataset_file")
     handle_file = arguments.get("--handle_file")
+    checkpoint_path = arguments.get("--checkpoint")
 
     # TODO - make modular config setting
     llm_type="mistralai/mistral-7b-"
@@ -289,7 +297,7 @@ if __name__ == "__main__":
     
     df_handles = get_dataset(table_path)
    
-    pred_labels(df=df,config=config)
+    pred_labels(df=df,config=config,checkpoint_path=checkpoint_path)
     
     # make sure df can be binarized
     normalize_df(df)
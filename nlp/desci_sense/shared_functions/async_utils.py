@@ -0,0 +1,319 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+
+def run_coroutine_sync(coro: Coroutine) -> Any:
+    """
+    Run `coro` to completion from synchronous code and return its result.
+    Uses `asyncio.run` if no event loop is running in the current thread,
+    otherwise runs the coroutine in a new loop on a worker thread (calling
+    `asyncio.run` from inside a running loop raises an error).
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+class BackgroundEventLoop:
+    """
+    Event loop running forever in a daemon thread. Lets long-lived async resources
+    (eg aiohttp sessions, which are bound to the loop they were created in) be
+    shared by sync callers and by async callers running in other loops.
+    """
+
+    def __init__(self, name: str = "background-event-loop") -> None:
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None or self._loop.is_closed():
+            with self._lock:
+                if self._loop is None or self._loop.is_closed():
+                    self._start()
+        return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run_loop():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run_loop, name=self.name, daemon=True)
+        self._thread.start()
+        ready.wait()
+        self._loop = loop
+
+    def is_current(self) -> bool:
+        """
+        True if called from code running in this loop.
+        """
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coro: Coroutine) -> Future:
+        """
+        Schedule `coro` on the background loop and return a concurrent future.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: float = None) -> Any:
+        """
+        Run `coro` on the background loop and block until it is done.
+        Must not be called from the background loop itself.
+        """
+        if self.is_current():
+            raise RuntimeError("Cannot block on the background loop from inside it")
+        return self.submit(coro).result(timeout)
+
+    async def arun(self, coro: Coroutine) -> Any:
+        """
+        Await `coro` on the background loop from any other event loop.
+        """
+        if self.is_current():
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def stop(self):
+        with self._lock:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+            self._loop = None
+            self._thread = None
+
+
+_background_loop = BackgroundEventLoop()
+
+
+def get_background_loop() -> BackgroundEventLoop:
+    """
+    Return the background event loop shared by the whole process.
+    """
+    return _background_loop
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.future = Future()
+        self.shared = False
+        # callers waiting for the result
+        self.num_callers = 1
+        # async calls run in a task of the event loop of the first caller
+        self.task: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: while a call for a key is in
+    flight, other calls for that key wait for it and get its result (or its
+    exception) instead of repeating the work. Nothing is cached once the call
+    is done, so the next call for the key runs again.
+    Calls can come from several threads (`do`) or event loops (`ado`). Sync
+    and async calls for the same key should not be mixed, since a sync call
+    waiting in an event loop thread would block the loop running the call.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable) -> Tuple[_Call, bool]:
+        # return the call in flight for `key`, or a new call and True if the
+        # caller should run it
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.shared = True
+                call.num_callers += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def _done(self, key: Hashable, call: _Call, result: Any, exception=None):
+        with self._lock:
+            # the call may have been abandoned by all its callers
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        if exception is not None:
+            call.future.set_exception(exception)
+        else:
+            call.future.set_result(result)
+
+    def in_flight(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Return `(fn(), shared)`, where `fn` is only called if no call for `key`
+        is in flight. `shared` is True if the result was returned to several
+        callers (it is the same object for all of them).
+        """
+        call, is_leader = self._join(key)
+        if not is_leader:
+            return call.future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self._done(key, call, None, e)
+            raise
+        self._done(key, call, result)
+        return result, call.shared
+
+    async def ado(
+        self, key: Hashable, coro_fn: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """
+        Async version of `do`: `coro_fn` returns the awaitable to run. It runs
+        in a task of its own, so a caller being cancelled (eg because its
+        client disconnected) doesn't cancel the call for the other callers.
+        The call is only cancelled once all its callers are.
+        """
+        call, is_leader = self._join(key)
+        if is_leader:
+            call.loop = asyncio.get_running_loop()
+            call.task = asyncio.ensure_future(self._arun(key, call, coro_fn))
+        try:
+            result = await asyncio.shield(asyncio.wrap_future(call.future))
+        except asyncio.CancelledError:
+            self._leave(key, call)
+            raise
+        return result, call.shared if is_leader else True
+
+    async def _arun(
+        self, key: Hashable, call: _Call, coro_fn: Callable[[], Awaitable[Any]]
+    ):
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            # raised to the callers through the call's future
+            self._done(key, call, None, e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        self._done(key, call, result)
+
+    def _leave(self, key: Hashable, call: _Call):
+        # a cancelled caller stops waiting, the last one cancels the call
+        with self._lock:
+            call.num_callers -= 1
+            if call.num_callers > 0 or call.future.done():
+                return
+            # new callers for the key start a new call
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.loop.call_soon_threadsafe(call.task.cancel)
+
+
+class _StageError:
+    """
+    Wraps an exception raised by a pipeline stage, so the item is passed
+    through the remaining stages untouched.
+    """
+
+    def __init__(self, exception: BaseException) -> None:
+        self.exception = exception
+
+
+async def apipeline(
+    items: Iterable,
+    stages: List[Tuple[Callable[[Any], Awaitable[Any]], int]],
+    queue_size: int = 10,
+    return_exceptions: bool = False,
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Pass each of `items` through `stages`, yielding `(index, result)` pairs as
+    soon as an item goes through the last stage (so not necessarily in order).
+    Each stage is an `(async_fn, concurrency)` pair: `concurrency` workers apply
+    `async_fn` to the outputs of the previous stage. Stages are connected by
+    queues of at most `queue_size` items, so a slow stage applies backpressure
+    to the stages before it instead of buffering everything.
+    If `return_exceptions`, exceptions raised for an item are yielded as its
+    result, otherwise the first exception is raised.
+    """
+    assert len(stages) > 0, "Must specify at least one stage"
+    done = object()
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    num_active = [concurrency for _, concurrency in stages]
+
+    async def feed():
+        for i, item in enumerate(items):
+            await queues[0].put((i, item))
+        for _ in range(stages[0][1]):
+            await queues[0].put(done)
+
+    async def work(stage_idx: int):
+        stage_fn, _ = stages[stage_idx]
+        in_queue, out_queue = queues[stage_idx], queues[stage_idx + 1]
+        while True:
+            entry = await in_queue.get()
+            if entry is done:
+                break
+            i, value = entry
+            if not isinstance(value, _StageError):
+                try:
+                    value = await stage_fn(value)
+                except Exception as e:
+                    value = _StageError(e)
+            await out_queue.put((i, value))
+
+        # last worker of the stage to finish signals the next stage
+        num_active[stage_idx] -= 1
+        if num_active[stage_idx] == 0:
+            if stage_idx + 1 < len(stages):
+                for _ in range(stages[stage_idx + 1][1]):
+                    await out_queue.put(done)
+            else:
+                await out_queue.put(done)
+
+    tasks = [asyncio.ensure_future(feed())]
+    for stage_idx, (_, concurrency) in enumerate(stages):
+        assert concurrency > 0, "Stage concurrency must be positive"
+        tasks += [asyncio.ensure_future(work(stage_idx)) for _ in range(concurrency)]
+
+    try:
+        while True:
+            entry = await queues[-1].get()
+            if entry is done:
+                break
+            i, value = entry
+            if isinstance(value, _StageError):
+                if not return_exceptions:
+                    raise value.exception
+                value = value.exception
+            yield i, value
+        await asyncio.gather(*tasks)
+    finally:
+        # stop remaining work if the consumer stopped early or an error was raised
+        for task in tasks:
+            task.cancel()
+        # wait for cancelled stage calls to unwind before returning
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,5 +1,5 @@
 import os
-from typing import Union, List
+from typing import Optional, Union, List
 from enum import Enum
 from pydantic import (
     BaseModel,
@@ -7,7 +7,7 @@ from pydantic import (
     field_validator,
 )
 
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class PostProcessType(str, Enum):
@@ -105,6 +105,68 @@ class MetadataExtractionType(str, Enum):
     CITOID = "citoid"
 
 
+class MetadataCacheConfig(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="CITOID_CACHE_")
+
+    enabled: bool = Field(
+        default=True,
+        description="Whether to cache fetched reference metadata across requests.",
+    )
+    max_memory_entries: int = Field(
+        default=10000,
+        description="Maximum number of entries kept in the in-memory LRU tier.",
+    )
+    disk_path: Union[str, None] = Field(
+        default=None,
+        description="Path of SQLite file used for the on-disk tier. If None, no disk tier is used.",
+    )
+    max_disk_entries: int = Field(
+        default=200000,
+        description="Maximum number of entries kept in the on-disk tier.",
+    )
+    positive_ttl: int = Field(
+        default=7 * 24 * 60 * 60,
+        description="Seconds to keep successfully fetched metadata.",
+    )
+    placeholder_ttl: int = Field(
+        default=24 * 60 * 60,
+        description="Seconds to keep placeholder metadata (eg `forumPost` for social media posts).",
+    )
+    error_ttl: int = Field(
+        default=10 * 60,
+        description="Seconds to keep failed metadata lookups before retrying them.",
+    )
+
+
+class CitoidClientConfig(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="CITOID_")
+
+    base_url: str = Field(
+        default="https://en.wikipedia.org/api/rest_v1/data/citation/zotero/",
+        description="Base URL of the Citoid API. Target urls are appended url-encoded.",
+    )
+    max_concurrency: int = Field(
+        default=10,
+        description="Maximum number of concurrent Citoid requests.",
+    )
+    max_connections: int = Field(
+        default=20,
+        description="Maximum number of pooled connections.",
+    )
+    keepalive_timeout: float = Field(
+        default=30,
+        description="Seconds to keep idle connections open for reuse.",
+    )
+    dns_cache_ttl: int = Field(
+        default=300,
+        description="Seconds to cache DNS lookups.",
+    )
+    request_timeout: float = Field(
+        default=30,
+        description="Timeout in seconds of a single Citoid request.",
+    )
+
+
 class MetadataExtractionConfig(BaseSettings):
     extraction_method: MetadataExtractionType = Field(
         default=MetadataExtractionType.CITOID,
@@ -115,6 +177,10 @@ class MetadataExtractionConfig(BaseSettings):
         description="Maximum length of summary to extract -  \
                                           anything beyond will be truncated. Set to -1 to take full length.",
     )
+    cache_config: MetadataCacheConfig = Field(
+        default_factory=MetadataCacheConfig,
+        description="Config for caching of fetched metadata.",
+    )
 
 
 class LLMConfig(BaseSettings, BaseModel):
@@ -126,6 +192,129 @@ class LLMConfig(BaseSettings, BaseModel):
         default="0.6",
         description="Temperature paramater to use when sampling model outputs.",
     )
+    use_cache: bool = Field(
+        default=False,
+        description="Whether to cache model responses (see `LLMCacheConfig`).",
+    )
+    fallback_llm_type: Optional[str] = Field(
+        default=None,
+        description="Model called instead of `llm_type` while its circuit breaker is open, \
+            if rate limits are enabled (see `LLMRateLimitConfig`).",
+    )
+
+
+class LLMCacheConfig(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="LLM_CACHE_")
+
+    disk_path: str = Field(
+        default=".llm_cache.sqlite",
+        description="Path of SQLite file storing cached model responses.",
+    )
+    max_entries: int = Field(
+        default=50000,
+        description="Maximum number of cached responses. Least recently used responses are evicted.",
+    )
+
+
+class LLMRateLimitConfig(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="LLM_RATE_LIMIT_")
+
+    enabled: bool = Field(
+        default=False,
+        description="Rate limit calls to each model and stop calling models that keep failing. \
+            Opt in, with limits matching the provider account.",
+    )
+    requests_per_minute: float = Field(
+        default=300,
+        description="Maximum request rate to each model, shared by all chains using the model.",
+    )
+    tokens_per_minute: Optional[int] = Field(
+        default=None,
+        description="Maximum token rate (prompt and completion) to each model. Not limited if not set.",
+    )
+    burst_seconds: float = Field(
+        default=2.0,
+        description="Number of seconds worth of requests (and tokens) that can be sent at once.",
+    )
+    backoff_factor: float = Field(
+        default=0.5,
+        description="Factor applied to the rates of a model when it returns a rate limit error.",
+    )
+    min_rate_fraction: float = Field(
+        default=0.05,
+        description="Lower bound of the rates of a model, as a fraction of the configured rates.",
+    )
+    recovery_step: float = Field(
+        default=0.02,
+        description="Fraction of the configured rates recovered after each successful request.",
+    )
+    default_retry_after: float = Field(
+        default=1.0,
+        description="Seconds to pause calls to a model after a rate limit error without a Retry-After header.",
+    )
+    max_retries: int = Field(
+        default=2,
+        description="Number of retries of requests failing with rate limit or transient errors.",
+    )
+    retry_backoff: float = Field(
+        default=0.5,
+        description="Seconds before the first retry of a transient error, doubled on each retry.",
+    )
+    failure_threshold: int = Field(
+        default=5,
+        description="Number of consecutive failures after which calls to a model fail fast.",
+    )
+    reset_timeout: float = Field(
+        default=30.0,
+        description="Seconds to wait before trying a model again after failing fast.",
+    )
+
+
+class HedgeConfig(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="HEDGE_")
+
+    enabled: bool = Field(
+        default=False,
+        description="Send a duplicate (hedge) request when a model call takes longer than usual, \
+            and use whichever response arrives first.",
+    )
+    latency_percentile: float = Field(
+        default=95,
+        description="Percentile of recent call latencies after which a hedge is sent.",
+    )
+    initial_delay: float = Field(
+        default=10.0,
+        description="Seconds after which a hedge is sent until `min_samples` latencies are recorded.",
+    )
+    min_delay: float = Field(
+        default=0.5,
+        description="Minimum seconds before sending a hedge.",
+    )
+    min_samples: int = Field(
+        default=20,
+        description="Number of recorded latencies needed to use `latency_percentile`.",
+    )
+    window_size: int = Field(
+        default=200,
+        description="Number of recent latencies the percentile is computed from.",
+    )
+    max_hedge_fraction: float = Field(
+        default=0.1,
+        description="Maximum fraction of calls that are hedged, capping the extra spend.",
+    )
+    max_hedge_burst: float = Field(
+        default=5,
+        description="Maximum number of hedges that can be sent in a row if the budget allows.",
+    )
+    secondary_llm_type: Optional[str] = Field(
+        default=None,
+        description="Model hedges are sent to. Same model as the chain if not set.",
+    )
+    max_workers: int = Field(
+        default=16,
+        description="Number of threads running the sync calls of the chain's model and their hedges. \
+            Should allow for twice the number of concurrent calls, calls wait for a thread otherwise.",
+    )
 
 
 class PostParserChainConfig(BaseSettings):
@@ -140,6 +329,27 @@ class PostParserChainConfig(BaseSettings):
         description="Whether to use reference metadata in the prompt as context",
     )
     post_renderer: PostRendererType = PostRendererType.REF_POST
+    prefix_stable_prompt: bool = Field(
+        default=False,
+        description="Send the static part of the prompt (instructions, tag types, output format) \
+            as a system message identical for all posts, followed by the post as a user message, \
+            so providers can cache the prompt prefix.",
+    )
+    prompt_cache_control: bool = Field(
+        default=False,
+        description="Mark the static prompt prefix with a cache-control hint, for providers \
+            with explicit prompt caching (eg Anthropic models). Requires `prefix_stable_prompt`.",
+    )
+    hedge_config: HedgeConfig = Field(
+        default_factory=HedgeConfig,
+        description="Hedging of slow model calls of this chain.",
+    )
+    max_prompt_tokens: Optional[int] = Field(
+        default=None,
+        description="Token budget of this chain's prompt. The post and reference metadata \
+            fit the tokens left after the static prompt prefix (instructions, tag types, \
+            output format). If not set, `TokenBudgetConfig.max_input_tokens` applies.",
+    )
 
 
 class KeywordPParserChainConfig(PostParserChainConfig):
@@ -178,6 +388,77 @@ class TopicsPParserChainConfig(PostParserChainConfig):
     is_topic: bool = True  # dummy var, just used for pydnatic type resolution
 
 
+class PipelineConfig(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="PIPELINE_")
+
+    metadata_concurrency: int = Field(
+        default=5,
+        description="Number of posts whose reference metadata is fetched concurrently.",
+    )
+    prompt_concurrency: int = Field(
+        default=1,
+        description="Number of workers instantiating prompts.",
+    )
+    llm_concurrency: int = Field(
+        default=5,
+        description="Number of posts processed by the LLM chains concurrently.",
+    )
+    postprocess_concurrency: int = Field(
+        default=1,
+        description="Number of workers post processing chain results.",
+    )
+    queue_size: int = Field(
+        default=10,
+        description="Maximum number of posts waiting between two stages.",
+    )
+
+
+class TokenBudgetConfig(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="TOKEN_BUDGET_")
+
+    max_input_tokens: Optional[int] = Field(
+        default=None,
+        description="Token budget of the post (including quoted posts) and reference metadata \
+            rendered in the prompt of each chain that doesn't set `max_prompt_tokens`. \
+            If not set, only the character limits apply.",
+    )
+    metadata_fraction: float = Field(
+        default=0.3,
+        description="Fraction of the input token budget reserved for reference metadata. \
+            Budget not used by the post content is also given to the metadata.",
+    )
+    encoding_name: str = Field(
+        default="cl100k_base",
+        description="Name of the tiktoken encoding used to count tokens.",
+    )
+
+
+class TracingConfig(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="TRACING_")
+
+    enabled: bool = Field(
+        default=False,
+        description="Time the stages of each parse request. Timings are added to the \
+            `ParserResult.metadata` and sent to the configured exporters.",
+    )
+    log: bool = Field(
+        default=True,
+        description="Log a line with the timings of each request.",
+    )
+    jsonl_path: Optional[str] = Field(
+        default=None,
+        description="Append the spans of each request as a JSON line to this file.",
+    )
+    otlp_endpoint: Optional[str] = Field(
+        default=None,
+        description="Send spans to this OTLP/HTTP traces endpoint (eg http://localhost:4318/v1/traces).",
+    )
+    service_name: str = Field(
+        default="sensemakers-nlp",
+        description="Service name of exported OTLP spans.",
+    )
+
+
 class MultiParserChainConfig(BaseSettings):
     openrouter_api_config: OpenrouterAPIConfig = Field(
         default_factory=OpenrouterAPIConfig, description="Settings for Openrouter API."
@@ -203,6 +484,30 @@ class MultiParserChainConfig(BaseSettings):
         default=5,
         description="Default batch size for batched requests. Only used for batched requests.",
     )
+    llm_cache_config: LLMCacheConfig = Field(
+        default_factory=LLMCacheConfig,
+        description="Response cache settings for parser chains with `llm_config.use_cache` set.",
+    )
+    pipeline_config: PipelineConfig = Field(
+        default_factory=PipelineConfig,
+        description="Concurrency settings for pipelined (streaming) batch processing.",
+    )
+    token_budget_config: TokenBudgetConfig = Field(
+        default_factory=TokenBudgetConfig,
+        description="Token budget of the post and metadata in chain prompts.",
+    )
+    llm_rate_limit_config: LLMRateLimitConfig = Field(
+        default_factory=LLMRateLimitConfig,
+        description="Rate limits and circuit breakers of the models called by the parser chains.",
+    )
+    tracing_config: TracingConfig = Field(
+        default_factory=TracingConfig,
+        description="Tracing of the stages of parse requests.",
+    )
+    coalesce_requests: bool = Field(
+        default=True,
+        description="Concurrent identical parse requests share a single computation.",
+    )
     post_process_type: PostProcessType = Field(
         description="Type of post-processing to apply to parser chain results",
         default=PostProcessType.NONE,
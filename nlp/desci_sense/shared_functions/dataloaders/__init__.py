@@ -1,7 +1,7 @@
 from loguru import logger
 
 from ..schema.post import RefPost
-from ..utils import extract_and_expand_urls
+from ..utils import extract_and_expand_url_spans
 
 from ..utils import identify_social_media
 from .twitter.twitter_utils import scrape_tweet
@@ -34,10 +34,16 @@ def convert_text_to_ref_post(
     Converts raw text to a RefPost.
     """
 
-    urls = extract_and_expand_urls(text)
+    url_spans = extract_and_expand_url_spans(text)
+    urls = [url for _, _, url in url_spans]
 
     post = RefPost(
-        author=author, content=text, url="", source_network=source, ref_urls=urls
+        author=author,
+        content=text,
+        url="",
+        source_network=source,
+        ref_urls=urls,
+        ref_url_spans=url_spans,
     )
 
     return post
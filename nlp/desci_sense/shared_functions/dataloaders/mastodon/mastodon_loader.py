@@ -1,24 +1,166 @@
 # based on https://github.com/langchain-ai/langchain/blob/master/libs/langchain/langchain/document_loaders/mastodon.py
 
-from typing import Any, Dict, Iterable, List, Optional, Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from loguru import logger
 from mastodon import Mastodon
-from datetime import datetime, time, date
+from datetime import datetime, time, date, timedelta, timezone
+import queue
+import threading
 
 from ....configs import environ
 from .mastodon_utils import convert_post_json_to_ref_post
 from ....shared_functions.schema.post import RefPost
 
 
+# maximum number of statuses returned per request by the Mastodon API
+MAX_PAGE_SIZE = 40
+
+
+def get_toot_day(toot: Dict[str, Any]) -> datetime:
+    # start of the day the toot was created, for comparisons with start/end dates
+    return datetime.combine(toot["created_at"].date(), time.min)
+
+
 class MastodonLoader:
     def __init__(
-        self, base_url: str = "https://mastodon.social", access_token: str = None
+        self,
+        base_url: str = "https://mastodon.social",
+        access_token: str = None,
+        ratelimit_method: str = "wait",
     ) -> None:
+        """
+        `ratelimit_method` is how the rate limit reported by the instance in
+        response headers is honoured: "wait" retries rate limited requests
+        once the limit resets, "pace" also spreads requests evenly over the
+        limit period (see `Mastodon`).
+        """
         access_token = (
             access_token if access_token else environ["MASTODON_ACCESS_TOKEN"]
         )
 
-        self.api = Mastodon(api_base_url=base_url, access_token=access_token)
+        self.api = Mastodon(
+            api_base_url=base_url,
+            access_token=access_token,
+            ratelimit_method=ratelimit_method,
+        )
+
+    def iter_profile_timeline(
+        self,
+        mastodon_account: str,
+        exclude_replies: bool = True,
+        exclude_reposts: bool = True,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        min_id: str = None,
+        page_size: int = MAX_PAGE_SIZE,
+    ) -> Iterator[RefPost]:
+        """
+        Yield the posts of `mastodon_account` created between `start_date` and
+        `end_date` (inclusive, by day), newest first.
+        Statuses are requested page by page going back in time (using `max_id`),
+        starting from `end_date` and stopping as soon as a status is older than
+        `start_date`, or at status `min_id` (exclusive, eg the newest status
+        already loaded). Posts are converted as they are yielded, so only one
+        page is held in memory.
+        """
+        user = self.api.account_lookup(mastodon_account)
+
+        max_id = None
+        if end_date:
+            # statuses ids are derived from their creation time
+            max_id = datetime.combine(
+                end_date.date() + timedelta(days=1), time.min, tzinfo=timezone.utc
+            )
+
+        while True:
+            toots = self.api.account_statuses(
+                user["id"],
+                only_media=False,
+                pinned=False,
+                exclude_replies=exclude_replies,
+                exclude_reblogs=exclude_reposts,
+                max_id=max_id,
+                since_id=min_id,
+                limit=page_size,
+            )
+            if not toots:
+                return
+            for toot in toots:
+                day = get_toot_day(toot)
+                if start_date and day < start_date:
+                    return
+                if end_date and day > end_date:
+                    continue
+                # Mastodon api exclude wasn't working, so verify this here
+                if exclude_reposts and toot["reblog"] is not None:
+                    continue
+                if exclude_replies and toot["in_reply_to_id"] is not None:
+                    continue
+                try:
+                    ref_post = convert_post_json_to_ref_post(toot)
+                except Exception as e:
+                    logger.warning(e)
+                    continue
+                yield ref_post
+            max_id = toots[-1]["id"]
+
+    def iter_profiles(
+        self,
+        mastodon_accounts: Sequence[str],
+        max_workers: int = 4,
+        max_pending: int = 100,
+        **timeline_kwargs,
+    ) -> Iterator[RefPost]:
+        """
+        Yield the posts of all `mastodon_accounts` (see `iter_profile_timeline`
+        for `timeline_kwargs`), fetching the timelines of up to `max_workers`
+        accounts concurrently. Posts of different accounts are interleaved.
+        At most `max_pending` posts are buffered, so fetching pauses while the
+        caller is busy with the posts already yielded. Accounts that fail to
+        load are logged and skipped.
+        """
+        pending = queue.Queue(maxsize=max_pending)
+        stop = threading.Event()
+        done = object()
+
+        def put(item) -> bool:
+            # False if the caller stopped consuming posts
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def load(account: str):
+            try:
+                for post in self.iter_profile_timeline(account, **timeline_kwargs):
+                    if not put(post):
+                        return
+            except Exception as e:
+                logger.warning(f"Failed loading timeline of {account}: {e}")
+            finally:
+                put(done)
+
+        executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="mastodon-loader"
+        )
+        try:
+            for account in mastodon_accounts:
+                executor.submit(load, account)
+            num_done = 0
+            while num_done < len(mastodon_accounts):
+                item = pending.get()
+                if item is done:
+                    num_done += 1
+                else:
+                    yield item
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
 
     def load_profile_timeline(
         self,
@@ -42,54 +184,15 @@ class MastodonLoader:
         Returns:
             List[RefPost]: _description_
         """
-        results = []
-
-        # if not provided, take min/max start/end dates
-        if not start_date:
-            start_date = datetime(date.min, 1, 1)
-        if not end_date:
-            end_date = datetime(date.max, 12, 31)
-
-        # get user posts
-        user = self.api.account_lookup(mastodon_account)
-        toots = self.api.account_statuses(
-            user["id"],
-            only_media=False,
-            pinned=False,
+        posts = self.iter_profile_timeline(
+            mastodon_account,
             exclude_replies=exclude_replies,
-            exclude_reblogs=exclude_reposts,
-            # we filter below since api not working correctly.
-            # but there is a problem with the API if this isn't set to some value
-            # so setting arbitrarily high
-            limit=10000,
+            exclude_reposts=exclude_reposts,
+            start_date=start_date,
+            end_date=end_date,
+            page_size=min(max_toots or MAX_PAGE_SIZE, MAX_PAGE_SIZE),
         )
-
-        filtered_posts = []
-        # check posts
-        for toot in toots:
-            created_at_datetime = datetime.combine(
-                toot["created_at"].date(),
-                time.min,
-            )
-            if start_date <= created_at_datetime <= end_date:
-                filtered_posts.append(toot)
-        #results.extend(self._format_toots(filtered_posts, user))
-        
-        for toot in filtered_posts:
-            logger.debug(f"toot: {toot['url']}")
-            results.append(convert_post_json_to_ref_post(toot))
-            
-
-        # Mastodon api exclude wasn't working, so verify this here
-        if exclude_reposts:
-            results = [p for p in results if not p.is_repost]
-        if exclude_replies:
-            results = [p for p in results if not p.is_reply]
-
-        if max_toots:
-            return results[:max_toots]
-        else:
-            return results
+        return list(islice(posts, max_toots))
 
     def load_profiles(
         self,
@@ -109,26 +212,21 @@ class MastodonLoader:
             exclude_reposts (bool, optional): Whether to exclude reposts ("retoots") from the load.
                 Defaults to True.
         """
-        results: List[RefPost] = []
-        for account in mastodon_accounts:
-            user = self.api.account_lookup(account)
-            toots = self.api.account_statuses(
-                user["id"],
-                only_media=False,
-                pinned=False,
+
+        def load(account: str) -> List[RefPost]:
+            posts = self.iter_profile_timeline(
+                account,
                 exclude_replies=exclude_replies,
-                exclude_reblogs=exclude_reposts,
-                limit=number_toots,
+                exclude_reposts=exclude_reposts,
+                page_size=min(number_toots or MAX_PAGE_SIZE, MAX_PAGE_SIZE),
             )
-            docs = self._format_toots(toots, user)
-
-            # Mastodon api exclude wasn't working, so verify this here
-            if exclude_reposts:
-                docs = [p for p in docs if not p.is_repost]
-            if exclude_replies:
-                docs = [p for p in docs if not p.is_reply]
+            return list(islice(posts, number_toots))
 
-            results.extend(docs)
+        # accounts are loaded concurrently, results are in the order of the accounts
+        results: List[RefPost] = []
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for posts in executor.map(load, mastodon_accounts):
+                results.extend(posts)
 
         return results
 
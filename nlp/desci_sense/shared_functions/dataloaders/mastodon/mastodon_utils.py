@@ -6,7 +6,12 @@ from datetime import datetime
 from urllib.parse import urlparse
 
 from ...schema.post import RefPost, QuoteRefPost
-from ...utils import convert_html_to_plain_text, extract_and_expand_urls, normalize_url
+from ...utils import (
+    convert_html_to_plain_text,
+    extract_and_expand_urls,
+    extract_and_expand_url_spans,
+    normalize_url,
+)
 
 
 def convert_mastodon_time_to_datetime(date_str):
@@ -91,6 +96,11 @@ def convert_post_json_to_ref_post(post_json: dict) -> RefPost:
     # extract external reference urls from post
     ext_ref_urls = extract_external_masto_ref_urls(post_json)
 
+    # offsets of the reference urls in the content (urls are in the resolver cache)
+    ref_url_spans = [
+        span for span in extract_and_expand_url_spans(text) if span[2] in ext_ref_urls
+    ]
+
     post = QuoteRefPost(
         author=author,
         content=text,
@@ -99,6 +109,7 @@ def convert_post_json_to_ref_post(post_json: dict) -> RefPost:
         source_network="mastodon",
         metadata=post_json,
         ref_urls=ext_ref_urls,
+        ref_url_spans=ref_url_spans,
         is_reply=post_json["in_reply_to_id"] is not None,
         is_repost=post_json["reblog"] is not None,
     )
@@ -1,6 +1,6 @@
 # Twitter scraping based on https://github.com/JustAnotherArchivist/snscrape/issues/996#issuecomment-1777981568
 
-from typing import Optional, Union, List
+from typing import Optional, Union, List, Tuple
 import re
 import requests
 from datetime import datetime
@@ -9,6 +9,7 @@ from datetime import datetime
 from ...interface import AppPost, PlatformType
 from ...utils import (
     extract_and_expand_urls,
+    extract_url_spans,
     normalize_url,
     extract_twitter_status_id,
     remove_dups_ordered,
@@ -53,6 +54,10 @@ def convert_archive_tweet_to_ref_post(data: dict, user_name: str) -> RefPost:
 
     # extract external reference urls from post
     ext_ref_urls = [url_data["expanded_url"] for url_data in tweet["entities"]["urls"]]
+    orig_to_expanded_map = {
+        url_data["url"]: url_data["expanded_url"]
+        for url_data in tweet["entities"]["urls"]
+    }
 
     post = RefPost(
         author=author,
@@ -61,6 +66,7 @@ def convert_archive_tweet_to_ref_post(data: dict, user_name: str) -> RefPost:
         created_at=created_at,
         source_network="twitter",
         ref_urls=ext_ref_urls,
+        ref_url_spans=extract_ref_url_spans(text, ext_ref_urls, orig_to_expanded_map),
     )
     return post
 
@@ -94,6 +100,7 @@ def convert_vxtweet_to_ref_post(tweet: dict) -> RefPost:
         source_network="twitter",
         metadata=tweet,
         ref_urls=ext_ref_urls,
+        ref_url_spans=extract_ref_url_spans(content, ext_ref_urls, orig_to_normed_map),
         quoted_url=quoted_url,
     )
     return post
@@ -128,6 +135,7 @@ def convert_basic_twitter_post_to_ref_post(basic_post: AppPost) -> RefPost:
         url=url,
         source_network="twitter",
         ref_urls=ext_ref_urls,
+        ref_url_spans=extract_ref_url_spans(content, ext_ref_urls, orig_to_normed_map),
     )
     return post
 
@@ -157,6 +165,7 @@ def convert_vxtweet_to_quote_ref_post(tweet: dict) -> QuoteRefPost:
         source_network="twitter",
         metadata=tweet,
         ref_urls=ref_post.md_ref_urls(),
+        ref_url_spans=ref_post.ref_url_spans,
         quoted_url=quoted_url,
         quoted_post=quoted_tweet,
     )
@@ -191,6 +200,23 @@ def extract_status_id(url):
         return None
 
 
+def extract_ref_url_spans(
+    content: str, ref_urls: List[str], orig_to_normed_map: dict
+) -> List[Tuple[int, int, str]]:
+    """
+    Return (start, end, ref url) for each url in `content` that is one of the
+    reference urls `ref_urls`. Urls in `content` are mapped to their expanded
+    form with `orig_to_normed_map`, so no urls are resolved again.
+    """
+    ref_urls_by_tweet_url = {normalize_tweet_url(url): url for url in ref_urls}
+    spans = []
+    for start, end, url in extract_url_spans(content):
+        expanded_url = normalize_tweet_url(orig_to_normed_map.get(url, url))
+        if expanded_url in ref_urls_by_tweet_url:
+            spans.append((start, end, ref_urls_by_tweet_url[expanded_url]))
+    return spans
+
+
 # TODO combine with method below
 def extract_external_ref_urls(tweet: dict, add_qrt_url: bool = True):
     """
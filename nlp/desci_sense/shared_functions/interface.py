@@ -15,6 +15,7 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 from rdflib import URIRef, Literal, Graph
 from .prompting.jinja.topics_template import ALLOWED_TOPICS
 from .filters import SciFilterClassfication
+from .triples import TripleList
 from .utils import (
     normalize_tweet_urls_in_text,
     normalize_tweet_url,
@@ -283,8 +284,8 @@ class ParserSupport(BaseModel):
 
 class ParserResult(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
-    semantics: Graph = Field(
-        default_factory=Graph,
+    semantics: TripleList = Field(
+        default_factory=TripleList,
         description="Graph of triplets representing semantic relations \
         identified by the parser.",
     )
@@ -301,7 +302,7 @@ class ParserResult(BaseModel):
     )
 
     @field_serializer("semantics")
-    def graph_serializer(graph: Graph):
+    def graph_serializer(graph: TripleList):
         return graph.serialize(format="turtle")
 
     @field_validator(
@@ -309,12 +310,14 @@ class ParserResult(BaseModel):
     )  # before needed since arbitrary types allowed
     @classmethod
     def ensure_graph(cls, value: Any):
-        if isinstance(value, Graph):
+        if isinstance(value, TripleList):
             return value
+        elif isinstance(value, Graph):
+            return TripleList.from_graph(value)
         elif isinstance(value, str):
             graph = Graph()
             graph.parse(data=value, format="turtle")
-            return graph
+            return TripleList.from_graph(graph)
         raise ValueError("Invalid graph format")
 
 
@@ -346,6 +349,32 @@ class AppPost(BaseModel):
         return normalize_tweet_url(v) if isinstance(v, str) else v
 
 
+def get_raw_thread_texts(thread_data: Dict) -> List[str]:
+    """
+    Return contents of all posts in unvalidated thread data, including quoted posts.
+    Malformed data (eg not a dict) has no texts, it fails later on validation.
+    """
+    texts = []
+    if not isinstance(thread_data, dict):
+        return texts
+    posts = thread_data.get("thread")
+    if not isinstance(posts, list):
+        return texts
+    for post in posts:
+        if isinstance(post, AppPost):
+            post = post.model_dump()
+        if not isinstance(post, dict):
+            continue
+        if isinstance(post.get("content"), str):
+            texts.append(post["content"])
+        quoted_thread = post.get("quotedThread")
+        if isinstance(quoted_thread, AppThread):
+            quoted_thread = quoted_thread.model_dump()
+        if isinstance(quoted_thread, dict):
+            texts += get_raw_thread_texts(quoted_thread)
+    return texts
+
+
 class AppThread(BaseModel):
     author: Author
     thread: List[AppPost] = Field(description="List of posts quoted in this thread")
@@ -373,3 +402,42 @@ class ParsePostRequest(BaseModel):
         description="Additional params for parser (not used currently)",
         default_factory=dict,
     )
+
+
+class ParseBatchRequest(BaseModel):
+    """
+    Batch of parse requests passed to the parser by the ts app.
+    Items are validated individually as `ParsePostRequest`s when processed,
+    so an invalid item only fails its own result.
+    """
+
+    requests: List[Dict[str, Any]] = Field(
+        description="List of requests in `ParsePostRequest` format"
+    )
+    parameters: Optional[Any] = Field(
+        description="Additional params for parser (not used currently)",
+        default_factory=dict,
+    )
+
+
+class ParseBatchItemResult(BaseModel):
+    """
+    Result of a single item of a `ParseBatchRequest`.
+    Exactly one of `result` and `error` is set.
+    """
+
+    index: int = Field(description="Position of the item in the batch request")
+    result: Optional[ParserResult] = Field(
+        description="Parser result, if the item was processed successfully",
+        default=None,
+    )
+    error: Optional[str] = Field(
+        description="Error message, if processing the item failed",
+        default=None,
+    )
+
+
+class ParseBatchResponse(BaseModel):
+    results: List[ParseBatchItemResult] = Field(
+        description="Per item results, in the order of the batch request"
+    )
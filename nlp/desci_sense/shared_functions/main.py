@@ -1,12 +1,32 @@
-from typing import TypedDict, List
+from typing import TypedDict, List, Tuple
 from enum import Enum
+import hashlib
 
 from loguru import logger
 
 from .parsers.multi_chain_parser import MultiChainParser
+from .parsers.parser_registry import parser_registry
 from .init import init_multi_chain_parser_config
-from .configs import OpenrouterAPIConfig
-from .interface import ParserResult, ParsePostRequest
+from .configs import OpenrouterAPIConfig, MultiParserChainConfig
+from .interface import (
+    ParserResult,
+    ParsePostRequest,
+    ParseBatchRequest,
+    ParseBatchResponse,
+    ParseBatchItemResult,
+    get_raw_thread_texts,
+)
+from .preprocessing import convert_parse_request_to_parser_input
+from .utils import flatten, prefetch_urls
+
+
+# chains run by the app parser function
+APP_ACTIVE_LIST = [  # using new multi reference tagger
+    "keywords",
+    "multi_refs_tagger",
+    "topics",
+    "hashtags",
+]
 
 
 class SM_FUNCTION_post_parser_config(TypedDict, total=True):
@@ -18,9 +38,27 @@ class SM_FUNCTION_post_parser_config(TypedDict, total=True):
     topic_llm_type: str
 
 
-def SM_FUNCTION_post_parser_imp(
-    parserRequest: ParsePostRequest, parser_config: SM_FUNCTION_post_parser_config
-) -> ParserResult:
+def get_parser_registry_key(parser_config: SM_FUNCTION_post_parser_config) -> Tuple:
+    """
+    Key identifying a parser built from `parser_config`: the model types and the
+    OpenRouter settings. The API key is hashed so it isn't kept around in plain text.
+    """
+    api_key = parser_config.get("openrouter_api_key") or ""
+    return (
+        parser_config.get("ref_tagger_llm_type"),
+        parser_config.get("kw_llm_type"),
+        parser_config.get("topic_llm_type"),
+        parser_config.get("openrouter_api_base"),
+        parser_config.get("openrouter_referer"),
+        hashlib.sha256(api_key.encode("utf-8")).hexdigest(),
+    )
+
+
+def create_multi_chain_parser_config(
+    parser_config: SM_FUNCTION_post_parser_config,
+) -> MultiParserChainConfig:
+    # copy so that the caller's config is left untouched
+    parser_config = dict(parser_config)
     ref_tagger_llm_type = parser_config.pop("ref_tagger_llm_type")
     kw_llm_type = parser_config.pop("kw_llm_type")
     topic_llm_type = parser_config.pop("topic_llm_type")
@@ -31,24 +69,107 @@ def SM_FUNCTION_post_parser_imp(
         kw_llm_type=kw_llm_type,
         topic_llm_type=topic_llm_type,
     )
+    return multi_chain_parser_config
+
+
+def get_multi_chain_parser(
+    parser_config: SM_FUNCTION_post_parser_config,
+) -> MultiChainParser:
+    """
+    Return a warm `MultiChainParser` for `parser_config` from the process-wide
+    registry, building it on first use.
+    """
+    return parser_registry.get_or_create(
+        get_parser_registry_key(parser_config),
+        lambda: create_multi_chain_parser_config(parser_config),
+    )
 
-    val_parser_request = ParsePostRequest.model_validate(parserRequest)
 
-    parser = MultiChainParser(multi_chain_parser_config)
-    logger.info(f"Parser config: {multi_chain_parser_config}")
-    logger.info(f"Running parser on content: {val_parser_request}...")
+def SM_FUNCTION_warm_parser(parser_config: SM_FUNCTION_post_parser_config) -> bool:
+    """
+    Pre-build the parser for `parser_config` (eg at import time of the cloud function),
+    so the first request doesn't pay the initialization cost.
+    Returns True if the parser is ready, False if initialization failed.
+    """
+    try:
+        get_multi_chain_parser(parser_config)
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to pre-warm parser: {e}")
+        return False
+
+
+def SM_FUNCTION_post_parser_imp(
+    parserRequest: ParsePostRequest, parser_config: SM_FUNCTION_post_parser_config
+) -> ParserResult:
+    parser = get_multi_chain_parser(parser_config)
+    logger.info(f"Parser config: {parser.config}")
+    logger.info(f"Running parser on content: {parserRequest}...")
 
     # TODO change this to handle post and not text
+    # validated while converted, once its urls are resolved in a single pass
     result = parser.process_parse_request(
-        val_parser_request,
-        active_list=[  # using new multi reference tagger
-            "keywords",
-            "multi_refs_tagger",
-            "topics",
-            "hashtags",
-        ],
+        parserRequest,
+        active_list=APP_ACTIVE_LIST,
     )
 
     logger.info(f"Parser run ended result: {result}...")
 
     return result
+
+
+def SM_FUNCTION_batch_post_parser_imp(
+    batchRequest: ParseBatchRequest, parser_config: SM_FUNCTION_post_parser_config
+) -> ParseBatchResponse:
+    """
+    Parse a batch of posts in one call. URLs of the whole batch are resolved and
+    their metadata fetched in a single pass (each distinct URL once).
+    Failures of individual items (eg validation errors) are reported in their
+    results and don't fail the rest of the batch.
+    """
+    val_batch_request = ParseBatchRequest.model_validate(batchRequest)
+    raw_requests = val_batch_request.requests
+
+    parser = get_multi_chain_parser(parser_config)
+    logger.info(f"Running parser on batch of {len(raw_requests)} posts...")
+
+    # resolve urls of all posts in the batch in one pass
+    prefetch_urls(
+        flatten(
+            [
+                get_raw_thread_texts(r.get("post"))
+                for r in raw_requests
+                if isinstance(r, dict)
+            ]
+        )
+    )
+
+    results = [ParseBatchItemResult(index=i) for i in range(len(raw_requests))]
+    input_idxs = []
+    parser_inputs = []
+    for i, raw_request in enumerate(raw_requests):
+        try:
+            parser_inputs.append(convert_parse_request_to_parser_input(raw_request))
+            input_idxs.append(i)
+        except Exception as e:
+            logger.warning(f"Invalid batch item {i}: {e}")
+            results[i].error = f"Invalid request: {e}"
+
+    parser_results = parser.batch_process_parser_inputs(
+        parser_inputs,
+        batch_size=parser.config.batch_size,
+        active_list=APP_ACTIVE_LIST,
+        return_exceptions=True,
+    )
+    for i, parser_result in zip(input_idxs, parser_results):
+        if isinstance(parser_result, Exception):
+            logger.warning(f"Failed processing batch item {i}: {parser_result}")
+            results[i].error = f"Processing failed: {parser_result}"
+        else:
+            results[i].result = parser_result
+
+    logger.info(
+        f"Parser batch run ended: {sum(r.error is None for r in results)}/{len(results)} succeeded"
+    )
+
+    return ParseBatchResponse(results=results)
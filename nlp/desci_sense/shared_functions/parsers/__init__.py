@@ -2,6 +2,7 @@ from abc import ABC, abstractmethod
 from typing import Dict
 from loguru import logger
 from langchain_openai import ChatOpenAI
+from langchain_core.caches import BaseCache
 from enum import Enum
 
 from ..schema.post import RefPost
@@ -10,11 +11,15 @@ from ..web_extractors.metadata_extractors import (
 )
 from ..postprocessing import ParserChainOutput
 from ..configs import (
+    HedgeConfig,
+    LLMRateLimitConfig,
     PostParserChainConfig,
     MultiParserChainConfig,
 )
 from ..schema.helpers import convert_text_to_ref_post
 from ..schema.ontology_base import OntologyBase
+from .model_limits import LimitedChatOpenAI, get_model_limits
+from .hedging import HedgedChatModel, HedgePolicy
 
 
 def create_model(
@@ -23,11 +28,67 @@ def create_model(
     openrouter_api_base: str,
     openrouter_api_key: str,
     openrouter_referer: str = None,
+    cache: BaseCache = None,
+    fallback_llm_type: str = None,
+    rate_limit_config: LLMRateLimitConfig = None,
+    hedge_config: HedgeConfig = None,
 ):
-    model = ChatOpenAI(
+    """
+    Create the chat model for `llm_type`. If `rate_limit_config` is enabled,
+    calls to the model go through limits shared by all models created for
+    `llm_type` (see `LimitedChatOpenAI`), and while these fail fast calls are
+    sent to `fallback_llm_type` if set. If `hedge_config` is enabled, slow
+    calls are hedged (see `HedgedChatModel`).
+    """
+    if hedge_config is not None and hedge_config.enabled:
+        model_kwargs = {
+            "temperature": temperature,
+            "openrouter_api_base": openrouter_api_base,
+            "openrouter_api_key": openrouter_api_key,
+            "openrouter_referer": openrouter_referer,
+            "fallback_llm_type": fallback_llm_type,
+            "rate_limit_config": rate_limit_config,
+        }
+        primary = create_model(llm_type, **model_kwargs)
+        secondary = primary
+        if hedge_config.secondary_llm_type:
+            secondary = create_model(hedge_config.secondary_llm_type, **model_kwargs)
+        # responses are cached by the hedged model, so hedges of cached calls aren't sent
+        return HedgedChatModel(
+            primary=primary,
+            secondary=secondary,
+            policy=HedgePolicy(hedge_config),
+            cache=cache,
+        )
+
+    if rate_limit_config is None or not rate_limit_config.enabled:
+        return ChatOpenAI(
+            model=llm_type,
+            temperature=temperature,
+            openai_api_key=openrouter_api_key,
+            openai_api_base=openrouter_api_base,
+            cache=cache,
+        )
+
+    fallback_model = None
+    if fallback_llm_type:
+        fallback_model = create_model(
+            fallback_llm_type,
+            temperature,
+            openrouter_api_base,
+            openrouter_api_key,
+            openrouter_referer,
+            cache=cache,
+            rate_limit_config=rate_limit_config,
+        )
+    model = LimitedChatOpenAI(
         model=llm_type,
         temperature=temperature,
         openai_api_key=openrouter_api_key,
         openai_api_base=openrouter_api_base,
+        cache=cache,
+        max_retries=0,
+        model_limits=get_model_limits(llm_type, rate_limit_config),
+        fallback_model=fallback_model,
     )
     return model
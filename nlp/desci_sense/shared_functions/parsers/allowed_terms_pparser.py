@@ -1,7 +1,7 @@
 from typing import Dict
 
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from langchain_core.prompts import ChatPromptTemplate
 from operator import itemgetter
 
 from .post_parser_chain import PostParserChain
@@ -43,7 +43,7 @@ class AllowedTermsPParserChain(PostParserChain):
     ):
         super().__init__(parser_config, global_config, ontology)
 
-        self.input_template = PromptTemplate.from_template(self.input_key)
+        self.input_template = self.create_input_prompt()
 
         self.parser_chain = self.input_template | self.model | StrOutputParser()
 
@@ -0,0 +1,223 @@
+"""
+Batch processing of posts with each result checkpointed to an append-only
+JSONL file as soon as it is done, so a run interrupted by a crash or rate
+limits resumes where it stopped instead of parsing every post again.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+import hashlib
+import json
+import os
+
+from loguru import logger
+from pydantic import BaseModel
+
+from ..async_utils import run_coroutine_sync
+from ..configs import MultiParserChainConfig, PostProcessType
+from ..interface import ParserResult
+from ..postprocessing import CombinedParserOutput
+from ..schema.post import RefPost
+from .multi_chain_parser import MultiChainParser
+from .parser_utils import BatchCallback
+
+# settings that affect how posts are processed but not their results
+RESULT_INDEPENDENT_FIELDS = {
+    "wandb_config",
+    "batch_size",
+    "llm_cache_config",
+    "pipeline_config",
+    "llm_rate_limit_config",
+    "tracing_config",
+    "coalesce_requests",
+}
+
+# settings of each parser chain that don't affect its results
+RESULT_INDEPENDENT_CHAIN_FIELDS = {
+    "hedge_config": True,
+    "prompt_cache_control": True,
+    "llm_config": {"use_cache"},
+}
+
+# settings of nested configs that don't affect results
+RESULT_INDEPENDENT_NESTED_FIELDS = {
+    "metadata_extract_config": {"cache_config": True},
+    "openrouter_api_config": {"openrouter_api_base": True},
+}
+
+RESULT_TYPES = {
+    PostProcessType.COMBINED: CombinedParserOutput,
+    PostProcessType.FIREBASE: ParserResult,
+}
+
+
+def get_results_config_hash(config: MultiParserChainConfig) -> str:
+    """
+    Hash of the parser config settings that determine the results, so
+    checkpoints stay valid when eg concurrency or rate limits are changed
+    between runs.
+    """
+    exclude = {
+        **{field: True for field in RESULT_INDEPENDENT_FIELDS},
+        **RESULT_INDEPENDENT_NESTED_FIELDS,
+        "parser_configs": {"__all__": RESULT_INDEPENDENT_CHAIN_FIELDS},
+    }
+    payload = config.model_dump_json(exclude=exclude)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_post_key(post: RefPost, active_list: List[str]) -> str:
+    """
+    Stable hash of `post` and the chains run on it.
+    """
+    payload = json.dumps(
+        [type(post).__name__, post.dict(), sorted(active_list)],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def ends_with_newline(path: Path) -> bool:
+    """
+    Whether the file at `path` is empty or ends with a newline.
+    """
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class CheckpointedBatchRunner:
+    """
+    Runs `MultiChainParser` on batches of posts, appending each result to the
+    JSONL checkpoint at `path` as it completes. Posts whose results are
+    already in the checkpoint (same post, chains and parser config) are
+    skipped. Failed posts are not checkpointed, so they are retried by the
+    next run.
+
+    Each line of the checkpoint is a JSON object with the post `key`, the
+    `config_hash` and the serialized `result`. Results of several configs can
+    share a checkpoint.
+    """
+
+    def __init__(
+        self,
+        parser: MultiChainParser,
+        path: Union[str, Path],
+        active_list: List[str] = None,
+        batch_size: int = None,
+    ) -> None:
+        post_process_type = parser.config.post_process_type
+        if post_process_type not in RESULT_TYPES:
+            raise ValueError(
+                f"Results of post process type {post_process_type.value} can't be checkpointed"
+            )
+        self.parser = parser
+        self.path = Path(path)
+        self.active_list = (
+            active_list if active_list is not None else list(parser.pparsers.keys())
+        )
+        self.batch_size = batch_size if batch_size else parser.config.batch_size
+        self.result_type = RESULT_TYPES[post_process_type]
+        self.config_hash = get_results_config_hash(parser.config)
+
+    def load_completed(self) -> Dict[str, BaseModel]:
+        """
+        Results in the checkpoint of posts processed with the parser's config,
+        by post key.
+        """
+        completed = {}
+        if not self.path.exists():
+            return completed
+        with open(self.path) as f:
+            for line_num, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # eg a line cut short by a crash while it was written
+                    logger.warning(
+                        f"Skipping invalid line {line_num} of checkpoint {self.path}"
+                    )
+                    continue
+                if record["config_hash"] == self.config_hash:
+                    completed[record["key"]] = record["result"]
+        return {
+            key: self.result_type.model_validate(result)
+            for key, result in completed.items()
+        }
+
+    def run(
+        self, posts: List[RefPost], return_exceptions: bool = False
+    ) -> List[Union[BaseModel, Exception]]:
+        """
+        Return the results of `posts`, in order, processing only the posts
+        missing from the checkpoint. If `return_exceptions` is False, the
+        first exception raised by a post is raised once all other posts are
+        processed (and checkpointed); otherwise exceptions are returned as
+        the results of the posts that failed.
+        """
+        return run_coroutine_sync(self.arun(posts, return_exceptions))
+
+    async def arun(
+        self, posts: List[RefPost], return_exceptions: bool = False
+    ) -> List[Union[BaseModel, Exception]]:
+        """Async version of `run`."""
+        completed = self.load_completed()
+        keys = [get_post_key(post, self.active_list) for post in posts]
+        results: List[Optional[Union[BaseModel, Exception]]] = [
+            completed.get(key) for key in keys
+        ]
+
+        # indices of the posts to process, duplicate posts are processed once
+        pending: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                pending.setdefault(key, []).append(i)
+        logger.info(
+            f"{len(posts) - sum(map(len, pending.values()))} of {len(posts)} posts "
+            f"already processed in checkpoint {self.path}"
+        )
+        if not pending:
+            return results
+
+        pending_keys = list(pending)
+        inputs = [posts[pending[key][0]] for key in pending_keys]
+        cb = BatchCallback(len(inputs) * len(self.active_list))
+        pipeline_config = self.parser.config.pipeline_config.model_copy(
+            update={"llm_concurrency": self.batch_size}
+        )
+        first_exception = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            if not ends_with_newline(self.path):
+                # end a last line cut short by a crash, so records aren't appended to it
+                f.write("\n")
+            async for i, result in self.parser.astream_process_ref_posts(
+                inputs,
+                self.active_list,
+                pipeline_config=pipeline_config,
+                return_exceptions=True,
+                callbacks=[cb],
+            ):
+                key = pending_keys[i]
+                if isinstance(result, Exception):
+                    logger.warning(f"Failed processing post {inputs[i].url}: {result}")
+                    first_exception = first_exception or result
+                else:
+                    record = {
+                        "key": key,
+                        "config_hash": self.config_hash,
+                        "result": result.model_dump(mode="json"),
+                    }
+                    f.write(json.dumps(record) + "\n")
+                    # written through as each post completes
+                    f.flush()
+                for j in pending[key]:
+                    results[j] = result
+        cb.progress_bar.close()
+
+        if first_exception is not None and not return_exceptions:
+            raise first_exception
+        return results
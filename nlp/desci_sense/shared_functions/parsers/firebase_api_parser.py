@@ -177,9 +177,9 @@ class FirebaseAPIParser:
 
         # configure zero ref case
         prompt_case_dict[PromptCase.ZERO_REF] = {
-            "labels": ontology.get_valid_templates(
-                subject_type="post", object_type="nan", as_dict=False
-            ).label.to_list(),
+            "labels": ontology.get_valid_labels(
+                subject_type="post", object_type="nan"
+            ),
             "type_templates": ontology.get_valid_templates(
                 subject_type="post", object_type="nan"
             ),
@@ -196,9 +196,9 @@ class FirebaseAPIParser:
 
         # configure single ref case
         prompt_case_dict[PromptCase.SINGLE_REF] = {
-            "labels": ontology.get_valid_templates(
-                subject_type="post", object_type="ref", as_dict=False
-            ).label.to_list(),
+            "labels": ontology.get_valid_labels(
+                subject_type="post", object_type="ref"
+            ),
             "type_templates": ontology.get_valid_templates(
                 subject_type="post", object_type="ref"
             ),
@@ -218,9 +218,9 @@ class FirebaseAPIParser:
         # configure multi ref case
         # TODO update to handle relations - meanwhile placeholder based on single refs
         prompt_case_dict[PromptCase.MULTI_REF] = {
-            "labels": ontology.get_valid_templates(
-                subject_type="post", object_type="ref", as_dict=False
-            ).label.to_list(),
+            "labels": ontology.get_valid_labels(
+                subject_type="post", object_type="ref"
+            ),
             "type_templates": ontology.get_valid_templates(
                 subject_type="post", object_type="ref"
             ),
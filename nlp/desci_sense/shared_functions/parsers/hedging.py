@@ -0,0 +1,276 @@
+"""
+Hedged model calls: if a call hasn't returned after a high percentile of
+recent call latencies, a duplicate (hedge) is sent to the same or a secondary
+model, the first response is used and the other call is cancelled.
+The fraction of hedged calls is capped by a budget.
+"""
+
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import asyncio
+import math
+import threading
+import time
+
+from loguru import logger
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.pydantic_v1 import Field
+
+from ..configs import HedgeConfig
+
+
+class LatencyTracker:
+    """
+    Latencies of the last `window_size` calls.
+    """
+
+    def __init__(self, window_size: int) -> None:
+        self._latencies = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def record(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Nearest-rank percentile of the recorded latencies, or None if none
+        are recorded.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        rank = math.ceil(percentile / 100 * len(latencies))
+        return latencies[min(max(rank, 1), len(latencies)) - 1]
+
+
+class HedgeBudget:
+    """
+    Each call earns `max_hedge_fraction` of a hedge and each hedge spends
+    one, so at most `max_hedge_fraction` of calls are hedged over time
+    (with bursts of at most `max_hedge_burst` hedges).
+    """
+
+    def __init__(self, max_hedge_fraction: float, max_hedge_burst: float) -> None:
+        self.max_hedge_fraction = max_hedge_fraction
+        self.max_hedge_burst = max_hedge_burst
+        self.balance = 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.balance = min(
+                self.max_hedge_burst, self.balance + self.max_hedge_fraction
+            )
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+@dataclass
+class HedgeStats:
+    calls: int = 0
+    hedges: int = 0  # hedges sent
+    hedge_wins: int = 0  # hedges that returned before the original call
+    budget_exhausted: int = 0  # hedges not sent for lack of budget
+
+    @property
+    def hedge_rate(self) -> float:
+        return self.hedges / self.calls if self.calls else 0.0
+
+    @property
+    def hedge_win_rate(self) -> float:
+        return self.hedge_wins / self.hedges if self.hedges else 0.0
+
+
+class HedgePolicy:
+    """
+    When to hedge the calls of a chain: latencies, budget and stats.
+    """
+
+    def __init__(self, config: HedgeConfig) -> None:
+        self.config = config
+        self.latencies = LatencyTracker(config.window_size)
+        self.budget = HedgeBudget(config.max_hedge_fraction, config.max_hedge_burst)
+        self.stats = HedgeStats()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        Thread pool running the sync calls and hedges of the chain, with
+        `config.max_workers` threads.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.config.max_workers,
+                    thread_name_prefix="hedged-call",
+                )
+            return self._executor
+
+    def hedge_delay(self) -> float:
+        """
+        Seconds to wait for a call before sending a hedge.
+        """
+        if len(self.latencies) < self.config.min_samples:
+            return self.config.initial_delay
+        delay = self.latencies.percentile(self.config.latency_percentile)
+        return max(self.config.min_delay, delay)
+
+    def start_call(self):
+        self.budget.deposit()
+        with self._lock:
+            self.stats.calls += 1
+
+    def try_hedge(self) -> bool:
+        """
+        True if a hedge can be sent (and counts it).
+        """
+        hedge = self.budget.withdraw()
+        with self._lock:
+            if hedge:
+                self.stats.hedges += 1
+            else:
+                self.stats.budget_exhausted += 1
+        return hedge
+
+    def record_win(self, is_hedge: bool):
+        if is_hedge:
+            with self._lock:
+                self.stats.hedge_wins += 1
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    Calls `primary`, and hedges the call to `secondary` (which may be the same
+    model) when it is slow, as decided by `policy`. Only successful calls are
+    used: if the first call to return failed, the other one is awaited.
+    Async calls that lose the race are cancelled. Sync calls run in the
+    policy's thread pool (see `HedgeConfig.max_workers`) and can't be
+    interrupted, so the losing call runs to completion in the background and
+    its result is dropped.
+    """
+
+    primary: BaseChatModel
+    secondary: BaseChatModel
+    policy: HedgePolicy = Field(exclude=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged-chat-model"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.primary._identifying_params
+
+    @property
+    def stats(self) -> HedgeStats:
+        return self.policy.stats
+
+    def _timed_call(self, model: BaseChatModel, messages, stop, run_manager, **kwargs):
+        start = time.perf_counter()
+        result = model._generate(messages, stop, run_manager, **kwargs)
+        self.policy.latencies.record(time.perf_counter() - start)
+        return result
+
+    async def _atimed_call(
+        self, model: BaseChatModel, messages, stop, run_manager, **kwargs
+    ):
+        start = time.perf_counter()
+        try:
+            result = await model._agenerate(messages, stop, run_manager, **kwargs)
+        except asyncio.CancelledError:
+            # calls losing the race are the slow ones: record how long they
+            # took at least, so the percentile doesn't leave out the tail
+            self.policy.latencies.record(time.perf_counter() - start)
+            raise
+        self.policy.latencies.record(time.perf_counter() - start)
+        return result
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.policy.start_call()
+        executor = self.policy.executor
+        args = (messages, stop, run_manager)
+        primary = executor.submit(self._timed_call, self.primary, *args, **kwargs)
+        done, _ = wait([primary], timeout=self.policy.hedge_delay())
+        calls: Dict[Future, bool] = {primary: False}
+        if not done and self.policy.try_hedge():
+            logger.debug(f"Hedging slow call to {self.secondary._llm_type}")
+            hedge = executor.submit(self._timed_call, self.secondary, *args, **kwargs)
+            calls[hedge] = True
+
+        pending = set(calls)
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    self.policy.record_win(calls[future])
+                    return future.result()
+            if not pending:
+                # all calls failed
+                return primary.result()
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.policy.start_call()
+        args = (messages, stop, run_manager)
+        primary = asyncio.ensure_future(
+            self._atimed_call(self.primary, *args, **kwargs)
+        )
+        calls: Dict[asyncio.Future, bool] = {primary: False}
+        try:
+            done, _ = await asyncio.wait([primary], timeout=self.policy.hedge_delay())
+            if not done and self.policy.try_hedge():
+                logger.debug(f"Hedging slow call to {self.secondary._llm_type}")
+                hedge = asyncio.ensure_future(
+                    self._atimed_call(self.secondary, *args, **kwargs)
+                )
+                calls[hedge] = True
+
+            pending = set(calls)
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        self.policy.record_win(calls[task])
+                        return task.result()
+                if not pending:
+                    return primary.result()
+        finally:
+            for task in calls:
+                if not task.done():
+                    task.cancel()
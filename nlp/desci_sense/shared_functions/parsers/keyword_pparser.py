@@ -1,5 +1,4 @@
-from typing import Dict
-from langchain.prompts import PromptTemplate
+from typing import Any, Dict
 from langchain_core.runnables import RunnableLambda
 
 from .post_parser_chain import PostParserChain
@@ -34,7 +33,7 @@ class KeywordPostParserChain(PostParserChain):
     ):
         super().__init__(parser_config, global_config, ontology)
 
-        self.input_template = PromptTemplate.from_template(self.input_key)
+        self.input_template = self.create_input_prompt()
         self.runnable_fallback = RunnableLambda(return_fallback)
 
         self.prompt_template = keywords_extraction_template
@@ -47,9 +46,8 @@ class KeywordPostParserChain(PostParserChain):
 
     @property
     def chain(self):
-        return self._chain.with_retry(stop_after_attempt=5).with_fallbacks(
-            [self.runnable_fallback]
-        )
+        chain = self.with_output_retry(self._chain, stop_after_attempt=5)
+        return chain.with_fallbacks([self.runnable_fallback])
 
     def process_ref_post(
         self,
@@ -83,7 +81,20 @@ class KeywordPostParserChain(PostParserChain):
         # instantiate prompt with ref post details
         full_prompt = self.prompt_template.render(
             rendered_post=rendered_post,
-            max_keywords=self.parser_config.max_keywords,
-            quoted_context_length=self.parser_config.quoted_context_length,
+            **self.static_prompt_vars(),
         )
-        return {self.input_name: full_prompt}
+        return self.prompt_inputs(full_prompt, self.get_prompt_prefix(post))
+
+    def get_static_prompt_prefix(self, post: RefPost) -> str:
+        return self.render_prompt_prefix(
+            None,
+            self.prompt_template,
+            ["rendered_post"],
+            **self.static_prompt_vars(),
+        )
+
+    def static_prompt_vars(self) -> Dict[str, Any]:
+        return {
+            "max_keywords": self.parser_config.max_keywords,
+            "quoted_context_length": self.parser_config.quoted_context_length,
+        }
@@ -0,0 +1,136 @@
+"""
+On-disk cache of raw model responses, so re-parsing the same post (retries,
+re-parses after edits, evaluation reruns) doesn't send identical prompts again.
+"""
+
+from typing import Any, Dict, Optional
+import hashlib
+import sqlite3
+import threading
+import time
+
+from loguru import logger
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+from ..configs import LLMCacheConfig
+from ..web_extractors.metadata_cache import CacheStats
+
+
+def get_cache_key(prompt: str, llm_string: str) -> str:
+    """
+    `llm_string` is the serialized model configuration set by langchain
+    (model name, temperature, stop tokens etc.) and `prompt` the serialized
+    instantiated prompt.
+    """
+    return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache(BaseCache):
+    """
+    Langchain cache backed by a SQLite file, keyed by model configuration
+    and exact prompt. When the number of entries exceeds `max_entries`,
+    the least recently accessed entries are evicted. As in
+    `SQLiteMetadataCache`, entries are counted when the cache is opened and
+    the count is then kept up to date by each write.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_accessed_at ON llm_cache (accessed_at)"
+            )
+            (self._num_entries,) = self._conn.execute(
+                "SELECT COUNT(*) FROM llm_cache"
+            ).fetchone()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = get_cache_key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE llm_cache SET accessed_at = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            self.stats.hits += 1
+        try:
+            return loads(row[0])
+        except Exception as e:
+            logger.warning(f"Failed loading cached response, ignoring: {e}")
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = get_cache_key(prompt, llm_string)
+        response = dumps(return_val)
+        with self._lock, self._conn:
+            exists = self._conn.execute(
+                "SELECT 1 FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)",
+                (key, response, time.time()),
+            )
+            if exists is None:
+                self._num_entries += 1
+            self.stats.sets += 1
+            if self._num_entries > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        num_to_evict = self._num_entries - self.max_entries
+        cursor = self._conn.execute(
+            """DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?
+            )""",
+            (num_to_evict,),
+        )
+        self._num_entries -= cursor.rowcount
+        self.stats.evictions += cursor.rowcount
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._num_entries = 0
+
+    def num_entries(self) -> int:
+        with self._lock:
+            (num_entries,) = self._conn.execute(
+                "SELECT COUNT(*) FROM llm_cache"
+            ).fetchone()
+        return num_entries
+
+
+_llm_caches: Dict[str, LLMResponseCache] = {}
+_llm_caches_lock = threading.Lock()
+
+
+def get_llm_cache(config: LLMCacheConfig) -> LLMResponseCache:
+    """
+    Return the response cache stored at `config.disk_path`, creating it on
+    first use. Chains configured with the same path share one cache.
+    """
+    with _llm_caches_lock:
+        cache = _llm_caches.get(config.disk_path)
+        if cache is None:
+            logger.info(f"Initializing LLM response cache at {config.disk_path}")
+            cache = LLMResponseCache(config.disk_path, config.max_entries)
+            _llm_caches[config.disk_path] = cache
+        return cache
@@ -0,0 +1,423 @@
+"""
+Limits shared by all chains calling the same model: an adaptive rate limiter
+that slows down calls to a model when the provider returns rate limit errors,
+and a circuit breaker that fails fast (or switches to a fallback model) while
+a model keeps failing.
+"""
+
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import math
+import threading
+import time
+
+import openai
+from loguru import logger
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, get_buffer_string
+from langchain_core.outputs import ChatResult
+from langchain_core.pydantic_v1 import Field
+from langchain_openai import ChatOpenAI
+
+from ..configs import LLMRateLimitConfig
+from ..preprocessing.token_budget import APPROX_CHARS_PER_TOKEN
+
+
+class ModelUnavailableError(Exception):
+    """
+    Raised instead of calling a model whose circuit breaker is open.
+    """
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` per second up to `capacity`. Reservations
+    are taken even if the bucket is empty: the level goes negative and the
+    caller waits until it is refilled.
+    """
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        Take `amount` from the bucket and return the seconds to wait before
+        using it.
+        """
+        self._refill(now)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount: float, now: float):
+        """
+        Return `amount` to the bucket (or take it if negative).
+        """
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+    def set_rate(self, rate: float, now: float):
+        self._refill(now)
+        self.rate = rate
+
+    def pause(self, seconds: float, now: float):
+        """
+        Empty the bucket so the next reservation waits at least `seconds`.
+        """
+        self._refill(now)
+        self.level = min(self.level, -seconds * self.rate)
+
+
+class AdaptiveRateLimiter:
+    """
+    Limits the request rate and (optionally) the token rate to a model.
+    When the provider returns a rate limit error, calls are paused for the
+    Retry-After time and both rates are reduced by `config.backoff_factor`
+    (once per pause, however many requests got the error). Each successful
+    request recovers `config.recovery_step` of the configured rates.
+    Token reservations are estimates, corrected with the actual usage once
+    the response is received.
+    """
+
+    def __init__(self, config: LLMRateLimitConfig, clock=time.monotonic) -> None:
+        self.config = config
+        self.clock = clock
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        now = clock()
+        request_rate = config.requests_per_minute / 60
+        self._requests = TokenBucket(
+            request_rate, max(1.0, request_rate * config.burst_seconds), now
+        )
+        self._tokens = None
+        if config.tokens_per_minute:
+            token_rate = config.tokens_per_minute / 60
+            self._tokens = TokenBucket(
+                token_rate, token_rate * config.burst_seconds, now
+            )
+
+    @property
+    def requests_per_minute(self) -> float:
+        return self._requests.rate * 60
+
+    def _buckets(self) -> List[Tuple[TokenBucket, float]]:
+        buckets = [(self._requests, self.config.requests_per_minute / 60)]
+        if self._tokens is not None:
+            buckets.append((self._tokens, self.config.tokens_per_minute / 60))
+        return buckets
+
+    def _set_scale(self, scale: float, now: float):
+        self.scale = scale
+        for bucket, rate in self._buckets():
+            bucket.set_rate(rate * scale, now)
+
+    def reserve(self, num_tokens: int = 0) -> float:
+        """
+        Reserve a request of `num_tokens` tokens and return the seconds to
+        wait before sending it.
+        """
+        with self._lock:
+            now = self.clock()
+            delay = self._requests.reserve(1, now)
+            if self._tokens is not None:
+                delay = max(delay, self._tokens.reserve(num_tokens, now))
+            return delay
+
+    def acquire(self, num_tokens: int = 0):
+        delay = self.reserve(num_tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, num_tokens: int = 0):
+        delay = self.reserve(num_tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def record_usage(self, reserved_tokens: int, used_tokens: int):
+        if self._tokens is None:
+            return
+        with self._lock:
+            self._tokens.refund(reserved_tokens - used_tokens, self.clock())
+
+    def on_success(self):
+        with self._lock:
+            if self.scale < 1.0:
+                self._set_scale(
+                    min(1.0, self.scale + self.config.recovery_step), self.clock()
+                )
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        with self._lock:
+            now = self.clock()
+            if now >= self.paused_until:
+                scale = max(
+                    self.config.min_rate_fraction,
+                    self.scale * self.config.backoff_factor,
+                )
+                self._set_scale(scale, now)
+                logger.warning(
+                    f"Rate limited, reducing request rate to {self.requests_per_minute:.1f}/min"
+                )
+            if retry_after is None:
+                retry_after = self.config.default_retry_after
+            self.paused_until = max(self.paused_until, now + retry_after)
+            for bucket, _ in self._buckets():
+                bucket.pause(self.paused_until - now, now)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"  # requests are sent
+    OPEN = "open"  # requests fail fast
+    HALF_OPEN = "half_open"  # a single request is sent to probe the model
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. After
+    `reset_timeout` seconds, a single probe request is allowed: the breaker
+    closes if it succeeds and opens again otherwise (another probe is allowed
+    after `reset_timeout` if the probe never completes, eg it was cancelled).
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_timeout: float,
+        clock=time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CircuitState.CLOSED
+        self.num_failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == CircuitState.CLOSED:
+                return True
+            now = self.clock()
+            if now >= self.opened_at + self.reset_timeout:
+                self.state = CircuitState.HALF_OPEN
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CircuitState.CLOSED
+            self.num_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.num_failures += 1
+            if (
+                self.state == CircuitState.HALF_OPEN
+                or self.num_failures >= self.failure_threshold
+            ):
+                self.state = CircuitState.OPEN
+                self.opened_at = self.clock()
+
+
+# errors worth retrying, that count as failures of the model
+TRANSIENT_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def get_retry_after(error: openai.APIStatusError) -> Optional[float]:
+    """
+    Seconds to wait before retrying, from the Retry-After header of the
+    response (if set as a number of seconds).
+    """
+    headers = error.response.headers
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def estimate_num_tokens(messages: List[BaseMessage]) -> int:
+    return math.ceil(len(get_buffer_string(messages)) / APPROX_CHARS_PER_TOKEN)
+
+
+class ModelLimits:
+    """
+    Rate limiter and circuit breaker of a model.
+    """
+
+    def __init__(self, llm_type: str, config: LLMRateLimitConfig) -> None:
+        self.llm_type = llm_type
+        self.config = config
+        self.limiter = AdaptiveRateLimiter(config)
+        self.breaker = CircuitBreaker(config.failure_threshold, config.reset_timeout)
+
+    def check_available(self):
+        if not self.breaker.allow_request():
+            raise ModelUnavailableError(
+                f"Model {self.llm_type} is failing, not calling it for now"
+            )
+
+    def record_result(self, result: ChatResult, reserved_tokens: int):
+        token_usage = (result.llm_output or {}).get("token_usage") or {}
+        self.limiter.record_usage(
+            reserved_tokens, token_usage.get("total_tokens", reserved_tokens)
+        )
+        self.limiter.on_success()
+        self.breaker.record_success()
+
+    def record_error(
+        self, error: Exception, reserved_tokens: int, attempt: int
+    ) -> Optional[float]:
+        """
+        Update the limits after a request failed with `error`. Return the
+        seconds to wait before retrying the request (on top of waiting for
+        the rate limiter), or None if it shouldn't be retried.
+        """
+        self.limiter.record_usage(reserved_tokens, 0)
+        if isinstance(error, openai.RateLimitError):
+            self.limiter.on_rate_limited(get_retry_after(error))
+            self.breaker.record_failure()
+            delay = 0.0
+        elif isinstance(error, TRANSIENT_ERRORS):
+            self.breaker.record_failure()
+            delay = self.config.retry_backoff * 2**attempt
+        else:
+            # the model responded (eg invalid request), so it is available
+            self.breaker.record_success()
+            return None
+        return delay if attempt < self.config.max_retries else None
+
+
+_model_limits: Dict[Tuple[str, str], ModelLimits] = {}
+_model_limits_lock = threading.Lock()
+
+
+def get_model_limits(llm_type: str, config: LLMRateLimitConfig) -> ModelLimits:
+    """
+    Return the limits of model `llm_type`, shared by all chains calling the
+    model with the same `config`.
+    """
+    key = (llm_type, config.model_dump_json())
+    with _model_limits_lock:
+        limits = _model_limits.get(key)
+        if limits is None:
+            limits = ModelLimits(llm_type, config)
+            _model_limits[key] = limits
+        return limits
+
+
+class LimitedChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI model whose requests go through the shared `model_limits` of
+    the model. Requests failing with rate limit or transient errors are
+    retried here (instead of by the OpenAI client, which is created with
+    `max_retries=0`), so all retries are paced by the shared rate limiter.
+    While the circuit breaker of the model is open, requests are sent to
+    `fallback_model` if set, and fail with `ModelUnavailableError` otherwise.
+    Cached responses don't go through the limits.
+    """
+
+    model_limits: Optional[ModelLimits] = Field(default=None, exclude=True)
+    fallback_model: Optional[BaseChatModel] = Field(default=None, exclude=True)
+
+    def _fallback_or_raise(self, error: ModelUnavailableError) -> BaseChatModel:
+        if self.fallback_model is None:
+            raise error
+        logger.warning(f"{error}, using fallback model")
+        return self.fallback_model
+
+    def _use_fallback(self) -> bool:
+        return (
+            self.fallback_model is not None
+            and self.model_limits.breaker.state == CircuitState.OPEN
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.model_limits is None:
+            return super()._generate(messages, stop, run_manager, **kwargs)
+
+        num_tokens = estimate_num_tokens(messages)
+        attempt = 0
+        while True:
+            try:
+                self.model_limits.check_available()
+            except ModelUnavailableError as e:
+                return self._fallback_or_raise(e)._generate(
+                    messages, stop, run_manager, **kwargs
+                )
+            self.model_limits.limiter.acquire(num_tokens)
+            try:
+                result = super()._generate(messages, stop, run_manager, **kwargs)
+            except Exception as e:
+                delay = self.model_limits.record_error(e, num_tokens, attempt)
+                if delay is None:
+                    # switch to the fallback model if the breaker just opened
+                    if not self._use_fallback():
+                        raise
+                else:
+                    logger.debug(f"Retrying {self.model_name} after error: {e}")
+                    time.sleep(delay)
+                    attempt += 1
+                continue
+            self.model_limits.record_result(result, num_tokens)
+            return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.model_limits is None:
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+        num_tokens = estimate_num_tokens(messages)
+        attempt = 0
+        while True:
+            try:
+                self.model_limits.check_available()
+            except ModelUnavailableError as e:
+                return await self._fallback_or_raise(e)._agenerate(
+                    messages, stop, run_manager, **kwargs
+                )
+            await self.model_limits.limiter.aacquire(num_tokens)
+            try:
+                result = await super()._agenerate(
+                    messages, stop, run_manager, **kwargs
+                )
+            except Exception as e:
+                delay = self.model_limits.record_error(e, num_tokens, attempt)
+                if delay is None:
+                    # switch to the fallback model if the breaker just opened
+                    if not self._use_fallback():
+                        raise
+                else:
+                    logger.debug(f"Retrying {self.model_name} after error: {e}")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                continue
+            self.model_limits.record_result(result, num_tokens)
+            return result
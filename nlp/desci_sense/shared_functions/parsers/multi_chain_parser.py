@@ -1,7 +1,11 @@
 from loguru import logger
-from typing import List, Dict, Union, Optional
+from typing import Any, List, Dict, Union, Optional, AsyncIterator, Tuple
 from operator import itemgetter
+from contextlib import nullcontext
 import asyncio
+import copy
+import hashlib
+import json
 
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import PromptTemplate
@@ -10,9 +14,11 @@ from langchain_core.runnables import RunnableParallel, RunnableConfig
 from langchain_core.prompts import ChatPromptTemplate
 
 from .parser_factory import parser_factory
+from .post_parser_chain import PostParserChain
 from ..configs import (
     MetadataExtractionType,
     MultiParserChainConfig,
+    PipelineConfig,
     PostProcessType,
 )
 from ..interface import (
@@ -25,6 +31,11 @@ from ..preprocessing import (
     preproc_parser_input,
     PreprocParserInput,
     convert_parse_request_to_parser_input,
+    aconvert_parse_request_to_parser_input,
+)
+from ..preprocessing.token_budget import (
+    get_token_counter,
+    fit_post_metadata_to_budget,
 )
 from ..schema.ontology_base import OntologyBase
 from ..schema.post import RefPost
@@ -50,8 +61,16 @@ from ..web_extractors.metadata_extractors import (
     extract_metadata_by_type,
     extract_all_metadata_by_type,
     extract_posts_ref_metadata_dict,
+    aextract_posts_ref_metadata_dict,
+    afetch_urls_citoid_metadata,
+    get_posts_ref_urls,
     set_metadata_extraction_type,
 )
+from ..web_extractors.metadata_cache import (
+    MetadataCache,
+    InMemoryMetadataCache,
+    create_metadata_cache,
+)
 
 from ..prompting.jinja.zero_ref_template import zero_ref_template
 from ..prompting.jinja.single_ref_template import single_ref_template
@@ -59,6 +78,26 @@ from ..prompting.jinja.keywords_extraction_template import keywords_extraction_t
 from ..prompting.jinja.multi_ref_template import multi_ref_template
 from ..prompting.jinja.topics_template import ALLOWED_TOPICS, topics_template
 from .parser_utils import BatchCallback
+from ..async_utils import run_coroutine_sync, apipeline, SingleFlight
+from ..tracing import create_exporters, span, start_trace, trace_runnable
+
+
+def get_parse_request_key(
+    parse_request: Union[ParsePostRequest, Dict],
+    active_list: Optional[List[str]],
+    config_hash: str,
+) -> str:
+    """
+    Canonical hash of a parse request (validated or passed as a raw dict), the
+    chains to run and the parser config (`config_hash`). Identical requests get
+    the same key regardless of the order of dict keys.
+    """
+    if isinstance(parse_request, ParsePostRequest):
+        parse_request = parse_request.model_dump(mode="json")
+    payload = json.dumps(
+        [config_hash, parse_request, active_list], sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
 def add_prompts_to_output(
@@ -79,6 +118,11 @@ class MultiChainParser:
 
         self.ontology_base = OntologyBase()
 
+        # cache of reference metadata, shared by all requests handled by this parser
+        self.metadata_cache = create_metadata_cache(
+            config.metadata_extract_config.cache_config
+        )
+
         # initialize the post parsers
         logger.info("Initializing post parsers...")
         self.pparsers = {}
@@ -90,6 +134,17 @@ class MultiChainParser:
         # init parallel chain
         self.parallel_chain = self.create_parallel_chain(self.pparsers)
 
+        # parse requests in flight, so concurrent duplicates are computed once
+        self.config_hash = hashlib.sha256(
+            config.model_dump_json().encode("utf-8")
+        ).hexdigest()
+        self._parse_requests = SingleFlight()
+        self._aparse_requests = SingleFlight()
+
+        self.trace_exporters = []
+        if config.tracing_config.enabled:
+            self.trace_exporters = create_exporters(config.tracing_config)
+
     @property
     def ontology(self) -> OntologyBase:
         return self.ontology_base
@@ -109,6 +164,10 @@ class MultiChainParser:
         for pparser_name, pparser in self.pparsers.items():
             if pparser_name in active_list:
                 chains_dict[pparser_name] = pparser.chain
+                if self.config.tracing_config.enabled:
+                    chains_dict[pparser_name] = trace_runnable(
+                        pparser.chain, f"chain.{pparser_name}"
+                    )
         assert (
             len(list(chains_dict.keys())) > 0
         ), "Must specify at least one active chain"
@@ -142,11 +201,33 @@ class MultiChainParser:
             if pparser.name in active_list:
                 inst_prompt = pparser.instantiate_prompt(
                     post,
-                    md_dict,
+                    self.fit_metadata_to_budget(post, md_dict, pparser),
                 )
                 inst_prompts.update(inst_prompt)
         return inst_prompts
 
+    def fit_metadata_to_budget(
+        self,
+        post: RefPost,
+        md_dict: Dict[str, RefMetadata],
+        pparser: PostParserChain,
+    ) -> Dict[str, RefMetadata]:
+        """
+        If `pparser` has an input token budget (see
+        `PostParserChain.get_input_token_budget`), return `md_dict` with the
+        metadata of `post` truncated to fit the budget left after the post
+        content.
+        """
+        max_input_tokens = pparser.get_input_token_budget(post)
+        if max_input_tokens is None:
+            return md_dict
+        return fit_post_metadata_to_budget(
+            post,
+            md_dict,
+            max_input_tokens,
+            get_token_counter(self.config.token_budget_config.encoding_name),
+        )
+
     def apply_sci_filter(
         self,
         combined_results: CombinedParserOutput,
@@ -198,26 +279,83 @@ class MultiChainParser:
         self,
         parser_input: ParserInput,
     ) -> PreprocParserInput:
-        return preproc_parser_input(parser_input)
+        # the thread is trimmed once for all chains, to the smallest budget
+        budgets = [
+            pparser.get_input_token_budget(parser_input.thread_post)
+            for pparser in self.get_pparsers()
+        ]
+        budgets = [budget for budget in budgets if budget is not None]
+        return preproc_parser_input(
+            parser_input,
+            self.config.token_budget_config,
+            max_input_tokens=min(budgets) if budgets else None,
+        )
+
+    def start_trace(self, name: str):
+        """
+        Context manager tracing the enclosed code if tracing is enabled.
+        Yields the trace, or None if tracing is disabled.
+        """
+        if not self.config.tracing_config.enabled:
+            return nullcontext()
+        return start_trace(name, self.trace_exporters)
+
+    def add_timings(self, result, trace):
+        # add stage timings of a traced request to its result
+        if trace is not None and isinstance(result, ParserResult):
+            result.metadata["trace_id"] = trace.trace_id
+            result.metadata["timings_ms"] = trace.timings()
+        return result
+
+    def parse_request_key(
+        self,
+        parse_request: Union[ParsePostRequest, Dict],
+        active_list: List[str] = None,
+    ) -> str:
+        return get_parse_request_key(parse_request, active_list, self.config_hash)
 
     def process_parse_request(
         self,
-        parse_request: ParsePostRequest,
+        parse_request: Union[ParsePostRequest, Dict],
         active_list: List[str] = None,
     ):
-        parser_input = convert_parse_request_to_parser_input(parse_request)
-        result = self.process_parser_input(
-            parser_input=parser_input,
-            active_list=active_list,
+        """
+        Process `parse_request`, which can also be passed unvalidated as a dict
+        (see `convert_parse_request_to_parser_input`). If
+        `config.coalesce_requests`, concurrent calls with an identical request
+        wait for the one in flight and get a copy of its result instead of
+        running the chains again.
+        """
+        if not self.config.coalesce_requests:
+            return self._process_parse_request(parse_request, active_list)
+
+        result, shared = self._parse_requests.do(
+            self.parse_request_key(parse_request, active_list),
+            lambda: self._process_parse_request(parse_request, active_list),
         )
-        return result
+        return copy.deepcopy(result) if shared else result
+
+    def _process_parse_request(
+        self,
+        parse_request: Union[ParsePostRequest, Dict],
+        active_list: List[str] = None,
+    ):
+        with self.start_trace("parse_request") as trace:
+            with span("convert_parse_request"):
+                parser_input = convert_parse_request_to_parser_input(parse_request)
+            result = self.process_parser_input(
+                parser_input=parser_input,
+                active_list=active_list,
+            )
+        return self.add_timings(result, trace)
 
     def process_parser_input(
         self,
         parser_input: ParserInput,
         active_list: List[str] = None,
     ):
-        preproc_input = self.preproc_parser_input(parser_input)
+        with span("preprocess"):
+            preproc_input = self.preproc_parser_input(parser_input)
         post = preproc_input.post_to_parse
         res = self.process_ref_post(
             post,
@@ -226,24 +364,140 @@ class MultiChainParser:
         )
         return res
 
+    async def aprocess_parse_request(
+        self,
+        parse_request: Union[ParsePostRequest, Dict],
+        active_list: List[str] = None,
+    ):
+        """
+        Async version of `process_parse_request`. `parse_request` can also be
+        passed unvalidated as a dict, in which case its URLs are resolved
+        asynchronously before validation.
+        """
+        if not self.config.coalesce_requests:
+            return await self._aprocess_parse_request(parse_request, active_list)
+
+        result, shared = await self._aparse_requests.ado(
+            self.parse_request_key(parse_request, active_list),
+            lambda: self._aprocess_parse_request(parse_request, active_list),
+        )
+        return copy.deepcopy(result) if shared else result
+
+    async def _aprocess_parse_request(
+        self,
+        parse_request: Union[ParsePostRequest, Dict],
+        active_list: List[str] = None,
+    ):
+        with self.start_trace("parse_request") as trace:
+            with span("convert_parse_request"):
+                parser_input = await aconvert_parse_request_to_parser_input(
+                    parse_request
+                )
+            result = await self.aprocess_parser_input(
+                parser_input=parser_input,
+                active_list=active_list,
+            )
+        return self.add_timings(result, trace)
+
+    async def aprocess_parser_input(
+        self,
+        parser_input: ParserInput,
+        active_list: List[str] = None,
+    ):
+        with span("preprocess"):
+            preproc_input = self.preproc_parser_input(parser_input)
+        post = preproc_input.post_to_parse
+        res = await self.aprocess_ref_post(
+            post,
+            active_list=active_list,
+            unprocessed_urls=preproc_input.unparsed_urls,
+        )
+        return res
+
     def batch_process_parser_inputs(
         self,
         inputs: List[ParserInput],
         batch_size: int = 5,
         active_list: List[str] = None,
+        return_exceptions: bool = False,
     ):
-        preproc_inputs = [self.preproc_parser_input(p) for p in inputs]
-        posts_batch, batch_unprocessed_urls = zip(
-            *[(p.post_to_parse, p.unparsed_urls) for p in preproc_inputs]
+        return run_coroutine_sync(
+            self.abatch_process_parser_inputs(
+                inputs,
+                batch_size,
+                active_list,
+                return_exceptions,
+            )
         )
-        res = self.batch_process_ref_posts(
-            posts_batch,
+
+    async def abatch_process_parser_inputs(
+        self,
+        inputs: List[ParserInput],
+        batch_size: int = 5,
+        active_list: List[str] = None,
+        return_exceptions: bool = False,
+    ):
+        """
+        Async version of `batch_process_parser_inputs`.
+        Reference metadata for the whole batch is fetched in a single pass
+        before the posts are processed.
+        If `return_exceptions`, an exception raised while processing an input is
+        returned as its result instead of being raised.
+        """
+        results = [None] * len(inputs)
+        input_idxs = []
+        posts = []
+        batch_unprocessed_urls = []
+        for i, parser_input in enumerate(inputs):
+            try:
+                preproc_input = self.preproc_parser_input(parser_input)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[i] = e
+                continue
+            input_idxs.append(i)
+            posts.append(preproc_input.post_to_parse)
+            batch_unprocessed_urls.append(preproc_input.unparsed_urls)
+
+        metadata_cache = await self.aprefetch_metadata(posts, batch_unprocessed_urls)
+
+        processed = await self.abatch_process_ref_posts(
+            posts,
             batch_size,
             active_list,
             batch_unprocessed_urls,
+            return_exceptions=return_exceptions,
+            metadata_cache=metadata_cache,
         )
+        for i, res in zip(input_idxs, processed):
+            results[i] = res
 
-        return res
+        return results
+
+    async def aprefetch_metadata(
+        self,
+        posts: List[RefPost],
+        batch_unprocessed_urls: List[List[str]] = None,
+    ) -> Optional[MetadataCache]:
+        """
+        Fetch metadata of all distinct reference urls of `posts` in a single pass
+        and return the metadata cache holding it, so that processing the posts
+        doesn't fetch it again. If caching is disabled, the metadata is stored
+        in a cache local to the batch.
+        """
+        if (
+            self.config.metadata_extract_config.extraction_method
+            != MetadataExtractionType.CITOID
+        ):
+            return self.metadata_cache
+        ref_urls = get_posts_ref_urls(posts, batch_unprocessed_urls)
+        metadata_cache = self.metadata_cache
+        if metadata_cache is None:
+            metadata_cache = InMemoryMetadataCache(max_entries=max(len(ref_urls), 1))
+        logger.debug(f"Prefetching metadata for {len(ref_urls)} urls...")
+        await afetch_urls_citoid_metadata(ref_urls, cache=metadata_cache)
+        return metadata_cache
 
     def process_ref_post(
         self,
@@ -254,33 +508,88 @@ class MultiChainParser:
         if unprocessed_urls is None:
             unprocessed_urls = []
 
-        md_dict = extract_posts_ref_metadata_dict(
-            [post],
-            self.config.metadata_extract_config.extraction_method,
-            extra_urls=[unprocessed_urls],
-        )
+        with span("extract_metadata"):
+            md_dict = extract_posts_ref_metadata_dict(
+                [post],
+                self.config.metadata_extract_config.extraction_method,
+                extra_urls=[unprocessed_urls],
+                cache=self.metadata_cache,
+                max_summary_length=self.config.metadata_extract_config.max_summary_length,
+            )
         # if no filter specified, run all chains
         if active_list is None:
             active_list = list(self.pparsers.keys())
         logger.debug(f"Processing post with parsers: {active_list}")
 
         logger.debug("Instantiating prompts...")
-        inst_prompts = self.instantiate_prompts(post, md_dict, active_list)
+        with span("instantiate_prompts"):
+            inst_prompts = self.instantiate_prompts(post, md_dict, active_list)
 
         parallel_chain = self.create_parallel_chain(active_list)
 
         logger.debug("Invoking parallel chain...")
-        res = parallel_chain.invoke(inst_prompts)
+        with span("chains"):
+            res = parallel_chain.invoke(inst_prompts)
 
-        post_processed_res = self.post_process_raw_results(
-            post,
-            inst_prompts,
-            res,
-            md_dict,
-            self.ontology,
-            self.config.post_process_type,
-            unprocessed_urls,
-        )
+        with span("post_process"):
+            post_processed_res = self.post_process_raw_results(
+                post,
+                inst_prompts,
+                res,
+                md_dict,
+                self.ontology,
+                self.config.post_process_type,
+                unprocessed_urls,
+            )
+
+        return post_processed_res
+
+    async def aprocess_ref_post(
+        self,
+        post: RefPost,
+        active_list: List[str] = None,
+        unprocessed_urls: List[str] = None,
+        config: RunnableConfig = None,
+    ):
+        """
+        Async version of `process_ref_post`.
+        """
+        if unprocessed_urls is None:
+            unprocessed_urls = []
+
+        with span("extract_metadata"):
+            md_dict = await aextract_posts_ref_metadata_dict(
+                [post],
+                self.config.metadata_extract_config.extraction_method,
+                extra_urls=[unprocessed_urls],
+                cache=self.metadata_cache,
+                max_summary_length=self.config.metadata_extract_config.max_summary_length,
+            )
+        # if no filter specified, run all chains
+        if active_list is None:
+            active_list = list(self.pparsers.keys())
+        logger.debug(f"Processing post with parsers: {active_list}")
+
+        logger.debug("Instantiating prompts...")
+        with span("instantiate_prompts"):
+            inst_prompts = self.instantiate_prompts(post, md_dict, active_list)
+
+        parallel_chain = self.create_parallel_chain(active_list)
+
+        logger.debug("Invoking parallel chain...")
+        with span("chains"):
+            res = await parallel_chain.ainvoke(inst_prompts, config=config)
+
+        with span("post_process"):
+            post_processed_res = self.post_process_raw_results(
+                post,
+                inst_prompts,
+                res,
+                md_dict,
+                self.ontology,
+                self.config.post_process_type,
+                unprocessed_urls,
+            )
 
         return post_processed_res
 
@@ -304,64 +613,154 @@ class MultiChainParser:
         Returns:
             List[Dict]: list of processed results
         """
-        if batch_unprocessed_urls is None:
-            batch_unprocessed_urls = [[] for _ in inputs]
-
-        # extract all posts metadata
-        md_dict = extract_posts_ref_metadata_dict(
-            inputs,
-            self.config.metadata_extract_config.extraction_method,
-            extra_urls=batch_unprocessed_urls,
+        return run_coroutine_sync(
+            self.abatch_process_ref_posts(
+                inputs,
+                batch_size,
+                active_list,
+                batch_unprocessed_urls,
+            )
         )
 
+    async def abatch_process_ref_posts(
+        self,
+        inputs: List[RefPost],
+        batch_size: int = 5,
+        active_list: List[str] = None,
+        batch_unprocessed_urls: List[List[str]] = None,
+        return_exceptions: bool = False,
+        metadata_cache: Optional[MetadataCache] = None,
+    ) -> List:
+        """Async version of `batch_process_ref_posts`.
+        Posts go through the pipeline of `astream_process_ref_posts`, with
+        at most `batch_size` posts processed by the LLM chains concurrently.
+
+        Args:
+            inputs (List[RefPost]): input RefPosts.
+            batch_size (int): maximum number of concurrent calls to make. Defaults to 5.
+            return_exceptions (bool): if True, exceptions raised while processing a post
+            are returned as its result instead of being raised.
+            metadata_cache (MetadataCache, optional): cache to read reference metadata
+            from. Defaults to `self.metadata_cache`.
+
+        Returns:
+            List: list of processed results, in the order of `inputs`
+        """
         if active_list is None:
             active_list = list(self.pparsers.keys())
-        logger.debug(f"Processing {len(inputs)} posts with parsers: {active_list}")
-
-        logger.debug("Instantiating prompts...")
-        inst_prompts = [
-            self.instantiate_prompts(post, md_dict, active_list) for post in inputs
-        ]
 
-        # create runnable parallel
         # setup async batch job
         total_iterations = len(inputs) * len(
             active_list
         )  # number of parsers * total inputs
         cb = BatchCallback(total_iterations)  # init callback
-        config = RunnableConfig(max_concurrency=batch_size, callbacks=[cb])
-        parallel_chain = self.create_parallel_chain(active_list)
-
-        logger.debug("Invoking parallel chain...")
-
-        results = asyncio.run(
-            parallel_chain.abatch(
-                inst_prompts,
-                config=config,
-            )
+        pipeline_config = self.config.pipeline_config.model_copy(
+            update={"llm_concurrency": batch_size}
         )
-        cb.progress_bar.close()
 
-        # post processing results
-        logger.debug(f"Post processing {len(results)} results...")
-        post_processed_results = []
-        for post, result, prompts_dict, unproc_urls in zip(
+        post_processed_results = [None] * len(inputs)
+        async for i, result in self.astream_process_ref_posts(
             inputs,
-            results,
-            inst_prompts,
+            active_list,
             batch_unprocessed_urls,
+            pipeline_config=pipeline_config,
+            return_exceptions=return_exceptions,
+            callbacks=[cb],
+            metadata_cache=metadata_cache,
         ):
-            post_processed_res = self.post_process_raw_results(
+            post_processed_results[i] = result
+        cb.progress_bar.close()
+
+        logger.debug("Done!")
+
+        return post_processed_results
+
+    async def astream_process_ref_posts(
+        self,
+        inputs: List[RefPost],
+        active_list: List[str] = None,
+        batch_unprocessed_urls: List[List[str]] = None,
+        pipeline_config: PipelineConfig = None,
+        return_exceptions: bool = False,
+        callbacks: List = None,
+        metadata_cache: Optional[MetadataCache] = None,
+    ) -> AsyncIterator[Tuple[int, Any]]:
+        """
+        Process `inputs` as a pipeline of stages (metadata extraction, prompt
+        instantiation, LLM chains, post processing) connected by bounded queues.
+        A post moves on to the next stage as soon as it is done with the current
+        one, so eg a slow metadata lookup only delays its own post.
+        Yields `(index, result)` pairs as posts finish, where `index` is the
+        position of the post in `inputs`.
+
+        Args:
+            inputs (List[RefPost]): input RefPosts.
+            active_list (List[str], optional): chains to run. Defaults to all chains.
+            batch_unprocessed_urls (List[List[str]], optional): unprocessed urls per post.
+            pipeline_config (PipelineConfig, optional): per stage concurrency and
+            queue sizes. Defaults to `self.config.pipeline_config`.
+            return_exceptions (bool): if True, yield exceptions raised while processing
+            a post as its result instead of raising them.
+            callbacks (List, optional): callbacks passed to the chains.
+            metadata_cache (MetadataCache, optional): cache to read reference metadata
+            from. Defaults to `self.metadata_cache`.
+        """
+        if metadata_cache is None:
+            metadata_cache = self.metadata_cache
+        if batch_unprocessed_urls is None:
+            batch_unprocessed_urls = [[] for _ in inputs]
+        if active_list is None:
+            active_list = list(self.pparsers.keys())
+        if pipeline_config is None:
+            pipeline_config = self.config.pipeline_config
+        logger.debug(f"Streaming {len(inputs)} posts with parsers: {active_list}")
+
+        parallel_chain = self.create_parallel_chain(active_list)
+        config = RunnableConfig(callbacks=callbacks or [])
+
+        async def extract_metadata(item):
+            post, unproc_urls = item
+            md_dict = await aextract_posts_ref_metadata_dict(
+                [post],
+                self.config.metadata_extract_config.extraction_method,
+                extra_urls=[unproc_urls],
+                cache=metadata_cache,
+                max_summary_length=self.config.metadata_extract_config.max_summary_length,
+            )
+            return post, unproc_urls, md_dict
+
+        async def instantiate_prompts(item):
+            post, unproc_urls, md_dict = item
+            inst_prompts = self.instantiate_prompts(post, md_dict, active_list)
+            return post, unproc_urls, md_dict, inst_prompts
+
+        async def run_chains(item):
+            post, unproc_urls, md_dict, inst_prompts = item
+            res = await parallel_chain.ainvoke(inst_prompts, config=config)
+            return post, unproc_urls, md_dict, inst_prompts, res
+
+        async def post_process(item):
+            post, unproc_urls, md_dict, inst_prompts, res = item
+            return self.post_process_raw_results(
                 post,
-                prompts_dict,
-                result,
+                inst_prompts,
+                res,
                 md_dict,
                 self.ontology,
                 self.config.post_process_type,
                 unproc_urls,
             )
-            post_processed_results.append(post_processed_res)
 
-        logger.debug("Done!")
-
-        return post_processed_results
+        stages = [
+            (extract_metadata, pipeline_config.metadata_concurrency),
+            (instantiate_prompts, pipeline_config.prompt_concurrency),
+            (run_chains, pipeline_config.llm_concurrency),
+            (post_process, pipeline_config.postprocess_concurrency),
+        ]
+        async for i, result in apipeline(
+            zip(inputs, batch_unprocessed_urls),
+            stages,
+            queue_size=pipeline_config.queue_size,
+            return_exceptions=return_exceptions,
+        ):
+            yield i, result
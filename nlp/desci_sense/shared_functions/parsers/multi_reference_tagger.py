@@ -1,8 +1,6 @@
 from typing import Dict, List
 from loguru import logger
-import re
 from operator import itemgetter
-from langchain.prompts import PromptTemplate
 from langchain_core.runnables import RunnableLambda
 
 from .post_parser_chain import PostParserChain
@@ -12,7 +10,6 @@ from ..configs import (
     MultiParserChainConfig,
     ParserChainType,
 )
-from ..utils import find_json_object
 from ..schema.post import RefPost
 from ..prompting.jinja.multi_ref.zero_ref_template import zero_ref_template
 from ..prompting.jinja.multi_ref.single_ref_template import single_ref_template
@@ -25,6 +22,7 @@ from ..web_extractors.metadata_extractors import (
 )
 from ..postprocessing import ParserChainOutput, Answer, SubAnswer
 from ..postprocessing.output_processors import PydanticAnswerParser
+from ..postprocessing.term_matcher import clean_term, get_term_matcher
 from ..schema.ontology_base import OntologyBase
 from ..enum_dict import EnumDict, EnumDictKey
 
@@ -35,6 +33,19 @@ class PromptCase(EnumDictKey):
     MULTI_REF = "MULTI_REF"
 
 
+def get_prompt_case(post: RefPost) -> PromptCase:
+    """
+    Return the prompt case of `post`, by the number of external references
+    it mentions.
+    """
+    num_refs = len(post.md_ref_urls())
+    if num_refs == 0:
+        return PromptCase.ZERO_REF
+    if num_refs == 1:
+        return PromptCase.SINGLE_REF
+    return PromptCase.MULTI_REF
+
+
 def return_fallback(input):
     return ParserChainOutput(
         answer=Answer(sub_answers=list(), debug={"errors": "fallback"}),
@@ -44,31 +55,16 @@ def return_fallback(input):
 
 
 def check_equivalence(string1, string2):
-    # Function to remove non-alphabetic characters from a string
-    def clean_string(s):
-        return re.sub(r"[^a-zA-Z]", "", s)
-
-    # Clean both strings
-    cleaned_string1 = clean_string(string1)
-    cleaned_string2 = clean_string(string2)
-
-    # Compare cleaned strings
-    return cleaned_string1 == cleaned_string2
+    # compare strings with non-alphabetic characters removed
+    return clean_term(string1) == clean_term(string2)
 
 
 def normalize_labels(answer: Answer, allowed_terms: List[str]) -> Answer:
+    term_matcher = get_term_matcher(allowed_terms)
     for sub_answer in answer.sub_answers:
-        # list of normalized labels
-        normalized_labels = []
-
-        for term in allowed_terms:
-            for pred_label in sub_answer.final_answer:
-                # check if normalized term present in predicted label (eg "endorses" in "<endorses>")
-                if check_equivalence(term, pred_label):
-                    normalized_labels.append(term)
-
         # replace raw model labels with normalized labels
-        sub_answer.final_answer = normalized_labels
+        # (eg "endorses" for "<endorses>")
+        sub_answer.final_answer = term_matcher.normalize(sub_answer.final_answer)
 
     return answer
 
@@ -233,16 +229,14 @@ class MultiRefTaggerParserChain(PostParserChain):
     ):
         super().__init__(parser_config, global_config, ontology)
 
-        self.input_prompt = PromptTemplate.from_template(self.input_key)
+        self.input_prompt = self.create_input_prompt()
         self._allowed_terms_name = f"{self.input_name}_allowed_terms"
         self.pydantic_parser = PydanticAnswerParser(pydantic_object=Answer)
 
         self.runnable_fallback = RunnableLambda(return_fallback)
 
         # init chains
-        llm_chain = (
-            self.input_prompt | self.model | find_json_object | self.pydantic_parser
-        )
+        llm_chain = self.input_prompt | self.model | self.pydantic_parser
 
         self._chain = {
             "answer_chain": llm_chain,
@@ -256,7 +250,8 @@ class MultiRefTaggerParserChain(PostParserChain):
 
     @property
     def chain(self):
-        return self._chain.with_retry().with_fallbacks([self.runnable_fallback])
+        chain = self.with_output_retry(self._chain)
+        return chain.with_fallbacks([self.runnable_fallback])
 
     @property
     def allowed_terms_name(self) -> str:
@@ -274,9 +269,9 @@ class MultiRefTaggerParserChain(PostParserChain):
 
         # configure zero ref case
         prompt_case_dict[PromptCase.ZERO_REF] = {
-            "labels": ontology.get_valid_templates(
-                subject_type="post", object_type="nan", as_dict=False
-            ).label.to_list(),
+            "labels": ontology.get_valid_labels(
+                subject_type="post", object_type="nan"
+            ),
             "type_templates": ontology.get_valid_templates(
                 subject_type="post", object_type="nan"
             ),
@@ -286,9 +281,9 @@ class MultiRefTaggerParserChain(PostParserChain):
 
         # configure single ref case
         prompt_case_dict[PromptCase.SINGLE_REF] = {
-            "labels": ontology.get_valid_templates(
-                subject_type="post", object_type="ref", as_dict=False
-            ).label.to_list(),
+            "labels": ontology.get_valid_labels(
+                subject_type="post", object_type="ref"
+            ),
             "type_templates": ontology.get_valid_templates(
                 subject_type="post", object_type="ref"
             ),
@@ -301,9 +296,9 @@ class MultiRefTaggerParserChain(PostParserChain):
         # configure multi ref case
         # TODO update to handle relations - meanwhile placeholder based on single refs
         prompt_case_dict[PromptCase.MULTI_REF] = {
-            "labels": ontology.get_valid_templates(
-                subject_type="post", object_type="ref", as_dict=False
-            ).label.to_list(),
+            "labels": ontology.get_valid_labels(
+                subject_type="post", object_type="ref"
+            ),
             "type_templates": ontology.get_valid_templates(
                 subject_type="post", object_type="ref"
             ),
@@ -313,6 +308,10 @@ class MultiRefTaggerParserChain(PostParserChain):
             "prompt_j2_template"
         ] = multi_ref_template
 
+        # compile allowed labels matchers once per prompt case
+        for case_dict in prompt_case_dict.values():
+            get_term_matcher(case_dict["labels"])
+
         self.prompt_case_dict = prompt_case_dict
 
     def instantiate_prompt(
@@ -331,18 +330,7 @@ class MultiRefTaggerParserChain(PostParserChain):
             metadata_list = []
 
         # check how many external references post mentions
-        if len(post.md_ref_urls()) == 0:
-            case = PromptCase.ZERO_REF
-
-        else:
-            # at least one external reference
-            if len(post.md_ref_urls()) == 1:
-                case = PromptCase.SINGLE_REF
-                # if metadata flag is active, retreive metadata
-
-            else:
-                case = PromptCase.MULTI_REF
-                # TODO finish
+        case = get_prompt_case(post)
 
         # create prompts
         prompt = self.create_semantics_prompt_by_case(
@@ -352,7 +340,7 @@ class MultiRefTaggerParserChain(PostParserChain):
         )
 
         full_prompt = {
-            self.input_name: prompt,
+            **self.prompt_inputs(prompt, self.get_prompt_prefix(post)),
             self.allowed_terms_name: self.prompt_case_dict[case]["labels"],
             "ref_metadata": metadata_list,  # TODO this might get overriden by other chains
             "ref_urls": post.md_ref_urls(),
@@ -360,6 +348,17 @@ class MultiRefTaggerParserChain(PostParserChain):
 
         return full_prompt
 
+    def get_static_prompt_prefix(self, post: RefPost) -> str:
+        case = get_prompt_case(post)
+        rendered_instructions = self.post_renderer.render_instructions(post)
+        return self.render_prompt_prefix(
+            (case, rendered_instructions),
+            self.prompt_case_dict[case]["prompt_j2_template"],
+            ["rendered_post"],
+            type_templates=self.prompt_case_dict[case]["type_templates"],
+            ref_metadata_instructions=rendered_instructions,
+        )
+
     def create_semantics_prompt_by_case(
         self,
         post: RefPost,
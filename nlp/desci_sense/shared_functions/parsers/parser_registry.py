@@ -0,0 +1,72 @@
+import threading
+from typing import Callable, Dict, Hashable, List
+
+from loguru import logger
+
+from .multi_chain_parser import MultiChainParser
+from ..configs import MultiParserChainConfig
+
+
+class ParserRegistry:
+    """
+    Process-wide registry of initialized `MultiChainParser`s.
+
+    Building a `MultiChainParser` is expensive (ontology dataframes, post renderers
+    and one LLM client per chain), so parsers are built once per key and then shared
+    across threads and concurrent requests. A shared parser must be treated as
+    read-only by callers (e.g., do not call `set_md_extract_method` on it).
+    """
+
+    def __init__(self) -> None:
+        self._parsers: Dict[Hashable, MultiChainParser] = {}
+        self._lock = threading.Lock()
+        # per-key locks so that building one parser doesn't block lookups of others
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+
+    def _get_key_lock(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def get_or_create(
+        self,
+        key: Hashable,
+        config_factory: Callable[[], MultiParserChainConfig],
+    ) -> MultiChainParser:
+        """
+        Return the parser registered under `key`, building it from
+        `config_factory()` if it does not exist yet. Concurrent callers asking
+        for the same missing key wait for a single build.
+        """
+        parser = self._parsers.get(key)
+        if parser is not None:
+            return parser
+
+        with self._get_key_lock(key):
+            # check again, another thread might have built it while we waited
+            parser = self._parsers.get(key)
+            if parser is None:
+                logger.info(f"Building new MultiChainParser for registry key {key}")
+                parser = MultiChainParser(config_factory())
+                self._parsers[key] = parser
+
+        return parser
+
+    def keys(self) -> List[Hashable]:
+        return list(self._parsers.keys())
+
+    def clear(self):
+        with self._lock:
+            self._parsers.clear()
+            self._key_locks.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._parsers
+
+    def __len__(self) -> int:
+        return len(self._parsers)
+
+
+# default registry shared by the whole process
+parser_registry = ParserRegistry()
@@ -1,8 +1,12 @@
 from abc import ABC, abstractmethod
-from typing import Dict
+from typing import Any, Dict, Iterable, Optional
 from loguru import logger
+from jinja2 import Template
 from langchain.prompts import PromptTemplate
+from langchain_core.exceptions import OutputParserException
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableLambda
 
 from ..schema.post import RefPost
 from ..web_extractors.metadata_extractors import RefMetadata
@@ -12,9 +16,20 @@ from ..configs import (
     MultiParserChainConfig,
 )
 from ..prompting.post_renderers import post_renderer_factory
+from ..prompting.prompt_layout import PromptPrefixCache, assemble_prompt
+from ..preprocessing.token_budget import get_token_counter
 from ..schema.helpers import convert_text_to_ref_post
 from ..schema.ontology_base import OntologyBase
 from . import create_model
+from .hedging import HedgedChatModel
+from .llm_cache import get_llm_cache
+from .model_limits import LimitedChatOpenAI
+
+# errors raised while parsing model outputs (eg invalid JSON), the only errors
+# chains over rate limited or hedged models retry: model errors (eg
+# `ModelUnavailableError` or `openai.APIError`) are retried by the model where
+# that helps and fall back right away otherwise
+OUTPUT_PARSING_ERRORS = (OutputParserException, ValueError, KeyError)
 
 
 class PostParserChain(ABC):
@@ -32,12 +47,20 @@ class PostParserChain(ABC):
         # init post renderer
         self._post_renderer = post_renderer_factory(self.parser_config.post_renderer)
 
+        # static prompt prefixes, used if `prefix_stable_prompt` is set
+        self._prompt_prefixes = PromptPrefixCache()
+
         # create model from configs
         # join kw args in single dict
+        llm_config = self.parser_config.llm_config
         kw_args = {
-            **self.parser_config.llm_config.model_dump(),
+            **llm_config.model_dump(exclude={"use_cache"}),
             **self.global_config.openrouter_api_config.model_dump_all(),
+            "rate_limit_config": self.global_config.llm_rate_limit_config,
+            "hedge_config": self.parser_config.hedge_config,
         }
+        if llm_config.use_cache:
+            kw_args["cache"] = get_llm_cache(self.global_config.llm_cache_config)
         self._model = create_model(**kw_args)
 
         # simple chat chain for debug purposes
@@ -87,6 +110,98 @@ class PostParserChain(ABC):
     def input_name(self) -> str:
         return self.parser_config.name + "_input"
 
+    @property
+    def prefix_name(self) -> str:
+        """
+        Name of the chain input holding the static prefix of the prompt.
+        """
+        return self.parser_config.name + "_prompt_prefix"
+
+    def render_prompt_prefix(
+        self,
+        key: Any,
+        template: Template,
+        dynamic_vars: Iterable[str],
+        **static_vars: Any,
+    ) -> str:
+        """
+        Return the static prefix of prompts rendered from `template` for
+        prompt case `key` (see `prompting.prompt_layout.render_prompt_prefix`),
+        rendered once per key.
+        """
+        return self._prompt_prefixes.get(key, template, dynamic_vars, **static_vars)
+
+    def get_static_prompt_prefix(self, post: RefPost) -> str:
+        """
+        Return the static prefix (instructions, tag types, output format) of
+        this chain's prompt for `post`, whether or not it is sent separately.
+        Chains that don't prompt a model have none.
+        """
+        return ""
+
+    def get_prompt_prefix(self, post: RefPost) -> str:
+        """
+        Return the static prefix sent separately from the rest of the prompt
+        for `post`, or an empty string if `prefix_stable_prompt` isn't set.
+        """
+        if not self.parser_config.prefix_stable_prompt:
+            return ""
+        return self.get_static_prompt_prefix(post)
+
+    def get_input_token_budget(self, post: RefPost) -> Optional[int]:
+        """
+        Return the token budget of the post content and reference metadata in
+        this chain's prompt for `post`: `max_prompt_tokens` minus the tokens of
+        the static prompt prefix if the chain sets it, the global
+        `TokenBudgetConfig.max_input_tokens` otherwise (None if not set).
+        """
+        budget_config = self.global_config.token_budget_config
+        max_prompt_tokens = self.parser_config.max_prompt_tokens
+        if max_prompt_tokens is None:
+            return budget_config.max_input_tokens
+        counter = get_token_counter(budget_config.encoding_name)
+        prefix_tokens = counter.count(self.get_static_prompt_prefix(post))
+        return max(max_prompt_tokens - prefix_tokens, 0)
+
+    def prompt_inputs(self, prompt: str, prefix: str = "") -> Dict[str, str]:
+        """
+        Chain inputs for the instantiated `prompt`, starting with the
+        static `prefix`.
+        """
+        inputs = {self.input_name: prompt}
+        if prefix:
+            inputs[self.prefix_name] = prefix
+        return inputs
+
+    def assemble_input_prompt(self, inputs: Dict) -> PromptValue:
+        return assemble_prompt(
+            inputs[self.input_name],
+            inputs.get(self.prefix_name, ""),
+            cache_control=self.parser_config.prompt_cache_control,
+        )
+
+    def create_input_prompt(self) -> Runnable:
+        """
+        Return the runnable converting the chain inputs to the model input.
+        """
+        return RunnableLambda(self.assemble_input_prompt)
+
+    def with_output_retry(
+        self, chain: Runnable, stop_after_attempt: int = 3
+    ) -> Runnable:
+        """
+        Return `chain` retried on output parsing errors (`OUTPUT_PARSING_ERRORS`).
+        Chains over a plain model also retry model errors, as the model has
+        no rate limits or circuit breaker handling them.
+        """
+        retry_errors = (Exception,)
+        if isinstance(self.model, (LimitedChatOpenAI, HedgedChatModel)):
+            retry_errors = OUTPUT_PARSING_ERRORS
+        return chain.with_retry(
+            retry_if_exception_type=retry_errors,
+            stop_after_attempt=stop_after_attempt,
+        )
+
     def process_text(self, text: str) -> ParserChainOutput:
         post = convert_text_to_ref_post(text)
         return self.process_ref_post(post)
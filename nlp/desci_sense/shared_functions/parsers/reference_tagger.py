@@ -3,6 +3,7 @@ from operator import itemgetter
 from langchain_core.runnables import RunnableLambda
 
 from .allowed_terms_pparser import AllowedTermsPParserChain
+from ..postprocessing.term_matcher import get_term_matcher
 from ..configs import RefTaggerChainConfig, MultiParserChainConfig
 from ..schema.post import RefPost
 from ..prompting.jinja.zero_ref_template import zero_ref_template
@@ -34,6 +35,19 @@ class PromptCase(EnumDictKey):
     MULTI_REF = "MULTI_REF"
 
 
+def get_prompt_case(post: RefPost) -> PromptCase:
+    """
+    Return the prompt case of `post`, by the number of external references
+    it mentions.
+    """
+    num_refs = len(post.md_ref_urls())
+    if num_refs == 0:
+        return PromptCase.ZERO_REF
+    if num_refs == 1:
+        return PromptCase.SINGLE_REF
+    return PromptCase.MULTI_REF
+
+
 def normalize_references(
     parser_output: ParserChainOutput, ref_urls: List[str]
 ) -> ParserChainOutput:
@@ -93,7 +107,8 @@ class ReferenceTaggerParserChain(AllowedTermsPParserChain):
 
     @property
     def chain(self):
-        return self.ref_tag_chain.with_retry().with_fallbacks([self.runnable_fallback])
+        chain = self.with_output_retry(self.ref_tag_chain)
+        return chain.with_fallbacks([self.runnable_fallback])
 
     def process_ref_post(
         self,
@@ -107,9 +122,9 @@ class ReferenceTaggerParserChain(AllowedTermsPParserChain):
 
         # configure zero ref case
         prompt_case_dict[PromptCase.ZERO_REF] = {
-            "labels": ontology.get_valid_templates(
-                subject_type="post", object_type="nan", as_dict=False
-            ).label.to_list(),
+            "labels": ontology.get_valid_labels(
+                subject_type="post", object_type="nan"
+            ),
             "type_templates": ontology.get_valid_templates(
                 subject_type="post", object_type="nan"
             ),
@@ -119,9 +134,9 @@ class ReferenceTaggerParserChain(AllowedTermsPParserChain):
 
         # configure single ref case
         prompt_case_dict[PromptCase.SINGLE_REF] = {
-            "labels": ontology.get_valid_templates(
-                subject_type="post", object_type="ref", as_dict=False
-            ).label.to_list(),
+            "labels": ontology.get_valid_labels(
+                subject_type="post", object_type="ref"
+            ),
             "type_templates": ontology.get_valid_templates(
                 subject_type="post", object_type="ref"
             ),
@@ -134,9 +149,9 @@ class ReferenceTaggerParserChain(AllowedTermsPParserChain):
         # configure multi ref case
         # TODO update to handle relations - meanwhile placeholder based on single refs
         prompt_case_dict[PromptCase.MULTI_REF] = {
-            "labels": ontology.get_valid_templates(
-                subject_type="post", object_type="ref", as_dict=False
-            ).label.to_list(),
+            "labels": ontology.get_valid_labels(
+                subject_type="post", object_type="ref"
+            ),
             "type_templates": ontology.get_valid_templates(
                 subject_type="post", object_type="ref"
             ),
@@ -146,6 +161,10 @@ class ReferenceTaggerParserChain(AllowedTermsPParserChain):
             "prompt_j2_template"
         ] = multi_ref_template
 
+        # compile allowed labels matchers once per prompt case
+        for case_dict in prompt_case_dict.values():
+            get_term_matcher(case_dict["labels"])
+
         self.prompt_case_dict = prompt_case_dict
 
     def instantiate_prompt(
@@ -164,18 +183,7 @@ class ReferenceTaggerParserChain(AllowedTermsPParserChain):
             metadata_list = []
 
         # check how many external references post mentions
-        if len(post.md_ref_urls()) == 0:
-            case = PromptCase.ZERO_REF
-
-        else:
-            # at least one external reference
-            if len(post.md_ref_urls()) == 1:
-                case = PromptCase.SINGLE_REF
-                # if metadata flag is active, retreive metadata
-
-            else:
-                case = PromptCase.MULTI_REF
-                # TODO finish
+        case = get_prompt_case(post)
 
         # create prompts
         prompt = self.create_semantics_prompt_by_case(
@@ -185,13 +193,22 @@ class ReferenceTaggerParserChain(AllowedTermsPParserChain):
         )
 
         full_prompt = {
-            self.input_name: prompt,
+            **self.prompt_inputs(prompt, self.get_prompt_prefix(post)),
             self.allowed_terms_name: self.prompt_case_dict[case]["labels"],
             "ref_urls": post.md_ref_urls(),
         }
 
         return full_prompt
 
+    def get_static_prompt_prefix(self, post: RefPost) -> str:
+        case = get_prompt_case(post)
+        return self.render_prompt_prefix(
+            case,
+            self.prompt_case_dict[case]["prompt_j2_template"],
+            ["author_name", "content", "references_metadata"],
+            type_templates=self.prompt_case_dict[case]["type_templates"],
+        )
+
     def create_semantics_prompt_by_case(
         self,
         post: RefPost,
@@ -52,9 +52,8 @@ class TopicsParserChain(AllowedTermsPParserChain):
 
     @property
     def chain(self):
-        return self._chain.with_retry(stop_after_attempt=5).with_fallbacks(
-            [self.runnable_fallback]
-        )
+        chain = self.with_output_retry(self._chain, stop_after_attempt=5)
+        return chain.with_fallbacks([self.runnable_fallback])
 
     def process_ref_post(
         self,
@@ -84,12 +83,20 @@ class TopicsParserChain(AllowedTermsPParserChain):
         )
 
         full_prompt = {
-            self.input_name: prompt,
+            **self.prompt_inputs(prompt, self.get_prompt_prefix(post)),
             self.allowed_terms_name: ALLOWED_TOPICS,
         }
 
         return full_prompt
 
+    def get_static_prompt_prefix(self, post: RefPost) -> str:
+        return self.render_prompt_prefix(
+            None,
+            self.topics_template,
+            ["rendered_post"],
+            topics=ALLOWED_TOPICS,
+        )
+
     def create_topics_prompt(
         self,
         post: RefPost,
@@ -18,6 +18,7 @@ from ..interface import (
 
 from ..configs import ParserChainType, PostProcessType
 from ..filters import SciFilterClassfication
+from ..triples import TripleList
 from ..schema.ontology_base import OntologyBase
 from ..schema.post import RefPost, ThreadRefPost
 from ..web_extractors.metadata_extractors import (
@@ -528,6 +529,11 @@ def convert_triplets_to_graph(triplets: List[RDFTriplet]) -> Graph:
     return g
 
 
+def convert_triplets_to_triple_list(triplets: List[RDFTriplet]) -> TripleList:
+    """Convert list of rdf triplets to a `TripleList` (no rdflib graph is built)"""
+    return TripleList(t.to_tuple() for t in triplets)
+
+
 def convert_raw_output_to_queue_format(
     outputs: List[dict], md_list: Dict[str, RefMetadata]
 ):
@@ -658,7 +664,7 @@ def post_process_firebase(
     )
 
     # convert triplets to graph
-    graph = convert_triplets_to_graph(triplets)
+    graph = convert_triplets_to_triple_list(triplets)
 
     # add keywords to graph
     if keywords:
@@ -14,8 +14,13 @@ from langchain_core.pydantic_v1 import ValidationError
 
 from . import ParserChainOutput, Answer
 from ..configs import ParserChainType, PostProcessType
+from ..utils import extract_json_object
 
-ALLOWED_TERMS_DELIMITER = "##Allowed terms: "
+from .term_matcher import (
+    ALLOWED_TERMS_DELIMITER,
+    get_term_matcher,
+    get_term_matcher_from_text,
+)
 
 # https://stackoverflow.com/questions/265960/best-way-to-strip-punctuation-from-a-string
 PUNCTUATION_CHARS = "".join(set(string.punctuation))
@@ -97,13 +102,7 @@ def extract_tags(input_text: str, tags: List[str]) -> List[str]:
     Returns:
     List[str]: A list of tags found in the input text, in the order of their occurrence.
     """
-    pattern = "|".join(map(re.escape, tags))
-    found_tags = re.findall(pattern, input_text.lower())
-
-    # make sure tags are unique
-    unique_found_tags = list(set(found_tags))
-
-    return unique_found_tags
+    return get_term_matcher(tags).extract(input_text)
 
 
 class TagTypeParser(BaseOutputParser):
@@ -347,11 +346,12 @@ class AllowedTermsParser(BaseOutputParser):
             + candidate_tags.strip()
         )
 
-        # extract list of allowed tags
-        allowed_tags = extract_tags_list(text)
+        # get matcher for list of allowed tags (compiled once per list)
+        term_matcher = get_term_matcher_from_text(text)
+        allowed_tags = list(term_matcher.terms)
 
         # force final answer to conform to closed set of allowed tags
-        multi_tags = extract_tags(final_answer, allowed_tags)
+        multi_tags = term_matcher.extract(final_answer)
 
         # if we only want to choose single tag - take first
         # single_tag = multi_tags[:1]
@@ -380,15 +380,18 @@ class AllowedTermsParser(BaseOutputParser):
 
 class PydanticAnswerParser(PydanticOutputParser):
     """
-    Wrapper for PydanticOutputParser that handles json decoding exceptions and returns
-    a default Answer if there are errors.
+    Wrapper for PydanticOutputParser that extracts the JSON object from the completion,
+    handles json decoding exceptions and returns a default Answer if there are errors.
     """
 
     def parse_result(
         self, result: List[Generation], *, partial: bool = False
     ) -> Answer:
         try:
-            return super().parse_result(result, partial=partial)
+            # extract JSON object from the completion in a single pass
+            # (tolerates surrounding text, comments and trailing commas)
+            json_object = extract_json_object(result[0].text)
+            return self._parse_obj(json_object)
         except (ValidationError, ValueError) as e:
             err_msg = traceback.format_exc()
             logger.warning(f"Failed to parse result: {str(e)}")
@@ -0,0 +1,97 @@
+"""
+Matching of model outputs against a closed set of allowed terms (eg ontology
+labels of a prompt case). Matchers are compiled once per set of terms and
+shared by all parses using it.
+"""
+
+from ast import literal_eval
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+import re
+
+ALLOWED_TERMS_DELIMITER = "##Allowed terms: "
+
+ALLOWED_TERMS_LIST_PATTERN = re.compile(re.escape(ALLOWED_TERMS_DELIMITER) + r"(\[.*?\])")
+
+NON_ALPHA_PATTERN = re.compile(r"[^a-zA-Z]")
+
+
+def clean_term(term: str) -> str:
+    """
+    Normalized form of `term` used to compare labels, eg "<endorses>" -> "endorses".
+    """
+    return NON_ALPHA_PATTERN.sub("", term)
+
+
+class TermMatcher:
+    """
+    Precompiled matcher for a list of allowed terms.
+    `extract` finds the terms occurring in a text in a single scan of the text,
+    using one compiled alternation of all terms. `normalize` maps predicted
+    labels to allowed terms through a normalized form -> terms dict.
+    """
+
+    def __init__(self, terms: Sequence[str]) -> None:
+        self.terms: Tuple[str, ...] = tuple(terms)
+        self._pattern = (
+            re.compile("|".join(map(re.escape, self.terms))) if self.terms else None
+        )
+        self._clean_terms = [clean_term(term) for term in self.terms]
+
+        # different terms may share a normalized form
+        self.normalized_terms: Dict[str, List[str]] = {}
+        for term, cleaned in zip(self.terms, self._clean_terms):
+            self.normalized_terms.setdefault(cleaned, []).append(term)
+
+    def extract(self, text: str) -> List[str]:
+        """
+        Return the unique terms appearing in (lower cased) `text`, in order
+        of first occurrence. Terms may be substrings of other words.
+        """
+        if self._pattern is None:
+            return []
+        return list(dict.fromkeys(self._pattern.findall(text.lower())))
+
+    def normalize(self, labels: List[str]) -> List[str]:
+        """
+        Return the allowed terms equivalent to `labels` (equal up to non
+        alphabetic characters, eg "<endorses>" for "endorses"), in the order of
+        the allowed terms. A term appears once for each equivalent label.
+        """
+        counts = Counter(clean_term(label) for label in labels)
+        if not counts:
+            return []
+        return [
+            term
+            for term, cleaned in zip(self.terms, self._clean_terms)
+            for _ in range(counts.get(cleaned, 0))
+        ]
+
+
+@lru_cache(maxsize=256)
+def _get_term_matcher(terms: Tuple[str, ...]) -> TermMatcher:
+    return TermMatcher(terms)
+
+
+def get_term_matcher(terms: Sequence[str]) -> TermMatcher:
+    """
+    Return the shared matcher for `terms`, compiling it on first use.
+    """
+    return _get_term_matcher(tuple(terms))
+
+
+@lru_cache(maxsize=256)
+def _get_term_matcher_from_list_str(list_str: str) -> TermMatcher:
+    return get_term_matcher(literal_eval(list_str))
+
+
+def get_term_matcher_from_text(text: str) -> TermMatcher:
+    """
+    Return the matcher for the list of allowed terms appended to `text`
+    after `ALLOWED_TERMS_DELIMITER`.
+    """
+    match = ALLOWED_TERMS_LIST_PATTERN.search(text)
+    if match is None:
+        raise ValueError("No allowed tags found")
+    return _get_term_matcher_from_list_str(match.group(1))
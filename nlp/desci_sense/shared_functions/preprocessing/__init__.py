@@ -1,10 +1,11 @@
-from typing import Optional, List, Dict, TypedDict, Union, Any
+from typing import Optional, List, Dict, Tuple, TypedDict, Union, Any
 from loguru import logger
 
 # important to use this and not pydantic BaseModel https://medium.com/codex/migrating-to-pydantic-v2-5a4b864621c3
 from langchain.pydantic_v1 import Field, BaseModel
 
 from ..interface import (
+    get_raw_thread_texts,
     ParsePostRequest,
     AppThread,
     PlatformType,
@@ -17,17 +18,21 @@ from ..schema.post import ThreadRefPost, RefPost, QuoteRefPost
 from ..utils import (
     remove_dups_ordered,
     find_last_occurence_of_any,
-    extract_and_expand_urls,
-    extract_external_urls_from_status_tweet,
+    extract_and_expand_url_spans,
+    filter_external_tweet_urls,
+    prefetch_urls,
+    aprefetch_urls,
     trim_parts,
     trim_parts_to_length,
     trim_str_with_urls,
 )
 from .threads import (
     concat_post_content,
-    trim_thread,
     create_thread_from_posts,
 )
+from .token_budget import get_token_counter, get_thread_char_limit
+from ..configs import TokenBudgetConfig
+from ..tracing import span
 
 
 # class StreamlitParseRequest(BaseModel):
@@ -52,22 +57,19 @@ def convert_app_post_to_ref_post(
         RefPost: _description_
     """
     source_network = author.platformId
+    ref_url_spans = extract_and_expand_url_spans(app_post.content)
+    ref_urls = [url for _, _, url in ref_url_spans]
 
     # if source network is twitter, use twitter specific preprocessing
     if source_network == PlatformType.TWITTER:
-        ref_urls = extract_external_urls_from_status_tweet(
-            app_post.url,
-            app_post.content,
-        )
-
-    else:
-        ref_urls = extract_and_expand_urls(app_post.content)
+        ref_urls = filter_external_tweet_urls(app_post.url, ref_urls)
 
     return RefPost(
         author=author.name,
         url=app_post.url,
         content=app_post.content,
         ref_urls=ref_urls,
+        ref_url_spans=ref_url_spans,
         source_network=source_network,
         quoted_url=None
     )
@@ -90,6 +92,8 @@ def convert_app_post_to_quote_ref_post(
     quoted_post = None
     quoted_url = None
     content = ref_post.content
+    ref_urls = ref_post.ref_urls
+    ref_url_spans = get_ref_url_spans(ref_post)
 
     # handle case where post has quoted thread
     if app_post.quotedThread:
@@ -107,14 +111,18 @@ def convert_app_post_to_quote_ref_post(
         # add quoted post url to end of quoting post content + ref_urls
         if quoted_url not in content:
             content = ref_post.content + " " + quoted_url
+            ref_url_spans = ref_url_spans + [
+                (len(content) - len(quoted_url), len(content), quoted_url)
+            ]
 
-        if quoted_url not in ref_post.ref_urls:
-            ref_post.ref_urls.append(quoted_url)
+        if quoted_url not in ref_urls:
+            ref_urls = ref_urls + [quoted_url]
 
     quote_ref_post = QuoteRefPost(
         author=ref_post.author,
         url=ref_post.url,
-        ref_urls=ref_post.ref_urls,
+        ref_urls=ref_urls,
+        ref_url_spans=ref_url_spans,
         content=content,
         source_network=ref_post.source_network,
         quoted_post=quoted_post,
@@ -124,6 +132,30 @@ def convert_app_post_to_quote_ref_post(
     return quote_ref_post
 
 
+def get_thread_interface_texts(thread_interface: AppThread) -> List[str]:
+    """
+    Return contents of all posts in `thread_interface`, including quoted posts.
+    """
+    texts = []
+    for post in thread_interface.thread:
+        texts.append(post.content)
+        if post.quotedThread:
+            texts += get_thread_interface_texts(post.quotedThread)
+    return texts
+
+
+def get_parse_request_texts(parse_request: Union[ParsePostRequest, Dict]) -> List[str]:
+    """
+    Return contents of all posts in `parse_request`, validated or passed as a
+    raw dict, including quoted posts.
+    """
+    if isinstance(parse_request, ParsePostRequest):
+        return get_thread_interface_texts(parse_request.post)
+    if isinstance(parse_request, dict):
+        return get_raw_thread_texts(parse_request.get("post"))
+    return []
+
+
 def convert_thread_interface_to_ref_post(
     thread_interface: AppThread,
 ) -> ThreadRefPost:
@@ -136,6 +168,11 @@ def convert_thread_interface_to_ref_post(
         ThreadRefPost: _description_
     """
     assert len(thread_interface.thread) > 0
+
+    # resolve all urls in the thread in one batch, the conversions below use the cache
+    with span("resolve_urls"):
+        prefetch_urls(get_thread_interface_texts(thread_interface))
+
     posts = []
     for post in thread_interface.thread:
         quote_ref_post = convert_app_post_to_quote_ref_post(
@@ -145,15 +182,70 @@ def convert_thread_interface_to_ref_post(
 
     thread_ref_post = create_thread_from_posts(posts)
     if len(thread_interface.thread) == 1 and thread_interface.thread[0].content=='':
-        thread_ref_post.content = ''
+        thread_ref_post = thread_ref_post.copy(update={"content": ""})
     return thread_ref_post
 
 
+def get_ref_url_spans(post: RefPost) -> List[Tuple[int, int, str]]:
+    """
+    Return `post.ref_url_spans`, or the spans extracted from the content if
+    the post was created without them (including posts pickled before the
+    field existed). The urls should then be in the resolver cache.
+    """
+    ref_url_spans = getattr(post, "ref_url_spans", None)
+    if not ref_url_spans and post.ref_urls:
+        ref_url_spans = extract_and_expand_url_spans(post.content)
+    return ref_url_spans or []
+
+
+def trim_ref_urls(
+    post: RefPost,
+    trimmed_content: str,
+    ref_url_spans: Optional[List[Tuple[int, int, str]]] = None,
+) -> List[str]:
+    """
+    Return the reference urls of `post` that remain in `trimmed_content`,
+    a prefix of `post.content`. The urls are looked up by their offsets in
+    `ref_url_spans` (default: `get_ref_url_spans(post)`), so no urls are
+    resolved again.
+    """
+    if ref_url_spans is None:
+        ref_url_spans = get_ref_url_spans(post)
+    allowed_urls = set(post.ref_urls)
+    return [
+        url
+        for _, end, url in ref_url_spans
+        if end <= len(trimmed_content) and url in allowed_urls
+    ]
+
+
+def trim_ref_post(post: RefPost, max_chars: int) -> RefPost:
+    """
+    Return a shallow copy of `post` with content trimmed to `max_chars`
+    (see `trim_str_with_urls`) and matching reference urls.
+    """
+    if len(post.content) <= max_chars:
+        return post
+    trimmed_content = trim_str_with_urls(post.content, max_chars)
+    ref_url_spans = get_ref_url_spans(post)
+    return post.copy(
+        update={
+            "content": trimmed_content,
+            "ref_urls": trim_ref_urls(post, trimmed_content, ref_url_spans),
+            "ref_url_spans": [
+                span for span in ref_url_spans if span[1] <= len(trimmed_content)
+            ],
+        }
+    )
+
+
 def trim_post_by_length(quote_ref_post: QuoteRefPost, max_chars: int) -> QuoteRefPost:
     """
     Trims post to max chars length. Both post content and
     quoted post content count towards limit. Post content is prioritized
     and only then quoted post content.
+    Reference urls are updated from the urls resolved when the post was
+    created, without network calls.
 
     Args:
         quote_ref_post (QuoteRefPost): _description_
@@ -162,27 +254,19 @@ def trim_post_by_length(quote_ref_post: QuoteRefPost, max_chars: int) -> QuoteRe
     Returns:
         QuoteRefPost: _description_
     """
-    trimmed_post_content = trim_str_with_urls(
-        quote_ref_post.content,
-        max_chars,
-    )
-    remaining_length = max_chars - len(trimmed_post_content)
-
-    new_ref_urls = extract_and_expand_urls(trimmed_post_content)
-
-    trimmed_quote_ref_post = quote_ref_post.copy(deep=True)
-    trimmed_quote_ref_post.content = trimmed_post_content
-    trimmed_quote_ref_post.ref_urls = new_ref_urls
+    trimmed_quote_ref_post = trim_ref_post(quote_ref_post, max_chars)
+    remaining_length = max(max_chars - len(trimmed_quote_ref_post.content), 0)
 
     # if there is still remaining_length, take quoted post content
     if quote_ref_post.quoted_post:
-        trimmed_quoted_content = trim_str_with_urls(
-            quote_ref_post.quoted_post.content,
+        trimmed_quoted_post = trim_ref_post(
+            quote_ref_post.quoted_post,
             remaining_length,
         )
-        new_quoted_urls = extract_and_expand_urls(trimmed_quoted_content)
-        trimmed_quote_ref_post.quoted_post.content = trimmed_quoted_content
-        trimmed_quote_ref_post.quoted_post.ref_urls = new_quoted_urls
+        if trimmed_quoted_post is not quote_ref_post.quoted_post:
+            trimmed_quote_ref_post = trimmed_quote_ref_post.copy(
+                update={"quoted_post": trimmed_quoted_post}
+            )
 
     return trimmed_quote_ref_post
 
@@ -215,11 +299,11 @@ def trim_thread_by_length(thread: ThreadRefPost, max_chars: int) -> ThreadRefPos
         last_trimmed_part_length,
     )
 
-    # trim extra posts
-    trimmed_thread = trim_thread(thread, max_posts=len(trimmed_part_lengths))
-
-    # replace last post with trimmed post
-    trimmed_thread.posts[trimmed_index] = trimmed_quote_ref_post
+    # build the trimmed thread from the kept posts, with the last post replaced
+    # by its trimmed version. Only the trimmed post is copied.
+    trimmed_thread = create_thread_from_posts(
+        thread.posts[:trimmed_index] + [trimmed_quote_ref_post]
+    )
 
     warn_msg = f"""Max length of {max_chars} exceeded! Trimmed thread 
     from {thread.char_length()} to {trimmed_thread.char_length()}"""
@@ -265,16 +349,19 @@ class ParserInput(BaseModel):
 
 
 def convert_parse_request_to_parser_input(
-    parse_request: ParsePostRequest,
+    parse_request: Union[ParsePostRequest, Dict],
 ) -> ParserInput:
-    """_summary_
-
-    Args:
-        parse_request (ParsePostRequest): _description_
-
-    Returns:
-        ParserInput: _description_
     """
+    Convert `parse_request` to parser input. `parse_request` can also be
+    passed unvalidated as a dict, in which case all URLs in the request are
+    resolved in a single pass first, so that validating its posts (see
+    `AppPost.normalize_twitter_urls`) is served from the resolver cache.
+    """
+    if not isinstance(parse_request, ParsePostRequest):
+        with span("resolve_urls"):
+            prefetch_urls(get_parse_request_texts(parse_request))
+        parse_request = ParsePostRequest.model_validate(parse_request)
+
     thread = convert_thread_interface_to_ref_post(parse_request.post)
     parser_input = ParserInput(
         thread_post=thread,
@@ -283,6 +370,23 @@ def convert_parse_request_to_parser_input(
     return parser_input
 
 
+async def aconvert_parse_request_to_parser_input(
+    parse_request: Union[ParsePostRequest, Dict],
+) -> ParserInput:
+    """
+    Async version of `convert_parse_request_to_parser_input`. All URLs in the
+    request are resolved asynchronously first, so the conversion (and the
+    validation of `parse_request` if it is passed as a raw dict) doesn't block
+    on network calls.
+    """
+    with span("resolve_urls"):
+        await aprefetch_urls(get_parse_request_texts(parse_request))
+    if not isinstance(parse_request, ParsePostRequest):
+        parse_request = ParsePostRequest.model_validate(parse_request)
+
+    return convert_parse_request_to_parser_input(parse_request)
+
+
 class PreprocParserInput(BaseModel):
     """
      ThreadRefPost does not include validation
@@ -298,17 +402,57 @@ class PreprocParserInput(BaseModel):
     )
 
 
-def preproc_parser_input(parser_input: ParserInput) -> PreprocParserInput:
+def get_max_chars(
+    parser_input: ParserInput,
+    token_budget_config: Optional[TokenBudgetConfig] = None,
+    max_input_tokens: Optional[int] = None,
+) -> int:
+    """
+    Return the maximum number of chars of `parser_input.thread_post` to
+    process: `parser_input.max_chars`, further limited to the share of the
+    token budget reserved for post content if there is one.
+    `max_input_tokens` overrides the budget of `token_budget_config`.
+    """
+    max_chars = parser_input.max_chars
+    if token_budget_config is None:
+        return max_chars
+    if max_input_tokens is None:
+        max_input_tokens = token_budget_config.max_input_tokens
+    if max_input_tokens is None:
+        return max_chars
+
+    content_tokens = int(max_input_tokens * (1 - token_budget_config.metadata_fraction))
+    counter = get_token_counter(token_budget_config.encoding_name)
+    token_max_chars = get_thread_char_limit(
+        parser_input.thread_post,
+        content_tokens,
+        counter,
+    )
+    # always keep the start of the first post
+    return min(max_chars, max(token_max_chars, 1))
+
+
+def preproc_parser_input(
+    parser_input: ParserInput,
+    token_budget_config: Optional[TokenBudgetConfig] = None,
+    max_input_tokens: Optional[int] = None,
+) -> PreprocParserInput:
     """_summary_
 
     Args:
         parser_input (ParserInput): _description_
+        token_budget_config (TokenBudgetConfig, optional): if set, the thread
+        is also trimmed to fit the token budget for post content.
+        max_input_tokens (int, optional): input token budget overriding the
+        budget of `token_budget_config`, eg the smallest budget of the chains
+        the thread is processed by.
 
     Returns:
         PreprocParserInput: _description_
     """
     orig_thread = parser_input.thread_post
-    new_thread = trim_thread_by_length(orig_thread, parser_input.max_chars)
+    max_chars = get_max_chars(parser_input, token_budget_config, max_input_tokens)
+    new_thread = trim_thread_by_length(orig_thread, max_chars)
     included_urls = new_thread.md_ref_urls()
 
     # get reference urls from trimmed posts
@@ -9,12 +9,13 @@ def concat_post_content(posts: List[AppPost]) -> str:
     return POST_SEPARATOR.join([p.content for p in posts])
 
 
-def create_thread_from_posts(posts: List[QuoteRefPost]):
+def create_thread_from_posts(posts: List[QuoteRefPost]) -> ThreadRefPost:
+    """
+    Create a thread from `posts`. Posts are immutable so the thread shares
+    them rather than copying them.
+    """
     assert len(posts) > 0
 
-    # deep copy posts
-    posts_copy = [p.copy(deep=True) for p in posts]
-
     # gather all urls from thread posts
     all_ref_urls = []
     for post in posts:
@@ -29,7 +30,7 @@ def create_thread_from_posts(posts: List[QuoteRefPost]):
         quoted_url=posts[0].quoted_url,
         source_network=posts[0].source_network,
         ref_urls=all_ref_urls,
-        posts=posts_copy,
+        posts=list(posts),
     )
     return thread_post
 
@@ -0,0 +1,179 @@
+"""
+Token based limits for the parts of chain prompts that vary per post: the
+post content (including quoted posts) and the reference metadata.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from loguru import logger
+
+from ..interface import RefMetadata
+from ..schema.post import RefPost, ThreadRefPost
+
+# approximate number of chars per token, used if the tokenizer can't be loaded
+APPROX_CHARS_PER_TOKEN = 4
+
+
+def load_encoding(encoding_name: str):
+    """
+    Return the tiktoken encoding `encoding_name`, or None if it can't be
+    loaded (tiktoken not installed or encoding files not available).
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.warning(
+            f"Failed loading tokenizer {encoding_name}, approximating token counts: {e}"
+        )
+        return None
+
+
+class TokenCounter:
+    """
+    Counts tokens of texts with a local tiktoken encoding. Encodings of
+    recently counted texts are cached, since the same post and metadata
+    texts are counted for each chain and when truncating.
+    Without an encoding, counts are approximated from the text length.
+    """
+
+    def __init__(self, encoding=None, cache_size: int = 4096) -> None:
+        self.encoding = encoding
+        self._encode = lru_cache(maxsize=cache_size)(self._encode_text)
+
+    def _encode_text(self, text: str) -> Tuple[int, ...]:
+        return tuple(self.encoding.encode(text, disallowed_special=()))
+
+    def count(self, text: str) -> int:
+        if self.encoding is None:
+            return -(-len(text) // APPROX_CHARS_PER_TOKEN)
+        return len(self._encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Return the longest prefix of `text` with at most `max_tokens` tokens.
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is None:
+            return text[: max_tokens * APPROX_CHARS_PER_TOKEN]
+        tokens = self._encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        # drop bytes of a character split by the last token
+        prefix = self.encoding.decode_bytes(tokens[:max_tokens]).decode(
+            "utf-8", errors="ignore"
+        )
+        return text[: len(prefix)]
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(encoding_name: str = "cl100k_base") -> TokenCounter:
+    """
+    Return the shared token counter for `encoding_name`.
+    """
+    return TokenCounter(load_encoding(encoding_name))
+
+
+def count_post_tokens(post: RefPost, counter: TokenCounter) -> int:
+    """
+    Number of tokens in the content of `post` and its quoted posts
+    (for threads, of all posts in the thread).
+    """
+    num_tokens = 0
+    for p in post.thread_posts():
+        num_tokens += counter.count(p.content)
+        if p.has_quote_post:
+            num_tokens += counter.count(p.quoted_post.content)
+    return num_tokens
+
+
+def get_thread_char_limit(
+    thread: ThreadRefPost,
+    max_tokens: int,
+    counter: TokenCounter,
+) -> int:
+    """
+    Return the number of chars of `thread` that fit in `max_tokens`, in the
+    order used by `trim_thread_by_length`: posts in thread order, each post's
+    content before its quoted post content. The result can be used as the
+    `max_chars` of `trim_thread_by_length`.
+    """
+    max_chars = 0
+    remaining_tokens = max_tokens
+    for post in thread.posts:
+        texts = [post.content]
+        if post.has_quote_post:
+            texts.append(post.quoted_post.content)
+        for text in texts:
+            num_tokens = counter.count(text)
+            if num_tokens > remaining_tokens:
+                return max_chars + len(counter.truncate(text, remaining_tokens))
+            max_chars += len(text)
+            remaining_tokens -= num_tokens
+    return max_chars
+
+
+def allocate_token_budget(lengths: List[int], max_tokens: int) -> List[int]:
+    """
+    Split `max_tokens` between parts with token `lengths`: each part gets an
+    equal share, and the share not needed by a shorter part is split
+    between the longer ones.
+    E.g., `allocate_token_budget([10, 100, 100], 90) == [10, 40, 40]`
+    """
+    allocation = [0] * len(lengths)
+    remaining_tokens = max(max_tokens, 0)
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    for num_done, i in enumerate(order):
+        share = remaining_tokens // (len(lengths) - num_done)
+        allocation[i] = min(lengths[i], share)
+        remaining_tokens -= allocation[i]
+    return allocation
+
+
+def fit_metadata_to_budget(
+    md_list: List[RefMetadata],
+    max_tokens: int,
+    counter: TokenCounter,
+) -> List[RefMetadata]:
+    """
+    Return `md_list` with summaries truncated so the rendered metadata
+    takes about `max_tokens` tokens. Other fields (title, url etc) are
+    always kept, and the rest of the budget is split between the summaries
+    (see `allocate_token_budget`). Truncated items are copies.
+    """
+    fixed_tokens = sum(
+        counter.count(md.model_copy(update={"summary": ""}).to_str())
+        for md in md_list
+    )
+    summary_lengths = [counter.count(md.summary) for md in md_list]
+    allocation = allocate_token_budget(summary_lengths, max_tokens - fixed_tokens)
+
+    fitted = []
+    for md, length, num_tokens in zip(md_list, summary_lengths, allocation):
+        if num_tokens < length:
+            md = md.model_copy(
+                update={"summary": counter.truncate(md.summary, num_tokens)}
+            )
+        fitted.append(md)
+    return fitted
+
+
+def fit_post_metadata_to_budget(
+    post: RefPost,
+    md_dict: Dict[str, RefMetadata],
+    max_tokens: int,
+    counter: TokenCounter,
+) -> Dict[str, RefMetadata]:
+    """
+    Return a copy of `md_dict` where the metadata of the references of
+    `post` fit in what is left of `max_tokens` after the post content.
+    """
+    md_budget = max_tokens - count_post_tokens(post, counter)
+    ref_urls = [url for url in post.md_ref_urls() if md_dict.get(url)]
+    fitted = fit_metadata_to_budget(
+        [md_dict[url] for url in ref_urls], md_budget, counter
+    )
+    return {**md_dict, **dict(zip(ref_urls, fitted))}
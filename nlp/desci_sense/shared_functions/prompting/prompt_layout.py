@@ -0,0 +1,94 @@
+"""
+Layout of chain prompts as a static prefix (instructions, ontology tag
+templates, output format) followed by the content of the post.
+
+Prompts are sent as a single user message by default. In prefix-stable mode
+the prefix is sent as a system message that is byte-identical for all posts
+of the same chain and prompt case, so providers that cache prompt prefixes
+(automatically, or marked by a cache-control hint) only process the post
+specific part of each prompt.
+"""
+
+from typing import Any, Dict, Iterable
+
+from jinja2 import Template
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.prompt_values import (
+    ChatPromptValue,
+    PromptValue,
+    StringPromptValue,
+)
+
+# marks where post specific content starts in a rendered template
+DYNAMIC_CONTENT_PLACEHOLDER = "\x00dynamic\x00"
+
+# cache-control hint attached to the prefix, as supported by eg Anthropic
+# models (also through Openrouter)
+CACHE_CONTROL_HINT = {"type": "ephemeral"}
+
+
+def render_prompt_prefix(
+    template: Template,
+    dynamic_vars: Iterable[str],
+    **static_vars: Any,
+) -> str:
+    """
+    Return the static part of prompts rendered from `template`: the text
+    rendered before the first of `dynamic_vars` (the template variables that
+    differ between posts), with `static_vars` as the other variables.
+    """
+    placeholders = {name: DYNAMIC_CONTENT_PLACEHOLDER for name in dynamic_vars}
+    rendered = template.render(**static_vars, **placeholders)
+    end = rendered.find(DYNAMIC_CONTENT_PLACEHOLDER)
+    return rendered if end == -1 else rendered[:end]
+
+
+def assemble_prompt(
+    prompt: str,
+    prefix: str = "",
+    cache_control: bool = False,
+) -> PromptValue:
+    """
+    Return `prompt` as model input. If `prompt` starts with a non empty
+    `prefix`, the prefix is sent as a system message (marked with a
+    cache-control hint if `cache_control`) and the rest of the prompt as a
+    user message. Otherwise, `prompt` is sent as is.
+    """
+    if not prefix or not prompt.startswith(prefix):
+        return StringPromptValue(text=prompt)
+
+    system_content = prefix
+    if cache_control:
+        system_content = [
+            {"type": "text", "text": prefix, "cache_control": CACHE_CONTROL_HINT}
+        ]
+    return ChatPromptValue(
+        messages=[
+            SystemMessage(content=system_content),
+            HumanMessage(content=prompt[len(prefix) :]),
+        ]
+    )
+
+
+class PromptPrefixCache:
+    """
+    Static prompt prefixes of a chain, rendered once per key (eg prompt case).
+    Chains are built for a fixed ontology, so a prefix is stable for the
+    lifetime of the chain.
+    """
+
+    def __init__(self) -> None:
+        self._prefixes: Dict[Any, str] = {}
+
+    def get(
+        self,
+        key: Any,
+        template: Template,
+        dynamic_vars: Iterable[str],
+        **static_vars: Any,
+    ) -> str:
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            prefix = render_prompt_prefix(template, dynamic_vars, **static_vars)
+            self._prefixes[key] = prefix
+        return prefix
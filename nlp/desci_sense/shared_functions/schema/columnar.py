@@ -0,0 +1,340 @@
+"""
+Arrow schemas of posts (`RefPost`, `QuoteRefPost`, `ThreadRefPost`) and
+parser outputs (`CombinedParserOutput`), for storing datasets as Parquet or
+Arrow IPC files.
+
+Tables can be read with column projection (eg only `content` and
+`ref_urls`) and Arrow IPC files are memory mapped, so large datasets can be
+analysed as tables (`table.to_pandas()`) and converted to pydantic objects one
+batch at a time (`iter_posts`, `iter_outputs`) rather than all up front.
+
+Requires `pyarrow` (`pip install pyarrow`).
+"""
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pc = None
+    pq = None
+
+from ..interface import RefMetadata
+from ..postprocessing import CombinedParserOutput
+from .post import QuoteRefPost, RefPost, ThreadRefPost
+
+POST_TYPES = {
+    "ReferencePost": RefPost,
+    "QuoteRefPost": QuoteRefPost,
+    "ThreadRefPost": ThreadRefPost,
+}
+
+# file suffixes of Arrow IPC files, other files are read and written as Parquet
+ARROW_SUFFIXES = {".arrow", ".feather", ".ipc"}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError(
+            "Columnar datasets require pyarrow, install it with `pip install pyarrow`"
+        )
+
+
+def _post_fields() -> List["pa.Field"]:
+    # fields shared by all post types
+    return [
+        pa.field("type", pa.string(), nullable=False),
+        pa.field("author", pa.string(), nullable=False),
+        pa.field("content", pa.string(), nullable=False),
+        pa.field("url", pa.string(), nullable=False),
+        pa.field("created_at", pa.timestamp("us", tz="UTC")),
+        pa.field("source_network", pa.string()),
+        pa.field("is_reply", pa.bool_()),
+        pa.field("is_repost", pa.bool_()),
+        pa.field("ref_urls", pa.list_(pa.string())),
+        pa.field(
+            "ref_url_spans",
+            pa.list_(
+                pa.struct(
+                    [
+                        ("start", pa.int32()),
+                        ("end", pa.int32()),
+                        ("url", pa.string()),
+                    ]
+                )
+            ),
+        ),
+        pa.field("quoted_url", pa.string()),
+        # arbitrary metadata, as JSON
+        pa.field("metadata", pa.string()),
+    ]
+
+
+@lru_cache(maxsize=None)
+def get_post_schema() -> "pa.Schema":
+    """
+    Schema of posts of all types: `quoted_post` is set for quote posts and
+    `posts` (quote posts) for threads.
+    """
+    _require_pyarrow()
+    quoted_post = pa.struct(_post_fields())
+    thread_post = pa.struct(_post_fields() + [pa.field("quoted_post", quoted_post)])
+    return pa.schema(
+        _post_fields()
+        + [
+            pa.field("quoted_post", quoted_post),
+            pa.field("posts", pa.list_(thread_post)),
+        ]
+    )
+
+
+@lru_cache(maxsize=None)
+def get_output_schema() -> "pa.Schema":
+    """
+    Schema of `CombinedParserOutput`s.
+    """
+    _require_pyarrow()
+    strings = pa.list_(pa.string())
+    ref_metadata = pa.struct(
+        [
+            ("ref_id", pa.int64()),
+            ("order", pa.int64()),
+            ("ref_source_url", pa.string()),
+            ("citoid_url", pa.string()),
+            ("url", pa.string()),
+            ("item_type", pa.string()),
+            ("title", pa.string()),
+            ("summary", pa.string()),
+            ("image", pa.string()),
+            # as JSON
+            ("debug", pa.string()),
+        ]
+    )
+    return pa.schema(
+        [
+            pa.field("post_url", pa.string(), nullable=False),
+            pa.field("research_keyword", pa.string()),
+            pa.field("filter_classification", pa.string()),
+            pa.field("item_types", strings),
+            pa.field("reference_urls", strings),
+            pa.field("reference_tagger", pa.list_(strings)),
+            pa.field("multi_reference_tagger", pa.list_(strings)),
+            pa.field("keywords", strings),
+            pa.field("topics", strings),
+            pa.field("hashtags", strings),
+            pa.field("metadata_list", pa.list_(ref_metadata)),
+            pa.field("quoted_post_url", pa.string()),
+            # as JSON
+            pa.field("debug", pa.string()),
+        ]
+    )
+
+
+def _dump_json(value: Optional[Dict]) -> Optional[str]:
+    return json.dumps(value, default=str) if value else None
+
+
+def _load_json(value: Optional[str]) -> Dict:
+    return json.loads(value) if value else {}
+
+
+def _column_to_pylist(column: Union["pa.Array", "pa.ChunkedArray"]) -> List:
+    # converting null entries of nested columns is slow (eg `posts` of posts
+    # that aren't threads), so only valid entries are converted
+    if column.null_count == 0:
+        return column.to_pylist()
+    values = [None] * len(column)
+    if column.null_count == len(column):
+        return values
+    valid = pc.is_valid(column)
+    indices = pc.indices_nonzero(valid).to_pylist()
+    for i, value in zip(indices, column.filter(valid).to_pylist()):
+        values[i] = value
+    return values
+
+
+def _to_rows(table: Union["pa.Table", "pa.RecordBatch"]) -> List[Dict[str, Any]]:
+    # much faster than `table.to_pylist()`, which converts row by row
+    names = table.column_names
+    columns = [_column_to_pylist(column) for column in table.columns]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def _post_to_row(post: RefPost) -> Dict[str, Any]:
+    row = {
+        "type": post.type,
+        "author": post.author,
+        "content": post.content,
+        "url": post.url,
+        "created_at": post.created_at,
+        "source_network": post.source_network,
+        "is_reply": post.is_reply,
+        "is_repost": post.is_repost,
+        "ref_urls": post.ref_urls,
+        "ref_url_spans": [
+            {"start": start, "end": end, "url": url}
+            for start, end, url in post.ref_url_spans
+        ],
+        "quoted_url": post.quoted_url,
+        "metadata": _dump_json(post.metadata),
+    }
+    quoted_post = getattr(post, "quoted_post", None)
+    if quoted_post is not None:
+        row["quoted_post"] = _post_to_row(quoted_post)
+    if isinstance(post, ThreadRefPost):
+        row["posts"] = [_post_to_row(p) for p in post.posts]
+    return row
+
+
+def _row_to_post(row: Dict[str, Any]) -> RefPost:
+    post_type = POST_TYPES[row.pop("type")]
+    row["metadata"] = _load_json(row.get("metadata"))
+    if "ref_url_spans" in row:
+        row["ref_url_spans"] = [
+            (s["start"], s["end"], s["url"]) for s in row["ref_url_spans"] or []
+        ]
+    # unset values take the model defaults
+    row = {k: v for k, v in row.items() if v is not None}
+    if "quoted_post" in row:
+        row["quoted_post"] = _row_to_post(row["quoted_post"])
+    if "posts" in row:
+        row["posts"] = [_row_to_post(p) for p in row["posts"]]
+    return post_type(**row)
+
+
+def posts_to_table(posts: Sequence[RefPost]) -> "pa.Table":
+    """
+    Convert `posts` (of any post type) to a table with the post schema.
+    `created_at` is stored in UTC.
+    """
+    _require_pyarrow()
+    return pa.Table.from_pylist(
+        [_post_to_row(post) for post in posts], schema=get_post_schema()
+    )
+
+
+def table_to_posts(table: Union["pa.Table", "pa.RecordBatch"]) -> List[RefPost]:
+    """
+    Convert a table with the post schema to posts of the types stored in its
+    `type` column. Columns left out by projection take the model defaults,
+    so `type`, `author`, `content`, `url` (and `posts` for threads) are
+    required.
+    """
+    return [_row_to_post(row) for row in _to_rows(table)]
+
+
+def _output_to_row(output: CombinedParserOutput) -> Dict[str, Any]:
+    row = output.model_dump(mode="json", exclude={"debug", "metadata_list"})
+    row["debug"] = _dump_json(output.debug)
+    row["metadata_list"] = [
+        {**md.model_dump(mode="json", exclude={"debug"}), "debug": _dump_json(md.debug)}
+        for md in output.metadata_list
+    ]
+    return row
+
+
+def _row_to_output(row: Dict[str, Any]) -> CombinedParserOutput:
+    row["debug"] = _load_json(row.get("debug"))
+    if "metadata_list" in row:
+        row["metadata_list"] = [
+            RefMetadata(**{**md, "debug": _load_json(md["debug"])})
+            for md in row["metadata_list"] or []
+        ]
+    return CombinedParserOutput.model_validate(row)
+
+
+def outputs_to_table(outputs: Sequence[CombinedParserOutput]) -> "pa.Table":
+    """
+    Convert parser `outputs` to a table with the output schema.
+    """
+    _require_pyarrow()
+    return pa.Table.from_pylist(
+        [_output_to_row(output) for output in outputs], schema=get_output_schema()
+    )
+
+
+def table_to_outputs(
+    table: Union["pa.Table", "pa.RecordBatch"]
+) -> List[CombinedParserOutput]:
+    """
+    Convert a table with the output schema to `CombinedParserOutput`s.
+    Columns left out by projection take the model defaults, so `post_url` is
+    required.
+    """
+    return [_row_to_output(row) for row in _to_rows(table)]
+
+
+def write_table(table: "pa.Table", path: Union[str, Path]):
+    """
+    Write `table` to `path`, as an Arrow IPC file if the suffix of `path` is
+    one of `ARROW_SUFFIXES` and as Parquet otherwise.
+    """
+    _require_pyarrow()
+    path = Path(path)
+    if path.suffix in ARROW_SUFFIXES:
+        with pa.OSFile(str(path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        pq.write_table(table, str(path))
+
+
+def read_table(
+    path: Union[str, Path], columns: Optional[List[str]] = None
+) -> "pa.Table":
+    """
+    Read the table at `path` (see `write_table`), with only `columns` if
+    specified. Arrow IPC files are memory mapped, so columns are only loaded
+    when accessed; Parquet files are memory mapped and only the projected
+    columns are decoded.
+    """
+    _require_pyarrow()
+    path = Path(path)
+    if path.suffix in ARROW_SUFFIXES:
+        table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+        return table.select(columns) if columns is not None else table
+    return pq.read_table(str(path), columns=columns, memory_map=True)
+
+
+def _iter_batches(
+    path: Union[str, Path], columns: Optional[List[str]], batch_size: int
+) -> Iterator["pa.RecordBatch"]:
+    _require_pyarrow()
+    path = Path(path)
+    if path.suffix in ARROW_SUFFIXES:
+        yield from read_table(path, columns).to_batches(max_chunksize=batch_size)
+    else:
+        # decode one batch at a time
+        parquet_file = pq.ParquetFile(str(path), memory_map=True)
+        yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+
+
+def iter_posts(
+    path: Union[str, Path],
+    columns: Optional[List[str]] = None,
+    batch_size: int = 1024,
+) -> Iterator[RefPost]:
+    """
+    Yield the posts stored at `path`, converting `batch_size` rows at a time.
+    """
+    for batch in _iter_batches(path, columns, batch_size):
+        yield from table_to_posts(batch)
+
+
+def iter_outputs(
+    path: Union[str, Path],
+    columns: Optional[List[str]] = None,
+    batch_size: int = 1024,
+) -> Iterator[CombinedParserOutput]:
+    """
+    Yield the parser outputs stored at `path`, converting `batch_size` rows
+    at a time.
+    """
+    for batch in _iter_batches(path, columns, batch_size):
+        yield from table_to_outputs(batch)
@@ -1,7 +1,7 @@
-from typing import List, Dict, Union
+from typing import List, Dict, Tuple, Union
 import pandas as pd
 import json
-from pydantic import Field, BaseModel
+from pydantic import Field, BaseModel, ConfigDict
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from ..interface import (
@@ -15,6 +15,8 @@ from ..utils import render_to_py_dict
 DEFAULT_LABEL = "default"
 DEFAULT_NO_REF_LABEL = "other"
 
+ONT_DF_COLUMNS = list(LLMOntologyConceptDefinition.model_fields.keys())
+
 
 def load_ontology_from_model(ont_model: dict) -> OntologyInterface:
     ontology_interface = OntologyInterface.model_validate(ont_model)
@@ -91,6 +93,61 @@ def write_ontology_to_json(ontology: OntologyInterface, outpath: str):
         file.write(json_data)
 
 
+class FrozenConceptDefinition(LLMOntologyConceptDefinition):
+    """
+    Immutable concept definition, shared by all lookups in the ontology index.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+
+def filter_concepts_by_version(
+    concepts: List[LLMOntologyConceptDefinition], allowed_versions: List[str] = None
+) -> List[LLMOntologyConceptDefinition]:
+    """
+    Same as `filter_ontology_by_version` for a list of concept definitions.
+    """
+    if not allowed_versions:
+        return list(concepts)
+    return [
+        c
+        for c in concepts
+        if any(version in allowed_versions for version in c.versions)
+    ]
+
+
+class OntologyIndex:
+    """
+    Lookup tables compiled once from a list of concept definitions, so lookups
+    by label, display name, URI or (subject type, object type) are plain dict
+    lookups with no pandas filtering or pydantic validation.
+    """
+
+    def __init__(self, concepts: List[LLMOntologyConceptDefinition]) -> None:
+        # concepts are already validated - skip validation when freezing
+        self.concepts: Tuple[FrozenConceptDefinition, ...] = tuple(
+            FrozenConceptDefinition.model_construct(**c.model_dump()) for c in concepts
+        )
+        self.records: Tuple[Dict, ...] = tuple(c.model_dump() for c in self.concepts)
+        self.by_label = {c.label: c for c in self.concepts}
+        self.by_display_name = {c.display_name: c for c in self.concepts}
+        self.by_uri = {c.uri: c for c in self.concepts if c.uri is not None}
+
+        templates = {}
+        for concept, record in zip(self.concepts, self.records):
+            for subject_type in dict.fromkeys(concept.valid_subject_types):
+                for object_type in dict.fromkeys(concept.valid_object_types):
+                    templates.setdefault((subject_type, object_type), []).append(
+                        record
+                    )
+        self.templates: Dict[Tuple[str, str], Tuple[Dict, ...]] = {
+            k: tuple(v) for k, v in templates.items()
+        }
+
+    def get_templates(self, subject_type: str, object_type: str) -> Tuple[Dict, ...]:
+        return self.templates.get((subject_type, object_type), ())
+
+
 class OntologyBase:
     def __init__(self, versions: List[str] = None) -> None:
         self.ontology_interface = load_ontology_from_model(ontology)
@@ -98,32 +155,49 @@ class OntologyBase:
         # for fast lookup
         self._ontology_dict = self.ontology_interface.model_dump()
 
-        # Process the results into a format suitable for DataFrame
-        ont_df = create_ont_df_from_interface(self.ontology_interface)
+        # filter by chosen versions and compile lookup index
+        self._index = OntologyIndex(
+            filter_concepts_by_version(
+                self.ontology_interface.semantic_predicates, allowed_versions=versions
+            )
+        )
 
-        # filter by chosen versions
-        self.ont_df = filter_ontology_by_version(ont_df, allowed_versions=versions)
+        # dataframe versions are only built if accessed
+        self._ont_df = None
+        self._label_map = None
+        self._display_map = None
 
-        # set dict versions with alternate keys for fast lookup
-        self._label_map = self.ont_df.set_index("label", drop=False)
-        self._display_map = self.ont_df.set_index("display_name", drop=False)
-        self._template_type_map = self.ont_df
+    @property
+    def index(self) -> OntologyIndex:
+        return self._index
 
     @property
     def ontology_dict(self) -> Dict:
         return self._ontology_dict
 
+    @property
+    def ont_df(self) -> pd.DataFrame:
+        if self._ont_df is None:
+            df = pd.DataFrame(list(self.index.records), columns=ONT_DF_COLUMNS)
+            df.set_index("name", inplace=True, drop=False)
+            self._ont_df = df
+        return self._ont_df
+
     @property
     def label_df(self):
+        if self._label_map is None:
+            self._label_map = self.ont_df.set_index("label", drop=False)
         return self._label_map
 
     @property
     def display_name_df(self):
+        if self._display_map is None:
+            self._display_map = self.ont_df.set_index("display_name", drop=False)
         return self._display_map
 
     @property
     def template_type_df(self):
-        return self._template_type_map
+        return self.ont_df
 
     def get_valid_templates(
         self, subject_type: str, object_type: str, as_dict: bool = True
@@ -132,34 +206,37 @@ class OntologyBase:
         Given `subject_type` and `object_type`, return list of templates where `subject_type` is in template['valid_subject_types'] and
         `object_type` is in template['valid_object_types'].
         Templates are the rows of the Notion ontology table provided on initialization.
+        If `as_dict` is False, returns the templates as a DataFrame.
         """
-        # Filter the dataframe based on the subject_type and object_type
-        valid_templates = self.ont_df[
-            self.ont_df["valid_subject_types"].apply(
-                lambda types: subject_type in types
-            )
-            & self.ont_df["valid_object_types"].apply(
-                lambda types: object_type in types
-            )
-        ]
-
-        res = valid_templates
+        templates = self.index.get_templates(subject_type, object_type)
 
         if as_dict:
-            # Convert the filtered DataFrame to a list of dictionaries
-            res = valid_templates.to_dict(orient="records")
+            return list(templates)
+
+        return self.ont_df.loc[[t["name"] for t in templates]]
 
-        return res
+    def get_valid_labels(self, subject_type: str, object_type: str) -> List[str]:
+        """
+        Labels of templates returned by `get_valid_templates`.
+        """
+        return [t["label"] for t in self.index.get_templates(subject_type, object_type)]
 
     def get_concept_by_label(self, label: str) -> LLMOntologyConceptDefinition:
-        row = self.label_df.loc[label]
-        return LLMOntologyConceptDefinition.model_validate(row.to_dict())
+        return self.index.by_label[label]
+
+    def get_concept_by_display_name(
+        self, display_name: str
+    ) -> LLMOntologyConceptDefinition:
+        return self.index.by_display_name[display_name]
+
+    def get_concept_by_uri(self, uri: str) -> LLMOntologyConceptDefinition:
+        return self.index.by_uri[uri]
 
     def get_all_labels(self) -> List[str]:
-        return self.ont_df.label.to_list()
+        return [c.label for c in self.index.concepts]
 
     def get_all_display_names(self) -> List[str]:
-        return self.ont_df.display_name.to_list()
+        return [c.display_name for c in self.index.concepts]
 
     def default_mention_label(self) -> str:
         """
@@ -188,7 +265,4 @@ class OntologyBase:
             return self.default_mention_label()
         
     def get_re_post_allowed_tags(self) -> List[str]:
-        df = self.ont_df
-        repost_df = df[df["re_post"] == True]       
-        repost_tags = repost_df['label']
-        return list(repost_tags)
+        return [c.label for c in self.index.concepts if c.re_post]
@@ -4,7 +4,7 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from functools import partial
-from typing import Any, Literal, Sequence, List, Optional, Dict
+from typing import Any, Literal, Sequence, List, Optional, Dict, Tuple
 from datetime import datetime
 
 from langchain.load.serializable import Serializable
@@ -50,13 +50,29 @@ class Post(Serializable):
 class RefPost(Post):
     """
     Post that contains a reference to at least one other URL external to the post.
+
+    Reference posts are immutable values: threads and quoting posts share
+    the posts they are built from instead of copying them. Modified versions
+    should be created with `post.copy(update={...})`, and list fields
+    (shared between copies) should not be changed in place.
     """
 
+    class Config:
+        allow_mutation = False
+        # posts nested in other posts are shared, not copied, on validation
+        copy_on_model_validation = "none"
+
     ref_urls: List[str] = Field(default_factory=list)
     """
     List of URLs referenced by the post
     """
 
+    ref_url_spans: List[Tuple[int, int, str]] = Field(default_factory=list)
+    """
+    (start, end, expanded url) of the URLs found in `content`, used to
+    update `ref_urls` when the content is trimmed without resolving the URLs again
+    """
+
     quoted_url: Optional[str] = None
     """
     URL of post quoted by this post (for platforms that enable quote tweets)
@@ -0,0 +1,309 @@
+"""
+Lightweight tracing of the stages of a parse request (URL resolution,
+metadata extraction, prompts, each LLM chain, post processing).
+
+A trace is started with `start_trace` and stages are timed with `span`.
+Spans are recorded in the trace of the current context (including worker
+threads and tasks started from it), and are no-ops outside a trace, so
+tracing costs a context variable lookup per span when disabled.
+Finished traces are sent to exporters: log lines, a JSONL file, or an
+OTLP/HTTP (JSON) collector.
+"""
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+import json
+import os
+import threading
+import time
+
+import requests
+from loguru import logger
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from .configs import TracingConfig
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_time_ns: int  # unix epoch
+    duration_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration_ns / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time_ns": self.start_time_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """
+    Spans recorded for one request.
+    """
+
+    def __init__(self, name: str, **attributes: Any) -> None:
+        self.name = name
+        self.trace_id = os.urandom(16).hex()
+        self.attributes = attributes
+        # appended from worker threads, list.append is atomic
+        self.spans: List[Span] = []
+
+    def timings(self) -> Dict[str, float]:
+        """
+        Duration in ms of each span name (summed if a name is repeated).
+        """
+        timings = {}
+        for span in self.spans:
+            timings[span.name] = timings.get(span.name, 0.0) + span.duration_ms
+        return {name: round(duration, 3) for name, duration in timings.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "attributes": self.attributes,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_current_span_id: ContextVar[Optional[str]] = ContextVar("span_id", default=None)
+
+
+def get_current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+class _SpanContext:
+    __slots__ = ("trace", "span", "start", "span_token")
+
+    def __init__(self, trace: Trace, name: str, attributes: Dict[str, Any]) -> None:
+        self.trace = trace
+        self.span = Span(
+            name=name,
+            trace_id=trace.trace_id,
+            span_id=os.urandom(8).hex(),
+            parent_id=_current_span_id.get(),
+            start_time_ns=0,
+            attributes=attributes,
+        )
+
+    def __enter__(self) -> Span:
+        self.span_token = _current_span_id.set(self.span.span_id)
+        self.span.start_time_ns = time.time_ns()
+        self.start = time.perf_counter_ns()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.duration_ns = time.perf_counter_ns() - self.start
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        _current_span_id.reset(self.span_token)
+        self.trace.spans.append(self.span)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes: Any):
+    """
+    Context manager timing the enclosed code as span `name` of the current
+    trace. Does nothing if no trace is active.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP_SPAN
+    return _SpanContext(trace, name, attributes)
+
+
+def trace_runnable(runnable: Runnable, name: str) -> Runnable:
+    """
+    Wrap `runnable` so each call to it is timed as span `name`.
+    """
+
+    def invoke(input: Any, config: RunnableConfig) -> Any:
+        with span(name):
+            return runnable.invoke(input, config)
+
+    async def ainvoke(input: Any, config: RunnableConfig) -> Any:
+        with span(name):
+            return await runnable.ainvoke(input, config)
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=name)
+
+
+class SpanExporter(ABC):
+    """
+    Receives finished traces.
+    """
+
+    @abstractmethod
+    def export(self, trace: Trace):
+        pass
+
+
+class LogExporter(SpanExporter):
+    """
+    Logs one line with the span timings of each trace.
+    """
+
+    def export(self, trace: Trace):
+        timings = " ".join(
+            f"{name}={duration:.1f}ms" for name, duration in trace.timings().items()
+        )
+        logger.info(f"trace {trace.name} {trace.trace_id}: {timings}")
+
+
+class JsonlExporter(SpanExporter):
+    """
+    Appends each trace as a JSON line to the file at `path`.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        line = json.dumps(trace.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()]
+
+
+def to_otlp_json(trace: Trace, service_name: str) -> Dict[str, Any]:
+    """
+    Return `trace` as an OTLP/JSON `ExportTraceServiceRequest`.
+    """
+    spans = []
+    for span in trace.spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # internal
+            "startTimeUnixNano": str(span.start_time_ns),
+            "endTimeUnixNano": str(span.start_time_ns + span.duration_ns),
+            "attributes": _otlp_attributes(span.attributes),
+            # error or unset
+            "status": {"code": 2, "message": span.error} if span.error else {},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        spans.append(otlp_span)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": _otlp_attributes(
+                        {"service.name": service_name, **trace.attributes}
+                    )
+                },
+                "scopeSpans": [{"scope": {"name": "desci_sense"}, "spans": spans}],
+            }
+        ]
+    }
+
+
+class OTLPExporter(SpanExporter):
+    """
+    Sends traces to an OTLP/HTTP collector (eg `http://localhost:4318/v1/traces`)
+    in OTLP/JSON format. Requests are sent from a background thread, so
+    exporting doesn't delay the parse request.
+    """
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="otlp")
+
+    def _send(self, payload: Dict[str, Any]):
+        try:
+            response = requests.post(self.endpoint, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Failed exporting trace to {self.endpoint}: {e}")
+
+    def export(self, trace: Trace):
+        self._executor.submit(self._send, to_otlp_json(trace, self.service_name))
+
+    def flush(self):
+        self._executor.submit(lambda: None).result()
+
+
+def create_exporters(config: TracingConfig) -> List[SpanExporter]:
+    exporters = []
+    if config.log:
+        exporters.append(LogExporter())
+    if config.jsonl_path:
+        exporters.append(JsonlExporter(config.jsonl_path))
+    if config.otlp_endpoint:
+        exporters.append(OTLPExporter(config.otlp_endpoint, config.service_name))
+    return exporters
+
+
+@contextmanager
+def start_trace(
+    name: str,
+    exporters: List[SpanExporter] = (),
+    **attributes: Any,
+) -> Iterator[Trace]:
+    """
+    Record the spans of the enclosed code, as children of a root span `name`,
+    and send the trace to `exporters` when done.
+    """
+    trace = Trace(name, **attributes)
+    trace_token = _current_trace.set(trace)
+    try:
+        with span(name):
+            yield trace
+    finally:
+        _current_trace.reset(trace_token)
+        for exporter in exporters:
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                logger.warning(f"Failed exporting trace: {e}")
@@ -0,0 +1,403 @@
+"""
+Lightweight representation of the (small) RDF graphs produced per post, with
+direct turtle / N-Triples / N-Quads / TriG / JSON-LD writers. An
+`rdflib.Graph` is only built if a caller asks for one (or for formats without
+a direct writer).
+"""
+
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+import json
+import re
+
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.namespace import RDF, RDFS, split_uri
+from rdflib.term import _is_valid_uri
+
+Term = Union[URIRef, Literal, BNode]
+Triple = Tuple[Term, Term, Term]
+
+NTRIPLES_FORMATS = {"nt", "ntriples", "nt11", "application/n-triples"}
+NQUADS_FORMATS = {"nquads", "application/n-quads"}
+TRIG_FORMATS = {"trig", "application/trig"}
+JSONLD_FORMATS = {"json-ld", "application/ld+json"}
+TURTLE_FORMATS = {"turtle", "ttl", "text/turtle"}
+
+# "%" not starting a percent encoding, escaped in prefixed names
+UNESCAPED_PERCENT_REGEX = re.compile(r"%(?![0-9A-Fa-f]{2})")
+
+RDF_TYPE = RDF.type
+RDF_NIL = RDF.nil
+RDFS_CLASS = RDFS.Class
+# predicates written first, like rdflib's turtle serializer
+PREDICATE_ORDER = (RDF_TYPE, RDFS.label)
+
+
+def _quote_literal(literal: Literal) -> str:
+    # same escaping as rdflib's N-Triples serializer
+    encoded = '"%s"' % literal.replace("\\", "\\\\").replace("\n", "\\n").replace(
+        '"', '\\"'
+    ).replace("\r", "\\r")
+    if literal.language:
+        return f"{encoded}@{literal.language}"
+    if literal.datatype:
+        return f"{encoded}^^<{literal.datatype}>"
+    return encoded
+
+
+def term_to_nt(term: Term) -> str:
+    """
+    N-Triples representation of `term`.
+    """
+    if isinstance(term, Literal):
+        return _quote_literal(term)
+    if isinstance(term, BNode):
+        return f"_:{term}"
+    return f"<{term}>"
+
+
+def term_to_jsonld(term: Term) -> Dict:
+    """
+    Expanded JSON-LD representation of `term` used as an object.
+    """
+    if isinstance(term, Literal):
+        value = {"@value": str(term)}
+        if term.language:
+            value["@language"] = term.language
+        elif term.datatype:
+            value["@type"] = str(term.datatype)
+        return value
+    if isinstance(term, BNode):
+        return {"@id": f"_:{term}"}
+    return {"@id": str(term)}
+
+
+@lru_cache(maxsize=None)
+def get_default_prefixes() -> Dict[str, str]:
+    """
+    Prefixes bound by a new `rdflib.Graph`, by namespace.
+    """
+    return {str(namespace): prefix for prefix, namespace in Graph().namespaces()}
+
+
+def get_longest_namespace(
+    namespaces: Iterable[str], namespace: str, uri: str
+) -> Optional[str]:
+    """
+    Longest of `namespaces` extending `namespace` that `uri` starts with.
+    """
+    longer = [
+        n
+        for n in namespaces
+        if len(n) > len(namespace) and n.startswith(namespace) and uri.startswith(n)
+    ]
+    return max(longer, key=len) if longer else None
+
+
+@lru_cache(maxsize=4096)
+def split_uri_by_default_namespaces(uri: str) -> Optional[Tuple[str, str, str]]:
+    """
+    Split `uri` into its namespace and local name (see
+    `rdflib.namespace.split_uri`). Returns the namespace, the namespace
+    extended to the longest default namespace `uri` starts with and the
+    local name after it, or None if `uri` can't be split and isn't a default
+    namespace itself.
+    """
+    try:
+        namespace, name = split_uri(uri)
+    except ValueError:
+        if uri not in get_default_prefixes():
+            return None
+        namespace, name = uri, ""
+    longest = get_longest_namespace(get_default_prefixes(), namespace, uri)
+    if longest is not None:
+        return namespace, longest, uri[len(longest) :]
+    return namespace, namespace, name
+
+
+class TurtleNames:
+    """
+    Prefixed names of the URIs of one turtle document, computed like rdflib's
+    turtle serializer does for a new graph: URIs in a bound namespace get its
+    prefix, and namespaces of predicates without one get generated prefixes
+    (`ns1`, `ns2`, ...).
+    """
+
+    def __init__(self) -> None:
+        # generated prefixes, by namespace
+        self.generated: Dict[str, str] = {}
+        # other namespaces seen so far, URIs are named by the longest
+        # namespace they start with
+        self.namespaces: Set[str] = set()
+        self.qnames: Dict[str, Tuple[str, str, str]] = {}
+        # prefixes used in the document
+        self.used: Dict[str, str] = {}
+
+    def get_prefix(self, namespace: str) -> Optional[str]:
+        prefix = get_default_prefixes().get(namespace)
+        return prefix if prefix is not None else self.generated.get(namespace)
+
+    def compute_qname(self, uri: str, generate: bool) -> Optional[Tuple[str, str, str]]:
+        if uri in self.qnames:
+            return self.qnames[uri]
+        # URIs that are bound namespaces themselves, if no other name is found
+        fallback_prefix = self.get_prefix(uri)
+        fallback = (fallback_prefix, uri, "") if fallback_prefix is not None else None
+        if not _is_valid_uri(uri):
+            return fallback
+        split = split_uri_by_default_namespaces(uri)
+        if split is None:
+            if fallback is None:
+                return None
+            split = uri, uri, ""
+        split_namespace, namespace, name = split
+        longest = get_longest_namespace(self.namespaces, split_namespace, uri)
+        if longest is not None and len(longest) > len(namespace):
+            namespace, name = longest, uri[len(longest) :]
+        if split_namespace not in get_default_prefixes():
+            self.namespaces.add(split_namespace)
+
+        prefix = self.get_prefix(namespace)
+        if prefix is None:
+            if not generate:
+                return fallback
+            prefix = self.generated[namespace] = f"ns{len(self.generated) + 1}"
+        self.qnames[uri] = (prefix, namespace, name)
+        return self.qnames[uri]
+
+    def get_pname(self, node: Term, generate: bool = True) -> Optional[str]:
+        """
+        Prefixed name of `node`, or None if it has none.
+        """
+        if not isinstance(node, URIRef):
+            return None
+        # rdflib terms aren't equal to plain strings
+        parts = self.compute_qname(str(node), generate)
+        if parts is None:
+            return None
+        prefix, namespace, local = parts
+        local = local.replace("(", r"\(").replace(")", r"\)")
+        local = UNESCAPED_PERCENT_REGEX.sub("\\%", local)
+        if local.endswith("."):
+            return None
+        self.used[prefix] = namespace
+        return f"{prefix}:{local}"
+
+
+class TripleList:
+    """
+    Ordered set of RDF triples. Supports the parts of the `rdflib.Graph`
+    API used on parser results (`add`, iteration, `in` and `triples` with
+    `None` wildcards, `len`, `all_nodes` and `serialize`).
+    """
+
+    def __init__(self, triples: Iterable[Triple] = ()) -> None:
+        # dict keys used as an insertion ordered set
+        self._triples: Dict[Triple, None] = {}
+        self._graph: Optional[Graph] = None
+        for triple in triples:
+            self.add(triple)
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> "TripleList":
+        triples = cls(graph)
+        triples._graph = graph
+        return triples
+
+    def add(self, triple: Triple) -> "TripleList":
+        triple = tuple(triple)
+        if triple not in self._triples:
+            self._triples[triple] = None
+            if self._graph is not None:
+                self._graph.add(triple)
+        return self
+
+    def __iter__(self) -> Iterator[Triple]:
+        return iter(self._triples)
+
+    def __len__(self) -> int:
+        return len(self._triples)
+
+    def triples(self, pattern: Tuple) -> Iterator[Triple]:
+        """
+        Triples matching `pattern`, where `None` terms match any term (like
+        `rdflib.Graph.triples`).
+        """
+        s, p, o = pattern
+        if s is not None and p is not None and o is not None:
+            if (s, p, o) in self._triples:
+                yield (s, p, o)
+            return
+        for triple in self._triples:
+            ts, tp, to = triple
+            if (
+                (s is None or s == ts)
+                and (p is None or p == tp)
+                and (o is None or o == to)
+            ):
+                yield triple
+
+    def __contains__(self, triple: Tuple) -> bool:
+        for _ in self.triples(tuple(triple)):
+            return True
+        return False
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (TripleList, Graph)):
+            return set(self) == set(other)
+        return NotImplemented
+
+    def all_nodes(self) -> Set[Term]:
+        """
+        Set of all subjects and objects, like `rdflib.Graph.all_nodes`.
+        """
+        nodes = set()
+        for s, _, o in self._triples:
+            nodes.add(s)
+            nodes.add(o)
+        return nodes
+
+    def to_graph(self) -> Graph:
+        """
+        Return the triples as an `rdflib.Graph`, built on first call.
+        """
+        if self._graph is None:
+            graph = Graph()
+            for triple in self._triples:
+                graph.add(triple)
+            self._graph = graph
+        return self._graph
+
+    def to_ntriples(self) -> str:
+        return "".join(
+            f"{term_to_nt(s)} {term_to_nt(p)} {term_to_nt(o)} .\n"
+            for s, p, o in self._triples
+        )
+
+    def to_nquads(self, graph_name: Optional[Term] = None) -> str:
+        if graph_name is None:
+            return self.to_ntriples()
+        g = term_to_nt(graph_name)
+        return "".join(
+            f"{term_to_nt(s)} {term_to_nt(p)} {term_to_nt(o)} {g} .\n"
+            for s, p, o in self._triples
+        )
+
+    def to_trig(self, graph_name: Optional[Term] = None) -> str:
+        lines = [
+            f"    {term_to_nt(s)} {term_to_nt(p)} {term_to_nt(o)} .\n"
+            for s, p, o in self._triples
+        ]
+        header = "{\n" if graph_name is None else f"{term_to_nt(graph_name)} {{\n"
+        return header + "".join(lines) + "}\n"
+
+    def to_turtle(self) -> str:
+        """
+        Turtle document with the same layout as rdflib's turtle serializer:
+        subjects sorted by the number of references to them, then by URI,
+        with their predicates and objects sorted. Generated prefixes are
+        numbered in order of first use (rdflib numbers them in the hash
+        order of its triples, so its output varies between processes).
+        Triples with blank nodes or invalid URIs are serialized by rdflib.
+        """
+        for triple in self._triples:
+            for term in triple:
+                if isinstance(term, BNode) or (
+                    isinstance(term, URIRef) and not _is_valid_uri(term)
+                ):
+                    return self.to_graph().serialize(format="turtle")
+
+        names = TurtleNames()
+        references: Dict[Term, int] = defaultdict(int)
+        properties: Dict[Term, Dict[Term, List[Term]]] = {}
+        for triple in self._triples:
+            s, p, o = triple
+            references[o] += 1
+            properties.setdefault(s, {}).setdefault(p, []).append(o)
+            for i, node in enumerate(triple):
+                if i == 1 and node == RDF_TYPE:
+                    # written as "a"
+                    continue
+                names.get_pname(node, generate=(i == 1))
+                if isinstance(node, Literal) and node.datatype:
+                    names.get_pname(node.datatype, generate=False)
+        # prefixes are declared before the names written below are computed
+        header = "".join(
+            f"@prefix {prefix}: <{namespace}> .\n"
+            for prefix, namespace in sorted(names.used.items())
+        )
+
+        def label(node: Term, verb: bool = False) -> str:
+            if node == RDF_NIL:
+                return "()"
+            if verb and node == RDF_TYPE:
+                return "a"
+            if isinstance(node, Literal):
+                return node._literal_n3(
+                    use_plain=True,
+                    qname_callback=lambda dt: names.get_pname(dt, generate=False),
+                )
+            return names.get_pname(node, generate=verb) or node.n3()
+
+        classes = sorted(
+            s for s, p, o in self._triples if p == RDF_TYPE and o == RDFS_CLASS
+        )
+        others = sorted((references[s], s) for s in properties if s not in classes)
+        statements = []
+        for subject in classes + [s for _, s in others]:
+            subject_properties = properties[subject]
+            predicates = [
+                p for p in PREDICATE_ORDER if p in subject_properties
+            ] + sorted(p for p in subject_properties if p not in PREDICATE_ORDER)
+            lines = []
+            for predicate in predicates:
+                objects = sorted(subject_properties[predicate])
+                separator = ",\n" + ("        " if len(objects) > 1 else "    ")
+                lines.append(
+                    f"{label(predicate, verb=True)} "
+                    + separator.join(label(o) for o in objects)
+                )
+            statements.append(f"\n{label(subject)} " + " ;\n    ".join(lines) + " .\n")
+        return header + "".join(statements) + "\n"
+
+    def to_jsonld_obj(self) -> List[Dict]:
+        """
+        Triples in expanded JSON-LD form: one node object per subject,
+        in order of first appearance.
+        """
+        nodes: Dict[Term, Dict] = {}
+        for s, p, o in self._triples:
+            node = nodes.get(s)
+            if node is None:
+                node = nodes[s] = {"@id": term_to_jsonld(s)["@id"]}
+            if p == RDF.type and not isinstance(o, Literal):
+                node.setdefault("@type", []).append(term_to_jsonld(o)["@id"])
+            else:
+                node.setdefault(str(p), []).append(term_to_jsonld(o))
+        return list(nodes.values())
+
+    def to_jsonld(self, indent: int = 2) -> str:
+        return json.dumps(self.to_jsonld_obj(), indent=indent, ensure_ascii=False)
+
+    def serialize(self, format: str = "turtle", **kwargs) -> str:
+        """
+        Serialize to `format`. Turtle, N-Triples, N-Quads, TriG and JSON-LD
+        are written directly; other formats (or turtle with serializer
+        options, or of triples loaded from a graph, which may bind its own
+        prefixes) are serialized by rdflib.
+        """
+        if format in TURTLE_FORMATS and not kwargs and self._graph is None:
+            return self.to_turtle()
+        if format in NTRIPLES_FORMATS:
+            return self.to_ntriples()
+        if format in NQUADS_FORMATS:
+            return self.to_nquads(kwargs.get("graph_name"))
+        if format in TRIG_FORMATS:
+            return self.to_trig(kwargs.get("graph_name"))
+        if format in JSONLD_FORMATS:
+            return self.to_jsonld()
+        return self.to_graph().serialize(format=format, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"TripleList({len(self)} triples)"
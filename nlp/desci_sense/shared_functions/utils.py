@@ -1,15 +1,15 @@
 import re
-import requests
-from typing import List, Optional, Tuple
+from typing import Any, Iterator, List, Optional, Tuple
 from jinja2 import Environment, BaseLoader
 from enum import Enum
 import json
-from jsoncomment import JsonComment
 import html2text
 from loguru import logger
 from urllib.parse import urlparse
 from url_normalize import url_normalize
 
+from .web_extractors.url_resolver import resolve_urls, aresolve_urls
+
 
 def extract_twitter_status_id(url):
     """
@@ -122,27 +122,30 @@ def identify_social_media(url):
 
 
 def unshorten_url(url):
-    try:
-        response = requests.head(url, allow_redirects=True, timeout=10)
-        return response.url
-    except requests.RequestException:
-        logger.warning(f"[unshorten_url] RequestException for url {url}")
-        # return original url in case of errors
-        return url
+    # returns original url in case of errors
+    return resolve_urls([url])[0]
 
 
 # based on ChatGPT and https://stackoverflow.com/a/6041965
+URL_REGEX = re.compile(
+    r"((http|ftp|https):\/\/([\w_-]+(?:(?:\.[\w_-]+)+))([\w.,@?^=%&:\/~+#-]*[\w@?^=%&\/~+#-]))"
+)
+# Loose match urls
+# url_regex = r"\b(?:https?://)?(?:www\.)?([a-z0-9]+([\-\.]{1}[a-z0-9]+)*\.[a-z]{2,6})(:[0-9]{1,5})?(/[\w\-./?%&=]*)?"
+
+
 def extract_urls(text):
     """takes a string text as input and uses the regular expression pattern to find all
     occurrences of URLs in the text. returns a list of all non-overlapping matches of the regular expression pattern in the string.
     """
-    url_regex = r"((http|ftp|https):\/\/([\w_-]+(?:(?:\.[\w_-]+)+))([\w.,@?^=%&:\/~+#-]*[\w@?^=%&\/~+#-]))"
-    # Loose match urls
-    # url_regex = r"\b(?:https?://)?(?:www\.)?([a-z0-9]+([\-\.]{1}[a-z0-9]+)*\.[a-z]{2,6})(:[0-9]{1,5})?(/[\w\-./?%&=]*)?"
+    return [m.group(0) for m in URL_REGEX.finditer(text)]
 
-    res = re.findall(url_regex, text)
-    final_res = [r[0] for r in res]
-    return final_res
+
+def extract_url_spans(text: str) -> List[Tuple[int, int, str]]:
+    """
+    Like `extract_urls`, but returns (start, end, url) of each URL in `text`.
+    """
+    return [(m.start(), m.end(), m.group(0)) for m in URL_REGEX.finditer(text)]
 
 
 def normalize_url(url):
@@ -161,6 +164,32 @@ def normalize_url(url):
     return res
 
 
+def normalize_urls(urls: List[str]) -> List[str]:
+    """
+    Batched version of `normalize_url`. URLs are unshortened concurrently and
+    each distinct URL is requested at most once.
+    """
+    return [url_normalize(url) for url in resolve_urls(urls)]
+
+
+def prefetch_urls(texts: List[str]):
+    """
+    Resolve all URLs in `texts` in a single batch, so that subsequent
+    calls to `extract_and_expand_urls` on these texts are served from the
+    resolver cache.
+    """
+    resolve_urls(remove_dups_ordered(flatten([extract_urls(t) for t in texts])))
+
+
+async def aprefetch_urls(texts: List[str]):
+    """
+    Async version of `prefetch_urls`.
+    """
+    await aresolve_urls(
+        remove_dups_ordered(flatten([extract_urls(t) for t in texts]))
+    )
+
+
 def extract_and_expand_urls(text, return_orig_urls: bool = False):
     """_summary_
 
@@ -171,7 +200,7 @@ def extract_and_expand_urls(text, return_orig_urls: bool = False):
     orig_urls = extract_urls(text)
 
     # unshortened and normalized urls
-    expanded_urls = [normalize_url(url) for url in orig_urls]
+    expanded_urls = normalize_urls(orig_urls)
 
     if return_orig_urls:
         return expanded_urls, orig_urls
@@ -179,6 +208,18 @@ def extract_and_expand_urls(text, return_orig_urls: bool = False):
         return expanded_urls
 
 
+def extract_and_expand_url_spans(text: str) -> List[Tuple[int, int, str]]:
+    """
+    Return (start, end, expanded url) for each URL in `text`, where start and
+    end are the offsets of the original URL in `text`. Keeping the offsets
+    lets trimmed versions of `text` reuse the expanded URLs instead of
+    resolving them again.
+    """
+    spans = extract_url_spans(text)
+    expanded_urls = normalize_urls([url for _, _, url in spans])
+    return [(start, end, url) for (start, end, _), url in zip(spans, expanded_urls)]
+
+
 def extract_external_urls_from_status_tweet(
     tweet_url: str, tweet_content: str
 ) -> List[str]:
@@ -188,9 +229,16 @@ def extract_external_urls_from_status_tweet(
     Internal URLs share the same ID as the referencing tweet.
     Shortened URLs are expanded to long form.
     """
+    return filter_external_tweet_urls(tweet_url, extract_and_expand_urls(tweet_content))
+
+
+def filter_external_tweet_urls(tweet_url: str, urls: List[str]) -> List[str]:
+    """
+    Return the (expanded) `urls` of a tweet that are not internal to the
+    tweet at `tweet_url`, see `extract_external_urls_from_status_tweet`.
+    """
     tweet_id = extract_twitter_status_id(tweet_url)
     external = []
-    urls = extract_and_expand_urls(tweet_content)
 
     for url in urls:
         # extract twitter id from url if the url is a twitter post
@@ -258,40 +306,105 @@ def clean_comments(input_string):
     return clean_string
 
 
+# markdown escapes some models add inside JSON (eg `\_`), not valid JSON escapes
+MARKDOWN_ESCAPED_CHARS = "_[]"
+
+# characters the JSON scanner needs to look at, outside and inside strings
+JSON_SPECIAL_CHARS = re.compile(r'["{}\[\]#/\\]')
+JSON_STRING_SPECIAL_CHARS = re.compile(r'["\\]')
+
+
+def _drop_trailing_comma(out: List[str]):
+    # remove a comma (and whitespace after it) at the end of `out`
+    while out and not out[-1].strip():
+        out.pop()
+    if out:
+        last = out[-1].rstrip()
+        if last.endswith(","):
+            out[-1] = last[:-1]
+
+
+def _scan_json_objects(input_string: str) -> Iterator[str]:
+    """
+    Yield candidate JSON object substrings of `input_string`, in a single pass.
+    Quoting and escapes are tracked, so braces and `#` inside strings are kept.
+    Outside strings, `#`, `//` and `/* */` comments and trailing commas are
+    dropped, as are markdown escapes (eg `\_`) anywhere.
+    After a candidate, scanning resumes where it ended.
+    """
+    n = len(input_string)
+    i = input_string.find("{")
+    while i != -1:
+        out = []
+        depth = 0
+        in_string = False
+        while True:
+            pattern = JSON_STRING_SPECIAL_CHARS if in_string else JSON_SPECIAL_CHARS
+            match = pattern.search(input_string, i)
+            if match is None:
+                # reached end of input with unbalanced braces
+                return
+            j = match.start()
+            if j > i:
+                out.append(input_string[i:j])
+            c = input_string[j]
+            i = j + 1
+            if c == "\\":
+                nxt = input_string[i : i + 1]
+                if nxt and nxt in MARKDOWN_ESCAPED_CHARS:
+                    out.append(nxt)
+                else:
+                    out.append(c + nxt)
+                i += 1
+            elif c == '"':
+                in_string = not in_string
+                out.append(c)
+            elif c == "#" or (c == "/" and input_string.startswith("/", i)):
+                # line comment
+                i = input_string.find("\n", i)
+                i = n if i == -1 else i
+            elif c == "/" and input_string.startswith("*", i):
+                # block comment
+                i = input_string.find("*/", i + 1)
+                i = n if i == -1 else i + 2
+            elif c in "}]":
+                _drop_trailing_comma(out)
+                out.append(c)
+                if c == "}":
+                    depth -= 1
+                    if depth == 0:
+                        break
+            else:
+                if c == "{":
+                    depth += 1
+                out.append(c)
+
+        yield "".join(out)
+        i = input_string.find("{", i)
+
+
+def extract_json_object(input_string: str) -> Any:
+    """
+    Return the first JSON object found in `input_string` (eg an LLM completion
+    with surrounding text, markdown fences, comments or trailing commas),
+    parsed. Raises `ValueError` if no valid JSON object is found.
+    """
+    for candidate in _scan_json_objects(input_string):
+        try:
+            return json.loads(candidate, strict=False)
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("No valid JSON object found")
+
+
 def _find_json_object(input_string):
     # find json substring within input string (GPT)
-    input_string = clean_comments(input_string)  # clean # style comments
-    input_string = input_string.replace("\\_", "_")
-    input_string = input_string.replace("\\[", "[")
-    input_string = input_string.replace("\\]", "]")  # remove escaping for underscore
-
-    # to handle generated JSONs with comments, trailing commas
-    jsonc = JsonComment()
-
-    start = input_string.find("{")
-    if start == -1:
-        return (
-            "[System error]: " + input_string
-        )  # No JSON object found, return string for dbug purposes
-
-    # Stack to match curly braces
-    stack = []
-    for i in range(start, len(input_string)):
-        if input_string[i] == "{":
-            stack.append(i)
-        elif input_string[i] == "}":
-            if stack:
-                stack.pop()
-                if not stack:  # All open braces have been closed
-                    end = i + 1
-                    try:
-                        # Try to parse the substring as JSON
-                        parsed_json = jsonc.loads(input_string[start:end])
-                        return input_string[
-                            start:end
-                        ]  # Return the valid JSON substring
-                    except json.JSONDecodeError:
-                        continue  # The substring is not a valid JSON, continue searching
+    for candidate in _scan_json_objects(input_string):
+        try:
+            json.loads(candidate, strict=False)
+            return candidate  # Return the valid JSON substring
+        except json.JSONDecodeError:
+            continue  # The substring is not a valid JSON, continue searching
 
     return (
         "[System error]: " + input_string
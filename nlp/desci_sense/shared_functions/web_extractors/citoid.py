@@ -1,6 +1,8 @@
 # using https://en.wikipedia.org/api/rest_v1/#/Citation/getCitation API
 
 from typing import List, Dict, Union, Tuple
+import copy
+import threading
 
 
 from loguru import logger
@@ -16,6 +18,8 @@ from tenacity import (
 )
 from ..utils import identify_social_media
 from ..interface import PlatformType
+from ..configs import CitoidClientConfig
+from ..async_utils import BackgroundEventLoop, SingleFlight, get_background_loop
 
 
 def citoid_social_media_post(target_url: str, platform_type:PlatformType) -> Dict:
@@ -123,19 +127,10 @@ async def fetch_citation_async_retry(target_url, session: ClientSession):
 
 
 async def fetch_all_citations(urls: list):
-    my_conn = aiohttp.TCPConnector(limit=10)
-    async with aiohttp.ClientSession(connector=my_conn) as session:
-        tasks = []
-        for url in urls:
-            task = asyncio.ensure_future(
-                fetch_citation_async_retry(target_url=url, session=session)
-            )
-            tasks.append(task)
-        results = await asyncio.gather(
-            *tasks, return_exceptions=True
-        )  # the await must be nest inside of the session
-
-    return results
+    """
+    Return Citoid metadata for each URL in list, using the shared Citoid client.
+    """
+    return await get_citoid_client().afetch_citations(urls)
 
 
 @retry(
@@ -190,3 +185,124 @@ def fetch_citations(urls) -> List:
     Return Citoid metadata for each URL in list
     """
     return [fetch_citation(url) for url in urls]
+
+
+class CitoidClient:
+    """
+    Citoid client holding a persistent connection pool (keep-alive, DNS caching),
+    so connections are reused across requests and batches.
+    The pool lives on a background event loop, so the client can be used both from
+    sync code (`fetch_citations`) and from async code running in any event loop
+    (`afetch_citations`). At most `config.max_concurrency` requests are in flight,
+    and concurrent lookups of the same URL share a single request.
+    """
+
+    def __init__(
+        self,
+        config: CitoidClientConfig = None,
+        background_loop: BackgroundEventLoop = None,
+    ) -> None:
+        self.config = config or CitoidClientConfig()
+        self.background_loop = background_loop or get_background_loop()
+        self._session: aiohttp.ClientSession = None
+        self._semaphore: asyncio.Semaphore = None
+        self._lookups = SingleFlight()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # only called from the background loop, so no locking needed
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.config.max_connections,
+                ttl_dns_cache=self.config.dns_cache_ttl,
+                keepalive_timeout=self.config.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.config.request_timeout),
+                headers={"accept": "application/json; charset=utf-8;"},
+            )
+            self._semaphore = asyncio.Semaphore(self.config.max_concurrency)
+        return self._session
+
+    @retry(
+        stop=stop_after_attempt(5),  # Stop after 5 attempts
+        wait=wait_exponential(multiplier=1, max=10),  # Exponential backoff strategy
+        retry_error_callback=return_default_value,  # Callback to provide default return value
+        reraise=False,  # Do not re-raise the exception after final attempt
+        before=before_retry,  # Execute before_retry function before each attempt
+    )
+    async def _fetch_citation(self, target_url: str) -> Dict:
+        skip_citoid, response = pre_check_target_url(target_url)
+        if skip_citoid:
+            logger.debug(f"skipping citoid for {target_url}")
+            return response
+
+        logger.debug(f"fetching citoid data for: {target_url}")
+        full_url = self.config.base_url + quote(target_url, safe="")
+        session = self._get_session()
+        async with self._semaphore:
+            async with session.get(full_url) as response:
+                if response.status != 200:
+                    raise aiohttp.ClientError(
+                        f"Failed to retreive citoid metadata for url {target_url}. Status: {response.status}"
+                    )
+                result = await response.json()
+        result = result[0]
+        validate_metadata(result)
+        return result
+
+    async def _fetch_coalesced(self, target_url: str) -> Dict:
+        result, shared = await self._lookups.ado(
+            target_url, lambda: self._fetch_citation(target_url)
+        )
+        # callers may modify the returned metadata
+        return copy.deepcopy(result) if shared else result
+
+    async def _fetch_all(self, urls: List[str]) -> List[Union[Dict, Exception]]:
+        tasks = [self._fetch_coalesced(url) for url in urls]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def afetch_citations(self, urls: List[str]) -> List[Union[Dict, Exception]]:
+        """
+        Return Citoid metadata for each URL in `urls`. Failed fetches are returned
+        as error dicts or exceptions.
+        """
+        return await self.background_loop.arun(self._fetch_all(urls))
+
+    def fetch_citations(self, urls: List[str]) -> List[Union[Dict, Exception]]:
+        """
+        Sync version of `afetch_citations`.
+        """
+        return self.background_loop.run(self._fetch_all(urls))
+
+    async def afetch_citation(self, target_url: str) -> Dict:
+        return (await self.afetch_citations([target_url]))[0]
+
+    def fetch_citation(self, target_url: str) -> Dict:
+        return self.fetch_citations([target_url])[0]
+
+    async def _close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def close(self):
+        self.background_loop.run(self._close())
+
+
+_default_client: CitoidClient = None
+_default_client_lock = threading.Lock()
+
+
+def get_citoid_client() -> CitoidClient:
+    """
+    Return the Citoid client shared by the whole process, creating it from the
+    default `CitoidClientConfig` (which can be set using `CITOID_*` env vars)
+    on first use.
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = CitoidClient()
+    return _default_client
@@ -0,0 +1,363 @@
+"""
+Caching of raw reference metadata (eg Citoid responses) keyed by URL, so popular
+references aren't fetched again on every parse.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from collections import OrderedDict
+import copy
+import json
+import sqlite3
+import threading
+import time
+
+from loguru import logger
+
+from ..configs import MetadataCacheConfig
+
+
+def is_error_metadata(metadata: Dict) -> bool:
+    """
+    True if `metadata` represents a failed lookup (see `citoid.return_default_value`
+    and `citoid.validate_metadata`).
+    """
+    if "error" in metadata:
+        return True
+    msg = metadata.get("msg")
+    return isinstance(msg, str) and msg.startswith("Error:")
+
+
+def is_placeholder_metadata(metadata: Dict) -> bool:
+    """
+    True if `metadata` is a placeholder rather than real extracted metadata
+    (eg `forumPost` items created for social media posts).
+    """
+    return metadata.get("itemType") == "forumPost"
+
+
+class CacheStats:
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "sets": self.sets,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class MetadataCache(ABC):
+    """
+    Interface for metadata caches. Values are raw metadata dicts keyed by URL.
+    Expiration time of each entry depends on the outcome it represents
+    (successful lookup, placeholder or error).
+    """
+
+    def __init__(
+        self,
+        positive_ttl: float,
+        placeholder_ttl: float,
+        error_ttl: float,
+    ) -> None:
+        self.positive_ttl = positive_ttl
+        self.placeholder_ttl = placeholder_ttl
+        self.error_ttl = error_ttl
+        self.stats = CacheStats()
+
+    def get_ttl(self, metadata: Dict) -> float:
+        if is_error_metadata(metadata):
+            return self.error_ttl
+        if is_placeholder_metadata(metadata):
+            return self.placeholder_ttl
+        return self.positive_ttl
+
+    @abstractmethod
+    def get(self, url: str) -> Optional[Dict]:
+        """
+        Return cached metadata for `url` or None if missing or expired.
+        """
+
+    @abstractmethod
+    def set(self, url: str, metadata: Dict, expires_at: float = None):
+        """
+        Cache `metadata` for `url`. If `expires_at` is not provided, it is set
+        according to the TTL of the outcome `metadata` represents.
+        """
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    def get_many(self, urls: List[str]) -> Dict[str, Dict]:
+        """
+        Return dict of cached metadata for `urls` found in the cache.
+        """
+        results = {}
+        for url in urls:
+            metadata = self.get(url)
+            if metadata is not None:
+                results[url] = metadata
+        return results
+
+    def set_many(self, metadata_dict: Dict[str, Dict]):
+        for url, metadata in metadata_dict.items():
+            self.set(url, metadata)
+
+    def _expires_at(self, metadata: Dict, expires_at: float = None) -> float:
+        if expires_at is not None:
+            return expires_at
+        return time.time() + self.get_ttl(metadata)
+
+
+class InMemoryMetadataCache(MetadataCache):
+    """
+    Thread safe LRU cache held in process memory.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        positive_ttl: float = 7 * 24 * 60 * 60,
+        placeholder_ttl: float = 24 * 60 * 60,
+        error_ttl: float = 10 * 60,
+    ) -> None:
+        super().__init__(positive_ttl, placeholder_ttl, error_ttl)
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            metadata, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[url]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(url)
+            self.stats.hits += 1
+            return copy.deepcopy(metadata)
+
+    def get_expiration(self, url: str) -> Optional[float]:
+        entry = self._entries.get(url)
+        return entry[1] if entry else None
+
+    def set(self, url: str, metadata: Dict, expires_at: float = None):
+        expires_at = self._expires_at(metadata, expires_at)
+        with self._lock:
+            self._entries[url] = (copy.deepcopy(metadata), expires_at)
+            self._entries.move_to_end(url)
+            self.stats.sets += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteMetadataCache(MetadataCache):
+    """
+    On-disk cache backed by a SQLite file. Survives process restarts and
+    can be shared by processes on the same machine.
+    When the number of entries exceeds `max_entries`, the least recently
+    accessed entries are evicted. The number of entries is counted when the
+    cache is opened and then kept up to date by each write, so entries added
+    by other processes sharing the file are only counted once it is reopened.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 200000,
+        positive_ttl: float = 7 * 24 * 60 * 60,
+        placeholder_ttl: float = 24 * 60 * 60,
+        error_ttl: float = 10 * 60,
+    ) -> None:
+        super().__init__(positive_ttl, placeholder_ttl, error_ttl)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS metadata_cache (
+                    url TEXT PRIMARY KEY,
+                    metadata TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_accessed_at ON metadata_cache (accessed_at)"
+            )
+            (self._num_entries,) = self._conn.execute(
+                "SELECT COUNT(*) FROM metadata_cache"
+            ).fetchone()
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT metadata, expires_at FROM metadata_cache WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            metadata_json, expires_at = row
+            now = time.time()
+            with self._conn:
+                if expires_at <= now:
+                    self._conn.execute(
+                        "DELETE FROM metadata_cache WHERE url = ?", (url,)
+                    )
+                    self._num_entries -= 1
+                    self.stats.expirations += 1
+                    self.stats.misses += 1
+                    return None
+                self._conn.execute(
+                    "UPDATE metadata_cache SET accessed_at = ? WHERE url = ?",
+                    (now, url),
+                )
+            self.stats.hits += 1
+        return json.loads(metadata_json)
+
+    def get_expiration(self, url: str) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at FROM metadata_cache WHERE url = ?",
+                (url,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, url: str, metadata: Dict, expires_at: float = None):
+        expires_at = self._expires_at(metadata, expires_at)
+        metadata_json = json.dumps(metadata, default=str)
+        with self._lock, self._conn:
+            exists = self._conn.execute(
+                "SELECT 1 FROM metadata_cache WHERE url = ?", (url,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata_cache VALUES (?, ?, ?, ?)",
+                (url, metadata_json, expires_at, time.time()),
+            )
+            if exists is None:
+                self._num_entries += 1
+            self.stats.sets += 1
+            if self._num_entries > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        num_to_evict = self._num_entries - self.max_entries
+        cursor = self._conn.execute(
+            """DELETE FROM metadata_cache WHERE url IN (
+                SELECT url FROM metadata_cache ORDER BY accessed_at ASC LIMIT ?
+            )""",
+            (num_to_evict,),
+        )
+        self._num_entries -= cursor.rowcount
+        self.stats.evictions += cursor.rowcount
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM metadata_cache")
+            self._num_entries = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            (num_entries,) = self._conn.execute(
+                "SELECT COUNT(*) FROM metadata_cache"
+            ).fetchone()
+        return num_entries
+
+
+class TieredMetadataCache(MetadataCache):
+    """
+    Cache composed of several tiers, ordered from fastest to slowest
+    (eg memory then disk). Hits in a slower tier are promoted to the faster tiers.
+    """
+
+    def __init__(self, tiers: List[MetadataCache]) -> None:
+        assert len(tiers) > 0, "Must provide at least one cache tier"
+        first = tiers[0]
+        super().__init__(first.positive_ttl, first.placeholder_ttl, first.error_ttl)
+        self.tiers = tiers
+
+    def get(self, url: str) -> Optional[Dict]:
+        for i, tier in enumerate(self.tiers):
+            metadata = tier.get(url)
+            if metadata is not None:
+                # promote to faster tiers, keeping the original expiration
+                expires_at = tier.get_expiration(url)
+                for faster_tier in self.tiers[:i]:
+                    faster_tier.set(url, metadata, expires_at=expires_at)
+                self.stats.hits += 1
+                return metadata
+        self.stats.misses += 1
+        return None
+
+    def get_expiration(self, url: str) -> Optional[float]:
+        for tier in self.tiers:
+            expires_at = tier.get_expiration(url)
+            if expires_at is not None:
+                return expires_at
+        return None
+
+    def set(self, url: str, metadata: Dict, expires_at: float = None):
+        expires_at = self._expires_at(metadata, expires_at)
+        for tier in self.tiers:
+            tier.set(url, metadata, expires_at=expires_at)
+        self.stats.sets += 1
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def tier_stats(self) -> List[Dict[str, int]]:
+        return [tier.stats.to_dict() for tier in self.tiers]
+
+
+def create_metadata_cache(config: MetadataCacheConfig) -> Optional[MetadataCache]:
+    """
+    Create metadata cache from `config`. Returns None if caching is disabled.
+    """
+    if not config.enabled:
+        return None
+
+    ttls = {
+        "positive_ttl": config.positive_ttl,
+        "placeholder_ttl": config.placeholder_ttl,
+        "error_ttl": config.error_ttl,
+    }
+    memory_cache = InMemoryMetadataCache(max_entries=config.max_memory_entries, **ttls)
+    if not config.disk_path:
+        return memory_cache
+
+    try:
+        disk_cache = SQLiteMetadataCache(
+            config.disk_path, max_entries=config.max_disk_entries, **ttls
+        )
+    except sqlite3.Error as e:
+        logger.warning(
+            f"Failed to open metadata cache at {config.disk_path}: {e} -> using memory only"
+        )
+        return memory_cache
+
+    return TieredMetadataCache([memory_cache, disk_cache])
+
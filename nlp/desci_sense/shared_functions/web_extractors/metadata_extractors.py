@@ -1,12 +1,12 @@
-from typing import List, Dict
-import asyncio
+from typing import List, Dict, Optional, Tuple, Union
 from loguru import logger
 
 from ..configs import MetadataExtractionType
 
 from ..interface import RefMetadata
 
-from .citoid import fetch_citation, fetch_all_citations
+from .citoid import CitoidClient, get_citoid_client
+from .metadata_cache import MetadataCache
 from ..schema.post import RefPost
 from ..utils import flatten, remove_dups_ordered
 
@@ -60,7 +60,7 @@ def extract_citoid_metadata(target_url, max_summary_length):
     """
     TODO:
     """
-    citoid_metadata = [fetch_citation(target_url)]
+    citoid_metadata = fetch_urls_citoid_metadata([target_url])
     # TODO: This check is still valid when there is an error fetching the URL
     assert len(citoid_metadata) == 1
     normalized = normalize_citoid_metadata(
@@ -89,33 +89,131 @@ def extract_metadata_by_type(
         raise ValueError(f"Unsupported extraaction type:{md_type.value}")
 
 
+def get_cached_metadata(
+    target_urls: List[str],
+    cache: Optional[MetadataCache] = None,
+) -> Tuple[Dict[str, Dict], List[str]]:
+    """
+    Return dict of cached raw metadata for `target_urls` and list of distinct
+    URLs that still need to be fetched.
+    """
+    unique_urls = remove_dups_ordered(target_urls)
+    results = cache.get_many(unique_urls) if cache is not None else {}
+    urls_to_fetch = [url for url in unique_urls if url not in results]
+    if cache is not None and len(unique_urls) > 0:
+        logger.debug(
+            f"Metadata cache: {len(unique_urls) - len(urls_to_fetch)} hits, "
+            f"{len(urls_to_fetch)} to fetch"
+        )
+    return results, urls_to_fetch
+
+
+def add_fetched_metadata(
+    results: Dict[str, Dict],
+    fetched_urls: List[str],
+    fetched: List[Union[Dict, Exception]],
+    cache: Optional[MetadataCache] = None,
+):
+    """
+    Add fetched raw metadata to `results` and to `cache` if provided.
+    Exceptions are converted to `{"error": ...}` dicts.
+    """
+    for url, metadata in zip(fetched_urls, fetched):
+        if isinstance(metadata, Exception):
+            logger.warning(f"Failed fetching metadata for {url}: {metadata}")
+            metadata = {"error": str(metadata)}
+        results[url] = metadata
+        if cache is not None:
+            cache.set(url, metadata)
+
+
+def fetch_urls_citoid_metadata(
+    target_urls: List[str],
+    cache: Optional[MetadataCache] = None,
+    client: Optional[CitoidClient] = None,
+) -> List[Dict]:
+    """
+    Return raw Citoid metadata for each of `target_urls`.
+    If `cache` is provided, only URLs missing from the cache are fetched
+    (each one once) and the fetched results are added to the cache.
+    Failed lookups are returned as `{"error": ...}` dicts.
+    URLs are fetched using `client`, or the shared Citoid client if not provided.
+    """
+    results, urls_to_fetch = get_cached_metadata(target_urls, cache)
+    if len(urls_to_fetch) > 0:
+        client = client or get_citoid_client()
+        fetched = client.fetch_citations(urls_to_fetch)
+        add_fetched_metadata(results, urls_to_fetch, fetched, cache)
+
+    # normalization modifies the metadata so return a copy per target url
+    return [dict(results[url]) for url in target_urls]
+
+
+async def afetch_urls_citoid_metadata(
+    target_urls: List[str],
+    cache: Optional[MetadataCache] = None,
+    client: Optional[CitoidClient] = None,
+) -> List[Dict]:
+    """
+    Async version of `fetch_urls_citoid_metadata`.
+    """
+    results, urls_to_fetch = get_cached_metadata(target_urls, cache)
+    if len(urls_to_fetch) > 0:
+        client = client or get_citoid_client()
+        fetched = await client.afetch_citations(urls_to_fetch)
+        add_fetched_metadata(results, urls_to_fetch, fetched, cache)
+
+    return [dict(results[url]) for url in target_urls]
+
+
 def extract_urls_citoid_metadata(
     target_urls: List[str],
     max_summary_length: int,
+    cache: Optional[MetadataCache] = None,
+    client: Optional[CitoidClient] = None,
 ):
-    """_summary_
+    """
+    Return normalized Citoid metadata for each of `target_urls`.
 
     Args:
-        target_urls (List[str]): _description_
+        target_urls (List[str]): urls to extract metadata for
+        max_summary_length (int): maximum length of extracted summaries
+        cache (MetadataCache, optional): cache of raw metadata to use. Defaults to None.
+        client (CitoidClient, optional): client to fetch with. Defaults to the shared client.
     """
     if len(target_urls) == 0:
         return []
-    if len(target_urls) == 1:
-        return extract_citoid_metadata(target_urls[0], max_summary_length)
-    else:
-        # use parallel call
-        metadatas_raw = asyncio.run(fetch_all_citations(target_urls))
-        return normalize_citoid_metadata(target_urls, metadatas_raw, max_summary_length)
+    metadatas_raw = fetch_urls_citoid_metadata(target_urls, cache, client)
+    return normalize_citoid_metadata(target_urls, metadatas_raw, max_summary_length)
+
+
+async def aextract_urls_citoid_metadata(
+    target_urls: List[str],
+    max_summary_length: int,
+    cache: Optional[MetadataCache] = None,
+    client: Optional[CitoidClient] = None,
+):
+    """
+    Async version of `extract_urls_citoid_metadata`.
+    """
+    if len(target_urls) == 0:
+        return []
+    metadatas_raw = await afetch_urls_citoid_metadata(target_urls, cache, client)
+    return normalize_citoid_metadata(target_urls, metadatas_raw, max_summary_length)
 
 
 def extract_all_metadata_by_type(
-    target_urls, md_type: MetadataExtractionType, max_summary_length: int
+    target_urls,
+    md_type: MetadataExtractionType,
+    max_summary_length: int,
+    cache: Optional[MetadataCache] = None,
 ) -> List[RefMetadata]:
     """_summary_
 
     Args:
         target_url (_type_): _description_
         md_type (MetadataExtractionType): _description_
+        cache (MetadataCache, optional): cache of raw metadata to use. Defaults to None.
 
     Returns:
         List[RefMetadata]: _description_
@@ -123,21 +221,38 @@ def extract_all_metadata_by_type(
     if md_type == MetadataExtractionType.NONE:
         return []
     if md_type == MetadataExtractionType.CITOID:
-        return extract_urls_citoid_metadata(target_urls, max_summary_length)
+        return extract_urls_citoid_metadata(target_urls, max_summary_length, cache)
     else:
         raise ValueError(f"Unsupported extraction type:{md_type.value}")
 
 
-def extract_all_metadata_to_dict(
+async def aextract_all_metadata_by_type(
     target_urls,
     md_type: MetadataExtractionType,
     max_summary_length: int,
+    cache: Optional[MetadataCache] = None,
+) -> List[RefMetadata]:
+    """
+    Async version of `extract_all_metadata_by_type`.
+    """
+    if md_type == MetadataExtractionType.NONE:
+        return []
+    if md_type == MetadataExtractionType.CITOID:
+        return await aextract_urls_citoid_metadata(
+            target_urls, max_summary_length, cache
+        )
+    else:
+        raise ValueError(f"Unsupported extraction type:{md_type.value}")
+
+
+def metadata_list_to_dict(
+    target_urls: List[str],
+    md_list: List[RefMetadata],
 ) -> Dict[str, RefMetadata]:
-    md_list = extract_all_metadata_by_type(
-        target_urls,
-        md_type,
-        max_summary_length,
-    )
+    """
+    Return dict of metadata keyed by url. Urls of `target_urls` without
+    metadata are mapped to None.
+    """
     res_dict = {}
     urls_to_process = target_urls.copy()
 
@@ -157,14 +272,42 @@ def extract_all_metadata_to_dict(
     return res_dict
 
 
-def extract_posts_ref_metadata_dict(
+def extract_all_metadata_to_dict(
+    target_urls,
+    md_type: MetadataExtractionType,
+    max_summary_length: int,
+    cache: Optional[MetadataCache] = None,
+) -> Dict[str, RefMetadata]:
+    md_list = extract_all_metadata_by_type(
+        target_urls,
+        md_type,
+        max_summary_length,
+        cache,
+    )
+    return metadata_list_to_dict(target_urls, md_list)
+
+
+async def aextract_all_metadata_to_dict(
+    target_urls,
+    md_type: MetadataExtractionType,
+    max_summary_length: int,
+    cache: Optional[MetadataCache] = None,
+) -> Dict[str, RefMetadata]:
+    md_list = await aextract_all_metadata_by_type(
+        target_urls,
+        md_type,
+        max_summary_length,
+        cache,
+    )
+    return metadata_list_to_dict(target_urls, md_list)
+
+
+def get_posts_ref_urls(
     posts: List[RefPost],
-    md_type: MetadataExtractionType = MetadataExtractionType.CITOID,
     extra_urls: List[List[str]] = None,
-) -> Dict[str, RefMetadata]:
+) -> List[str]:
     """
-    Extract all reference urls from posts and fetch metadata for them.
-    Return dict of metadata keyed by url.
+    Return all reference urls of `posts`, followed by `extra_urls` if supplied.
     """
     all_ref_urls = list(set(flatten([p.md_ref_urls() for p in posts])))
 
@@ -172,9 +315,42 @@ def extract_posts_ref_metadata_dict(
     if extra_urls is None:
         extra_urls = [[] for _ in posts]
     all_ref_urls += remove_dups_ordered(flatten(extra_urls))
+    return all_ref_urls
+
 
+def extract_posts_ref_metadata_dict(
+    posts: List[RefPost],
+    md_type: MetadataExtractionType = MetadataExtractionType.CITOID,
+    extra_urls: List[List[str]] = None,
+    cache: Optional[MetadataCache] = None,
+    max_summary_length: int = 500,
+) -> Dict[str, RefMetadata]:
+    """
+    Extract all reference urls from posts and fetch metadata for them.
+    Return dict of metadata keyed by url.
+    If `cache` is provided, previously fetched metadata is reused.
+    Summaries are truncated to `max_summary_length` chars (-1 for full length).
+    """
+    all_ref_urls = get_posts_ref_urls(posts, extra_urls)
     md_dict = extract_all_metadata_to_dict(
-        all_ref_urls, md_type, max_summary_length=500
+        all_ref_urls, md_type, max_summary_length=max_summary_length, cache=cache
+    )
+    return md_dict
+
+
+async def aextract_posts_ref_metadata_dict(
+    posts: List[RefPost],
+    md_type: MetadataExtractionType = MetadataExtractionType.CITOID,
+    extra_urls: List[List[str]] = None,
+    cache: Optional[MetadataCache] = None,
+    max_summary_length: int = 500,
+) -> Dict[str, RefMetadata]:
+    """
+    Async version of `extract_posts_ref_metadata_dict`.
+    """
+    all_ref_urls = get_posts_ref_urls(posts, extra_urls)
+    md_dict = await aextract_all_metadata_to_dict(
+        all_ref_urls, md_type, max_summary_length=max_summary_length, cache=cache
     )
     return md_dict
 
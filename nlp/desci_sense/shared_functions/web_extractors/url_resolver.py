@@ -0,0 +1,192 @@
+"""
+Batched resolution (unshortening) of URLs by following their redirects.
+"""
+
+from typing import Dict, Iterable, List, Optional
+from collections import OrderedDict
+from urllib.parse import urlparse
+import asyncio
+import threading
+import time
+
+import aiohttp
+from loguru import logger
+
+from ..async_utils import run_coroutine_sync
+
+
+# domains that don't shorten or redirect their https urls, so there is no need to
+# make a request to resolve them
+DEFAULT_NON_SHORTENING_DOMAINS = frozenset(
+    [
+        "x.com",
+        "bsky.app",
+        "github.com",
+        "arxiv.org",
+        "en.wikipedia.org",
+    ]
+)
+
+
+def get_domain(url: str) -> str:
+    try:
+        domain = urlparse(url).netloc.lower()
+    except ValueError:
+        return ""
+    if domain.startswith("www."):
+        domain = domain[4:]
+    return domain
+
+
+class URLResolver:
+    """
+    Resolves URLs to their final location after redirects.
+    Requests are made concurrently, with at most `max_per_domain` requests
+    in flight per domain and `max_concurrency` overall. Resolved URLs are cached
+    for `cache_ttl` seconds. URLs that fail to resolve are returned unchanged
+    and this outcome is cached for `error_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 20,
+        max_per_domain: int = 4,
+        timeout: float = 10,
+        cache_ttl: float = 24 * 60 * 60,
+        error_ttl: float = 5 * 60,
+        max_cache_entries: int = 10000,
+        non_shortening_domains: Iterable[str] = DEFAULT_NON_SHORTENING_DOMAINS,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_per_domain = max_per_domain
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.error_ttl = error_ttl
+        self.max_cache_entries = max_cache_entries
+        self.non_shortening_domains = frozenset(non_shortening_domains)
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def skip_resolution(self, url: str) -> bool:
+        """
+        True if `url` is known to resolve to itself.
+        """
+        return (
+            url.startswith("https://")
+            and get_domain(url) in self.non_shortening_domains
+        )
+
+    def get_cached(self, url: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(url)
+            if entry is None:
+                return None
+            resolved_url, expires_at = entry
+            if expires_at <= time.time():
+                del self._cache[url]
+                return None
+            self._cache.move_to_end(url)
+            return resolved_url
+
+    def add_to_cache(self, url: str, resolved_url: str, ttl: float = None):
+        ttl = self.cache_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._cache[url] = (resolved_url, expires_at)
+            self._cache.move_to_end(url)
+            # the final url of a redirect chain resolves to itself
+            self._cache[resolved_url] = (resolved_url, expires_at)
+            self._cache.move_to_end(resolved_url)
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    async def _resolve_url(
+        self,
+        url: str,
+        session: aiohttp.ClientSession,
+        semaphore: asyncio.Semaphore,
+        domain_semaphore: asyncio.Semaphore,
+    ) -> str:
+        async with semaphore, domain_semaphore:
+            try:
+                async with session.head(url, allow_redirects=True) as response:
+                    resolved_url = str(response.url)
+            except Exception as e:
+                logger.warning(f"[URLResolver] Failed to resolve url {url}: {e}")
+                # return original url in case of errors
+                self.add_to_cache(url, url, ttl=self.error_ttl)
+                return url
+        self.add_to_cache(url, resolved_url)
+        return resolved_url
+
+    async def aresolve_urls(self, urls: List[str]) -> List[str]:
+        """
+        Return the resolved form of each url in `urls`. Each distinct url is
+        requested at most once, and only if it isn't cached or skipped.
+        """
+        resolved: Dict[str, str] = {}
+        to_resolve = []
+        for url in urls:
+            if url in resolved:
+                continue
+            if self.skip_resolution(url):
+                resolved[url] = url
+                continue
+            cached = self.get_cached(url)
+            if cached is not None:
+                resolved[url] = cached
+            else:
+                to_resolve.append(url)
+                # placeholder until resolved
+                resolved[url] = url
+
+        if len(to_resolve) > 0:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            domain_semaphores = {}
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                tasks = []
+                for url in to_resolve:
+                    domain = get_domain(url)
+                    if domain not in domain_semaphores:
+                        domain_semaphores[domain] = asyncio.Semaphore(
+                            self.max_per_domain
+                        )
+                    tasks.append(
+                        self._resolve_url(
+                            url, session, semaphore, domain_semaphores[domain]
+                        )
+                    )
+                results = await asyncio.gather(*tasks)
+            resolved.update(zip(to_resolve, results))
+
+        return [resolved[url] for url in urls]
+
+    def resolve_urls(self, urls: List[str]) -> List[str]:
+        """
+        Synchronous version of `aresolve_urls`.
+        """
+        # avoid starting an event loop when everything is cached or skipped
+        results = []
+        for url in urls:
+            resolved_url = url if self.skip_resolution(url) else self.get_cached(url)
+            if resolved_url is None:
+                return run_coroutine_sync(self.aresolve_urls(urls))
+            results.append(resolved_url)
+        return results
+
+
+# default resolver shared by the whole process
+url_resolver = URLResolver()
+
+
+def resolve_urls(urls: List[str]) -> List[str]:
+    return url_resolver.resolve_urls(urls)
+
+
+async def aresolve_urls(urls: List[str]) -> List[str]:
+    return await url_resolver.aresolve_urls(urls)
@@ -0,0 +1,78 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import asyncio
+from rdflib import Literal
+
+from desci_sense.shared_functions.configs import PostProcessType
+from desci_sense.shared_functions.interface import ParsePostRequest, ParserResult
+from desci_sense.shared_functions.preprocessing import (
+    convert_parse_request_to_parser_input,
+)
+from desci_sense.shared_functions.schema.helpers import convert_text_to_ref_post
+
+from utils import create_hashtags_parser_for_tests, create_parse_request
+
+
+def get_thread_request(hashtag: str):
+    return create_parse_request(f"Thoughts on #{hashtag}", "More on this #followup")
+
+
+def test_aprocess_parse_request():
+    parser = create_hashtags_parser_for_tests()
+
+    # accepts both raw and validated requests
+    raw_request = get_thread_request("science")
+    res = asyncio.run(parser.aprocess_parse_request(raw_request))
+    assert isinstance(res, ParserResult)
+    assert Literal("science") in res.semantics.all_nodes()
+    assert Literal("followup") in res.semantics.all_nodes()
+
+    val_request = ParsePostRequest.model_validate(get_thread_request("science"))
+    sync_res = parser.process_parse_request(val_request)
+    async_res = asyncio.run(parser.aprocess_parse_request(val_request))
+    assert set(async_res.semantics) == set(sync_res.semantics)
+
+
+def test_concurrent_requests_one_loop():
+    parser = create_hashtags_parser_for_tests()
+    hashtags = [f"topic{i}" for i in range(5)]
+
+    async def run_all():
+        return await asyncio.gather(
+            *[parser.aprocess_parse_request(get_thread_request(h)) for h in hashtags]
+        )
+
+    results = asyncio.run(run_all())
+    for hashtag, res in zip(hashtags, results):
+        assert Literal(hashtag) in res.semantics.all_nodes()
+
+
+def test_abatch_process_parser_inputs():
+    parser = create_hashtags_parser_for_tests()
+    hashtags = [f"batch{i}" for i in range(4)]
+    inputs = [
+        convert_parse_request_to_parser_input(
+            ParsePostRequest.model_validate(get_thread_request(h))
+        )
+        for h in hashtags
+    ]
+    results = asyncio.run(parser.abatch_process_parser_inputs(inputs, batch_size=2))
+    assert len(results) == len(hashtags)
+    for hashtag, res in zip(hashtags, results):
+        assert Literal(hashtag) in res.semantics.all_nodes()
+
+
+def test_sync_batch_inside_running_loop():
+    parser = create_hashtags_parser_for_tests(PostProcessType.NONE)
+    posts = [convert_text_to_ref_post(f"#tag{i} post") for i in range(3)]
+
+    async def run_sync_batch():
+        # sync api called from async code shouldn't fail on asyncio.run
+        return parser.batch_process_ref_posts(posts)
+
+    results = asyncio.run(run_sync_batch())
+    assert [r["hashtags"].answer for r in results] == [["tag0"], ["tag1"], ["tag2"]]
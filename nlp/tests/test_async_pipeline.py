@@ -0,0 +1,124 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import asyncio
+import pytest
+
+from desci_sense.shared_functions.async_utils import apipeline
+from desci_sense.shared_functions.configs import (
+    HashtagPParserChainConfig,
+    MetadataExtractionConfig,
+    MetadataExtractionType,
+    MultiParserChainConfig,
+    PipelineConfig,
+)
+from desci_sense.shared_functions.parsers.multi_chain_parser import MultiChainParser
+from desci_sense.shared_functions.schema.helpers import convert_text_to_ref_post
+
+
+def collect(agen):
+    async def run():
+        return [x async for x in agen]
+
+    return asyncio.run(run())
+
+
+def test_slow_item_does_not_block_others():
+    async def slow_first(x):
+        await asyncio.sleep(0.2 if x == 0 else 0)
+        return x
+
+    async def double(x):
+        return 2 * x
+
+    results = collect(apipeline(range(5), [(slow_first, 3), (double, 1)]))
+    assert sorted(results) == [(i, 2 * i) for i in range(5)]
+    # slow item finishes last
+    assert results[-1] == (0, 0)
+
+
+def test_stage_concurrency_bounded():
+    active = []
+    max_active = []
+
+    async def track(x):
+        active.append(x)
+        max_active.append(len(active))
+        await asyncio.sleep(0.01)
+        active.remove(x)
+        return x
+
+    collect(apipeline(range(10), [(track, 2)], queue_size=1))
+    assert max(max_active) == 2
+
+
+def test_exceptions():
+    async def fail_on_odd(x):
+        if x % 2:
+            raise ValueError(f"odd {x}")
+        return x
+
+    async def identity(x):
+        return x
+
+    stages = [(fail_on_odd, 2), (identity, 2)]
+    results = dict(collect(apipeline(range(4), stages, return_exceptions=True)))
+    assert results[0] == 0
+    assert isinstance(results[1], ValueError)
+
+    with pytest.raises(ValueError):
+        collect(apipeline(range(4), stages))
+
+
+def test_cancelled_work_unwinds():
+    cleaned_up = []
+
+    async def fail_or_wait(x):
+        if x == 0:
+            raise ValueError("failed")
+        try:
+            await asyncio.sleep(10)
+        finally:
+            cleaned_up.append(x)
+        return x
+
+    async def run():
+        with pytest.raises(ValueError):
+            async for _ in apipeline(range(3), [(fail_or_wait, 3)]):
+                pass
+        # cancelled stage calls have finished by the time the error is raised
+        return sorted(cleaned_up)
+
+    assert asyncio.run(run()) == [1, 2]
+
+
+def test_stream_process_ref_posts():
+    config = MultiParserChainConfig(
+        parser_configs=[HashtagPParserChainConfig(name="hashtags")],
+        metadata_extract_config=MetadataExtractionConfig(
+            extraction_method=MetadataExtractionType.NONE
+        ),
+    )
+    parser = MultiChainParser(config)
+    posts = [convert_text_to_ref_post(f"#tag{i} post") for i in range(6)]
+    pipeline_config = PipelineConfig(metadata_concurrency=2, llm_concurrency=3)
+
+    results = dict(
+        collect(
+            parser.astream_process_ref_posts(posts, pipeline_config=pipeline_config)
+        )
+    )
+    assert sorted(results.keys()) == list(range(6))
+    for i, res in results.items():
+        assert res["hashtags"].answer == [f"tag{i}"]
+
+
+def test_pipeline_config_env(monkeypatch):
+    monkeypatch.setenv("QUEUE_SIZE", "1")
+    monkeypatch.setenv("LLM_CONCURRENCY", "1")
+    assert PipelineConfig() == PipelineConfig(queue_size=10, llm_concurrency=5)
+    monkeypatch.setenv("PIPELINE_QUEUE_SIZE", "2")
+    assert PipelineConfig().queue_size == 2
@@ -0,0 +1,133 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import json
+
+import pytest
+
+from desci_sense.shared_functions.configs import HedgeConfig, PostProcessType
+from desci_sense.shared_functions.interface import ParserResult
+from desci_sense.shared_functions.parsers.checkpoint import CheckpointedBatchRunner
+from desci_sense.shared_functions.postprocessing import CombinedParserOutput
+from desci_sense.shared_functions.schema.helpers import convert_text_to_ref_post
+
+from utils import create_hashtags_parser_for_tests
+
+
+def create_parser(post_process_type=PostProcessType.COMBINED, **kwargs):
+    parser = create_hashtags_parser_for_tests(post_process_type, **kwargs)
+    parser.processed = []
+    post_process_raw_results = parser.post_process_raw_results
+
+    # record processed posts, and fail posts marked as such
+    def post_process(post, *args):
+        parser.processed.append(post.content)
+        if "#fail" in post.content:
+            raise ValueError(f"failed {post.content}")
+        return post_process_raw_results(post, *args)
+
+    parser.post_process_raw_results = post_process
+    return parser
+
+
+def create_posts(n: int):
+    return [convert_text_to_ref_post(f"#tag{i} post") for i in range(n)]
+
+
+def test_resume_from_checkpoint(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    posts = create_posts(6)
+    parser = create_parser()
+    results = CheckpointedBatchRunner(parser, path).run(posts[:4])
+    assert [r.hashtags for r in results] == [[f"tag{i}"] for i in range(4)]
+    assert len(path.read_text().splitlines()) == 4
+
+    # a new run only processes posts missing from the checkpoint
+    parser = create_parser()
+    runner = CheckpointedBatchRunner(parser, path, batch_size=2)
+    resumed = runner.run(posts + posts[:1])
+    assert sorted(parser.processed) == ["#tag4 post", "#tag5 post"]
+    assert resumed[:4] == results
+    assert resumed[-1] == results[0]
+    assert all(isinstance(r, CombinedParserOutput) for r in resumed)
+    assert len(path.read_text().splitlines()) == 6
+
+
+def test_failed_posts_are_retried(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    posts = create_posts(3) + [convert_text_to_ref_post("#fail post")]
+    parser = create_parser()
+    with pytest.raises(ValueError):
+        CheckpointedBatchRunner(parser, path).run(posts)
+    # results of the other posts are kept
+    assert len(path.read_text().splitlines()) == 3
+
+    parser = create_parser()
+    results = CheckpointedBatchRunner(parser, path).run(posts, return_exceptions=True)
+    assert parser.processed == ["#fail post"]
+    assert isinstance(results[3], ValueError)
+    assert results[0].hashtags == ["tag0"]
+
+
+def test_truncated_checkpoint(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    posts = create_posts(3)
+    CheckpointedBatchRunner(create_parser(), path).run(posts)
+    # cut the last line short, as by a crash while writing it
+    path.write_text(path.read_text()[:-20])
+
+    parser = create_parser()
+    results = CheckpointedBatchRunner(parser, path).run(posts)
+    assert len(parser.processed) == 1
+    assert [r.hashtags for r in results] == [[f"tag{i}"] for i in range(3)]
+
+    # the record appended after the truncated line is kept
+    parser = create_parser()
+    CheckpointedBatchRunner(parser, path).run(posts)
+    assert parser.processed == []
+
+
+def test_checkpoint_keyed_by_config(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    posts = create_posts(2)
+    CheckpointedBatchRunner(create_parser(), path).run(posts)
+
+    # settings that don't change results reuse the checkpoint
+    parser = create_parser(batch_size=1, coalesce_requests=False)
+    CheckpointedBatchRunner(parser, path).run(posts)
+    assert parser.processed == []
+
+    # including settings of each chain
+    parser = create_parser()
+    chain_config = parser.config.parser_configs[0]
+    chain_config.hedge_config = HedgeConfig(max_workers=4)
+    chain_config.prompt_cache_control = True
+    chain_config.llm_config.use_cache = False
+    CheckpointedBatchRunner(parser, path).run(posts)
+    assert parser.processed == []
+
+    # and of the metadata cache and API endpoint
+    parser = create_parser()
+    cache_config = parser.config.metadata_extract_config.cache_config
+    cache_config.disk_path = str(tmp_path / "metadata_cache")
+    cache_config.positive_ttl = 60
+    cache_config.max_memory_entries = 10
+    parser.config.openrouter_api_config.openrouter_api_base = "http://localhost:8000"
+    CheckpointedBatchRunner(parser, path).run(posts)
+    assert parser.processed == []
+
+    # results of a different config are computed and stored alongside
+    parser = create_parser(PostProcessType.FIREBASE)
+    runner = CheckpointedBatchRunner(parser, path)
+    results = runner.run(posts)
+    assert len(parser.processed) == 2
+    assert all(isinstance(r, ParserResult) for r in results)
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len({r["config_hash"] for r in records}) == 2
+    assert runner.load_completed().keys() == {r["key"] for r in records[2:]}
+
+    with pytest.raises(ValueError):
+        CheckpointedBatchRunner(create_parser(PostProcessType.NONE), path)
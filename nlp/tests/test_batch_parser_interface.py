@@ -0,0 +1,137 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+from rdflib import Literal
+
+from desci_sense.shared_functions.configs import (
+    MetadataCacheConfig,
+    MetadataExtractionConfig,
+    MetadataExtractionType,
+)
+from desci_sense.shared_functions.interface import (
+    ParseBatchResponse,
+    ParsePostRequest,
+)
+from desci_sense.shared_functions.main import (
+    SM_FUNCTION_batch_post_parser_imp,
+    get_parser_registry_key,
+)
+from desci_sense.shared_functions.parsers.multi_chain_parser import MultiChainParser
+from desci_sense.shared_functions.parsers.parser_registry import parser_registry
+from desci_sense.shared_functions.preprocessing import (
+    convert_parse_request_to_parser_input,
+)
+from desci_sense.shared_functions.web_extractors import metadata_extractors
+from desci_sense.shared_functions.web_extractors.url_resolver import url_resolver
+
+from utils import (
+    TEST_AUTHOR,
+    create_hashtags_config_for_tests,
+    create_parse_request,
+)
+
+# model names only used to get a registry key unique to this test
+PARSER_CONFIG = {
+    "openrouter_api_key": "test-key",
+    "openrouter_api_base": "https://openrouter.ai/api/v1",
+    "openrouter_referer": "https://127.0.0.1:3000/",
+    "ref_tagger_llm_type": "test/batch-ref-tagger",
+    "kw_llm_type": "test/batch-kw",
+    "topic_llm_type": "test/batch-topics",
+}
+
+
+def get_hashtags_parser():
+    # register a parser running only the hashtags chain (no LLM calls)
+    return parser_registry.get_or_create(
+        get_parser_registry_key(PARSER_CONFIG), create_hashtags_config_for_tests
+    )
+
+
+def test_batch_per_item_errors():
+    get_hashtags_parser()
+    batch_request = {
+        "requests": [
+            create_parse_request("First post #alpha"),
+            {"post": {"author": TEST_AUTHOR}},  # missing thread
+            create_parse_request("Third post #gamma"),
+            {"post": "not a thread"},
+            {"post": {"author": TEST_AUTHOR, "thread": "not a list"}},
+        ]
+    }
+    response = SM_FUNCTION_batch_post_parser_imp(batch_request, PARSER_CONFIG)
+
+    assert [r.index for r in response.results] == [0, 1, 2, 3, 4]
+    assert response.results[0].error is None
+    assert Literal("alpha") in response.results[0].result.semantics.all_nodes()
+    assert response.results[1].result is None
+    assert "Invalid request" in response.results[1].error
+    assert Literal("gamma") in response.results[2].result.semantics.all_nodes()
+    for result in response.results[3:]:
+        assert result.result is None
+        assert "Invalid request" in result.error
+
+    # response can be serialized and loaded back
+    loaded = ParseBatchResponse.model_validate_json(response.model_dump_json())
+    assert Literal("gamma") in loaded.results[2].result.semantics.all_nodes()
+
+
+def test_batch_process_return_exceptions():
+    parser = get_hashtags_parser()
+    inputs = [
+        convert_parse_request_to_parser_input(
+            ParsePostRequest.model_validate(create_parse_request(f"Post #tag{i}"))
+        )
+        for i in range(3)
+    ]
+    # invalid input - missing thread
+    inputs[1].thread_post = None
+
+    results = parser.batch_process_parser_inputs(inputs, return_exceptions=True)
+    assert isinstance(results[1], Exception)
+    assert Literal("tag0") in results[0].semantics.all_nodes()
+    assert Literal("tag2") in results[2].semantics.all_nodes()
+
+
+class FakeCitoidClient:
+    def __init__(self):
+        self.requests = []
+
+    async def afetch_citations(self, urls):
+        self.requests.append(sorted(urls))
+        return [ValueError("not found") for _ in urls]
+
+
+def test_batch_fetches_metadata_once_without_cache(monkeypatch):
+    client = FakeCitoidClient()
+    monkeypatch.setattr(metadata_extractors, "get_citoid_client", lambda: client)
+    urls = ["https://example.org/paper/1", "https://example.org/paper/2"]
+    for url in urls:
+        url_resolver.add_to_cache(url, url)
+
+    config = create_hashtags_config_for_tests()
+    config.metadata_extract_config = MetadataExtractionConfig(
+        extraction_method=MetadataExtractionType.CITOID,
+        cache_config=MetadataCacheConfig(enabled=False),
+    )
+    parser = MultiChainParser(config)
+    assert parser.metadata_cache is None
+    inputs = [
+        convert_parse_request_to_parser_input(
+            ParsePostRequest.model_validate(create_parse_request(content))
+        )
+        for content in [
+            f"First #alpha {urls[0]}",
+            f"Second #beta {urls[0]} {urls[1]}",
+            f"Third #gamma {urls[1]}",
+        ]
+    ]
+
+    results = parser.batch_process_parser_inputs(inputs)
+
+    # distinct urls of the batch are fetched in a single pass
+    assert client.requests == [urls]
+    assert Literal("gamma") in results[2].semantics.all_nodes()
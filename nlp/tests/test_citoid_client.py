@@ -0,0 +1,127 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pytest
+
+from desci_sense.shared_functions.configs import CitoidClientConfig
+from desci_sense.shared_functions.web_extractors.citoid import CitoidClient
+from desci_sense.shared_functions.web_extractors.metadata_extractors import (
+    extract_urls_citoid_metadata,
+)
+
+
+class FakeCitoidHandler(BaseHTTPRequestHandler):
+    # keep-alive connections
+    protocol_version = "HTTP/1.1"
+    client_ports = set()
+    requested_urls = []
+    delay = 0
+
+    def do_GET(self):
+        FakeCitoidHandler.client_ports.add(self.client_address[1])
+        FakeCitoidHandler.requested_urls.append(self.path)
+        time.sleep(FakeCitoidHandler.delay)
+        target_url = unquote(self.path.split("/")[-1])
+        body = json.dumps(
+            [
+                {
+                    "itemType": "webpage",
+                    "title": f"Title of {target_url}",
+                    "url": target_url,
+                }
+            ]
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def citoid_client():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeCitoidHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    FakeCitoidHandler.client_ports = set()
+    FakeCitoidHandler.requested_urls = []
+    FakeCitoidHandler.delay = 0
+    client = CitoidClient(
+        CitoidClientConfig(
+            base_url=f"http://127.0.0.1:{server.server_port}/zotero/",
+            max_concurrency=2,
+        )
+    )
+    yield client
+    client.close()
+    server.shutdown()
+
+
+def test_sync_fetch(citoid_client):
+    urls = [f"https://example.org/{i}" for i in range(6)]
+    res = citoid_client.fetch_citations(urls)
+    assert [r["title"] for r in res] == [f"Title of {url}" for url in urls]
+
+    # social media urls don't call citoid
+    res = citoid_client.fetch_citation("https://x.com/user/status/1")
+    assert res["itemType"] == "forumPost"
+
+
+def test_connections_reused(citoid_client):
+    for _ in range(3):
+        citoid_client.fetch_citations([f"https://example.org/{i}" for i in range(4)])
+    # at most `max_concurrency` connections opened over all batches
+    assert len(FakeCitoidHandler.client_ports) <= 2
+
+
+def test_async_fetch_from_other_loops(citoid_client):
+    async def fetch(i):
+        return await citoid_client.afetch_citations([f"https://example.org/{i}"])
+
+    for i in range(2):
+        res = asyncio.run(fetch(i))
+        assert res[0]["title"] == f"Title of https://example.org/{i}"
+
+
+def test_extract_with_client(citoid_client):
+    urls = ["https://example.org/a", "https://example.org/b"]
+    res = extract_urls_citoid_metadata(
+        urls, max_summary_length=30, client=citoid_client
+    )
+    assert [r.title for r in res] == [f"Title of {url}" for url in urls]
+    assert [r.url for r in res] == urls
+
+
+def test_concurrent_lookups_coalesced(citoid_client):
+    FakeCitoidHandler.delay = 0.2
+    url = "https://example.org/paper"
+
+    async def fetch_all():
+        return await asyncio.gather(
+            *[citoid_client.afetch_citation(url) for _ in range(5)],
+            citoid_client.afetch_citations([url, url]),
+        )
+
+    *results, batch_results = asyncio.run(fetch_all())
+    results += batch_results
+    assert len(FakeCitoidHandler.requested_urls) == 1
+    assert all(r == results[0] for r in results)
+    # callers get their own copy of the metadata
+    assert len({id(r) for r in results}) == len(results)
+
+    # lookups are not cached once done
+    citoid_client.fetch_citation(url)
+    assert len(FakeCitoidHandler.requested_urls) == 2
@@ -0,0 +1,132 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from desci_sense.shared_functions.filters import SciFilterClassfication
+from desci_sense.shared_functions.interface import RefMetadata
+from desci_sense.shared_functions.postprocessing import CombinedParserOutput
+from desci_sense.shared_functions.preprocessing.threads import create_thread_from_posts
+from desci_sense.shared_functions.schema.columnar import (
+    iter_outputs,
+    iter_posts,
+    outputs_to_table,
+    posts_to_table,
+    read_table,
+    table_to_outputs,
+    table_to_posts,
+    write_table,
+)
+from desci_sense.shared_functions.schema.post import QuoteRefPost, RefPost
+
+
+def create_posts():
+    quoted = RefPost(
+        author="alice",
+        content="new preprint https://example.org/1",
+        url="https://x.com/alice/status/1",
+        ref_urls=["https://example.org/1"],
+        ref_url_spans=[(13, 34, "https://example.org/1")],
+        created_at=datetime(2024, 1, 1, 12, tzinfo=timezone.utc),
+        source_network="twitter",
+    )
+    quote = QuoteRefPost(
+        author="bob",
+        content="worth reading",
+        url="https://x.com/bob/status/2",
+        quoted_url=quoted.url,
+        quoted_post=quoted,
+        metadata={"id": 2, "tags": ["a"]},
+        is_reply=True,
+    )
+    second = QuoteRefPost(
+        author="bob",
+        content="see also https://example.org/2",
+        url="https://x.com/bob/status/3",
+        ref_urls=["https://example.org/2"],
+    )
+    thread = create_thread_from_posts([quote, second])
+    return [quoted, quote, thread]
+
+
+def create_outputs():
+    output = CombinedParserOutput(
+        post_url="https://x.com/alice/status/1",
+        research_keyword="academic",
+        filter_classification=SciFilterClassfication.AI_DETECTED_RESEARCH,
+        item_types=["preprint"],
+        reference_urls=["https://example.org/1"],
+        multi_reference_tagger=[["cites", "discusses"]],
+        keywords=["replication"],
+        topics=["science"],
+        metadata_list=[
+            RefMetadata(
+                ref_id=1,
+                order=1,
+                citoid_url=None,
+                url="https://example.org/1",
+                item_type="preprint",
+                title="A preprint",
+                debug={"source": "citoid"},
+            )
+        ],
+        debug={"keywords": {"reasoning": "about replication"}},
+    )
+    return [output, CombinedParserOutput(post_url="https://x.com/bob/status/2")]
+
+
+def test_posts_round_trip():
+    posts = create_posts()
+    table = posts_to_table(posts)
+    assert table.num_rows == 3
+    assert table.column("type").to_pylist() == [
+        "ReferencePost",
+        "QuoteRefPost",
+        "ThreadRefPost",
+    ]
+    converted = table_to_posts(table)
+    assert [type(p) for p in converted] == [type(p) for p in posts]
+    assert converted == posts
+    assert converted[2].posts[0].quoted_post == posts[0]
+
+
+@pytest.mark.parametrize("name", ["posts.parquet", "posts.arrow"])
+def test_posts_file(tmp_path, name):
+    path = tmp_path / name
+    posts = create_posts()
+    write_table(posts_to_table(posts), path)
+    assert list(iter_posts(path, batch_size=2)) == posts
+
+    # only projected columns are read
+    table = read_table(path, columns=["author", "ref_urls"])
+    assert table.column_names == ["author", "ref_urls"]
+    df = table.to_pandas()
+    assert list(df["author"]) == ["alice", "bob", "bob"]
+
+    posts = list(iter_posts(path, columns=["type", "author", "content", "url", "posts"]))
+    assert posts[0].ref_urls == []
+    assert len(posts[2].posts) == 2
+
+
+def test_outputs_round_trip(tmp_path):
+    outputs = create_outputs()
+    table = outputs_to_table(outputs)
+    assert table_to_outputs(table) == outputs
+    assert table.column("filter_classification").to_pylist() == [
+        "ai_detected_research",
+        "not_classified",
+    ]
+
+    path = tmp_path / "outputs.parquet"
+    write_table(table, path)
+    assert list(iter_outputs(path, batch_size=1)) == outputs
+    converted = list(iter_outputs(path, columns=["post_url", "keywords"]))
+    assert [o.keywords for o in converted] == [["replication"], []]
+    assert converted[0].metadata_list == []
@@ -0,0 +1,210 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from desci_sense.shared_functions.configs import (
+    HedgeConfig,
+    KeywordPParserChainConfig,
+    LLMConfig,
+    MetadataExtractionConfig,
+    MetadataExtractionType,
+    MultiParserChainConfig,
+)
+from desci_sense.shared_functions.parsers.hedging import (
+    HedgeBudget,
+    HedgedChatModel,
+    HedgePolicy,
+    LatencyTracker,
+)
+from desci_sense.shared_functions.parsers.multi_chain_parser import MultiChainParser
+
+
+class SlowChatModel(BaseChatModel):
+    # answers with its name after the next delay in `delays` (or fails if the
+    # delay is negative), and records cancelled calls
+    name: str
+    delays: List[float]
+    cancelled: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-chat-model"
+
+    def _result(self, delay: float) -> ChatResult:
+        if delay < 0:
+            raise ValueError(f"{self.name} failed")
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=self.name))]
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay = self.delays.pop(0)
+        time.sleep(abs(delay))
+        return self._result(delay)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay = self.delays.pop(0)
+        try:
+            await asyncio.sleep(abs(delay))
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self._result(delay)
+
+
+def create_hedged_model(primary_delays, secondary_delays, **kwargs):
+    config = HedgeConfig(
+        enabled=True,
+        initial_delay=0.1,
+        max_hedge_fraction=1,
+        max_hedge_burst=1,
+        **kwargs,
+    )
+    return HedgedChatModel(
+        primary=SlowChatModel(name="primary", delays=primary_delays),
+        secondary=SlowChatModel(name="secondary", delays=secondary_delays),
+        policy=HedgePolicy(config),
+    )
+
+
+def test_latency_tracker():
+    latencies = LatencyTracker(window_size=100)
+    assert latencies.percentile(95) is None
+    for i in range(1, 201):
+        latencies.record(i)
+    # only the last 100 latencies are kept
+    assert len(latencies) == 100
+    assert latencies.percentile(95) == 195
+    assert latencies.percentile(0) == 101
+
+
+def test_hedge_budget():
+    budget = HedgeBudget(max_hedge_fraction=0.25, max_hedge_burst=2)
+    hedges = []
+    for _ in range(20):
+        budget.deposit()
+        hedges.append(budget.withdraw())
+    assert sum(hedges) == 5
+    assert hedges[:4] == [False, False, False, True]
+
+    for _ in range(100):
+        budget.deposit()
+    assert budget.balance == 2
+
+
+def test_hedge_delay():
+    policy = HedgePolicy(
+        HedgeConfig(initial_delay=5, min_samples=10, min_delay=0.5)
+    )
+    for latency in range(10):
+        assert policy.hedge_delay() == 5
+        policy.latencies.record(latency / 10)
+    assert policy.hedge_delay() == 0.9
+    policy = HedgePolicy(HedgeConfig(min_samples=1, min_delay=0.5))
+    policy.latencies.record(0.1)
+    assert policy.hedge_delay() == 0.5
+
+
+def test_sync_hedge_wins():
+    model = create_hedged_model([1.0], [0.05])
+    start = time.perf_counter()
+    assert model.invoke("hi").content == "secondary"
+    assert time.perf_counter() - start < 0.5
+    assert model.stats.hedges == model.stats.hedge_wins == 1
+
+    # fast calls aren't hedged
+    model.primary.delays = [0.0]
+    assert model.invoke("hi").content == "primary"
+    assert model.stats.calls == 2
+    assert model.stats.hedges == 1
+
+
+def test_async_hedge_wins_and_cancels_primary():
+    model = create_hedged_model([1.0], [0.05])
+    start = time.perf_counter()
+    assert asyncio.run(model.ainvoke("hi")).content == "secondary"
+    assert time.perf_counter() - start < 0.5
+    assert model.primary.cancelled == 1
+    assert model.stats.hedge_win_rate == 1
+    # the cancelled primary's latency is recorded up to when it was cancelled
+    assert len(model.policy.latencies) == 2
+    assert model.policy.latencies.percentile(100) >= 0.1
+
+
+def test_hedge_loses():
+    model = create_hedged_model([0.2], [1.0])
+    assert asyncio.run(model.ainvoke("hi")).content == "primary"
+    assert model.secondary.cancelled == 1
+    assert model.stats.hedges == 1
+    assert model.stats.hedge_wins == 0
+
+
+def test_failed_call_uses_other():
+    # primary fails after the hedge is sent
+    model = create_hedged_model([-0.2], [0.3])
+    assert model.invoke("hi").content == "secondary"
+    model = create_hedged_model([-0.2], [0.3])
+    assert asyncio.run(model.ainvoke("hi")).content == "secondary"
+
+
+def test_hedge_budget_exhausted():
+    model = create_hedged_model([0.2, 0.2], [0.0])
+    model.policy.budget.max_hedge_fraction = 0.5
+    # the budget allows hedging one of two calls
+    assert model.invoke("hi").content == "primary"
+    assert model.invoke("hi").content == "secondary"
+    assert model.stats.budget_exhausted == 1
+    assert model.stats.hedge_rate == 0.5
+
+
+def test_sync_calls_pool_size():
+    model = create_hedged_model([0.5] * 4, [0.0] * 4, max_workers=5)
+    with ThreadPoolExecutor(max_workers=4) as callers:
+        results = list(callers.map(lambda _: model.invoke("hi").content, range(4)))
+    # the pool runs the primaries and the single hedge the budget allows
+    assert sorted(results) == ["primary"] * 3 + ["secondary"]
+    assert model.policy.executor._max_workers == 5
+    assert create_hedged_model([], []).policy.executor._max_workers == 16
+
+
+def test_hedge_config_env(monkeypatch):
+    monkeypatch.setenv("ENABLED", "true")
+    monkeypatch.setenv("MAX_WORKERS", "2")
+    assert HedgeConfig() == HedgeConfig(enabled=False, max_workers=16)
+    monkeypatch.setenv("HEDGE_ENABLED", "true")
+    assert HedgeConfig().enabled
+
+
+def test_chain_hedging_config():
+    config = MultiParserChainConfig(
+        parser_configs=[
+            KeywordPParserChainConfig(
+                name="keywords",
+                llm_config=LLMConfig(llm_type="test/primary"),
+                hedge_config=HedgeConfig(
+                    enabled=True, secondary_llm_type="test/secondary"
+                ),
+            ),
+            KeywordPParserChainConfig(name="other_keywords"),
+        ],
+        metadata_extract_config=MetadataExtractionConfig(
+            extraction_method=MetadataExtractionType.NONE
+        ),
+    )
+    parser = MultiChainParser(config)
+    model = parser.pparsers["keywords"].model
+    assert isinstance(model, HedgedChatModel)
+    assert model.primary.model_name == "test/primary"
+    assert model.secondary.model_name == "test/secondary"
+    assert not isinstance(parser.pparsers["other_keywords"].model, HedgedChatModel)
@@ -0,0 +1,69 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import json
+import pytest
+from langchain_core.messages import AIMessage
+
+from desci_sense.shared_functions.postprocessing import Answer
+from desci_sense.shared_functions.postprocessing.output_processors import (
+    PydanticAnswerParser,
+)
+from desci_sense.shared_functions.utils import (
+    _find_json_object,
+    extract_json_object,
+    find_json_object,
+)
+
+COMPLETIONS_PATH = ROOT / "benchmarks/data/llm_completions.jsonl"
+
+
+def test_strings_and_comments():
+    text = """Tags use the {tag} format.
+    ```json
+    {
+      "reasoning": "Mentions #OpenScience and {braces} // not a comment",  # comment
+      /* block
+         comment */
+      "tags": ["<a>", "<b>",], // trailing comma
+    }
+    ```"""
+    assert extract_json_object(text) == {
+        "reasoning": "Mentions #OpenScience and {braces} // not a comment",
+        "tags": ["<a>", "<b>"],
+    }
+
+
+def test_escapes():
+    text = r'{"a": "quote \" and backslash \\ and md \_escape \[x\]"}'
+    assert extract_json_object(text) == {
+        "a": 'quote " and backslash \\ and md _escape [x]'
+    }
+
+
+def test_no_json():
+    with pytest.raises(ValueError):
+        extract_json_object("no json here")
+    with pytest.raises(ValueError):
+        extract_json_object('{"unbalanced": 1')
+    assert _find_json_object("no json here").startswith("[System error]")
+
+
+def test_find_json_object_returns_valid_json():
+    msg = AIMessage(content='prefix {"a": "#tag", "b": [1,],} suffix')
+    assert json.loads(find_json_object(msg)) == {"a": "#tag", "b": [1]}
+
+
+def test_recorded_completions():
+    with open(COMPLETIONS_PATH) as f:
+        completions = [json.loads(line)["completion"] for line in f]
+
+    parser = PydanticAnswerParser(pydantic_object=Answer)
+    answers = [parser.invoke(AIMessage(content=c)) for c in completions]
+    errors = [a.is_err() for a in answers]
+    assert errors == [False, False, False, False, True, False]
+    assert "#OpenScience" in answers[0].sub_answers[0].reasoning_steps
+    assert answers[1].to_combined_format() == [["<announce>"], ["<mentions>"]]
@@ -0,0 +1,120 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.messages import AIMessage
+
+from desci_sense.shared_functions.configs import (
+    KeywordPParserChainConfig,
+    LLMCacheConfig,
+    LLMConfig,
+    MetadataExtractionConfig,
+    MetadataExtractionType,
+    MultiParserChainConfig,
+    TopicsPParserChainConfig,
+)
+from desci_sense.shared_functions.parsers.llm_cache import (
+    LLMResponseCache,
+    get_llm_cache,
+)
+from desci_sense.shared_functions.parsers.multi_chain_parser import MultiChainParser
+
+
+def get_generations(text: str):
+    return [ChatGeneration(message=AIMessage(content=text))]
+
+
+MODEL_CALLS = []
+
+
+class EchoChatModel(BaseChatModel):
+    # echoes the prompt and records calls to the model in `MODEL_CALLS`
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo-chat-model"
+
+    @property
+    def _identifying_params(self):
+        return {}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        MODEL_CALLS.append(messages[-1].content)
+        return ChatResult(generations=get_generations(messages[-1].content))
+
+
+def test_cache_keyed_by_model_and_prompt(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm_cache.sqlite"))
+    cache.update("prompt", "model-a", get_generations("answer a"))
+
+    assert cache.lookup("prompt", "model-a")[0].text == "answer a"
+    assert cache.lookup("prompt", "model-b") is None
+    assert cache.lookup("other prompt", "model-a") is None
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 2
+
+    # persisted on disk
+    reloaded = LLMResponseCache(str(tmp_path / "llm_cache.sqlite"))
+    assert reloaded.lookup("prompt", "model-a")[0].text == "answer a"
+
+
+def test_eviction(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm_cache.sqlite"), max_entries=2)
+    cache.update("p1", "model", get_generations("1"))
+    cache.update("p2", "model", get_generations("2"))
+    cache.lookup("p1", "model")
+    cache.update("p3", "model", get_generations("3"))
+
+    assert cache.num_entries() == 2
+    assert cache.lookup("p2", "model") is None
+    assert cache.lookup("p1", "model") is not None
+    assert cache.stats.evictions == 1
+
+    # updating a cached response doesn't count as a new entry
+    cache.update("p3", "model", get_generations("3 again"))
+    assert cache.stats.evictions == 1
+    assert cache.lookup("p3", "model")[0].text == "3 again"
+
+    # entries are counted when the cache is opened
+    reopened = LLMResponseCache(str(tmp_path / "llm_cache.sqlite"), max_entries=1)
+    statements = []
+    reopened._conn.set_trace_callback(statements.append)
+    reopened.update("p4", "model", get_generations("4"))
+    assert reopened.stats.evictions == 2
+    assert not any("COUNT(*)" in statement for statement in statements)
+    assert reopened.num_entries() == 1
+
+
+def test_model_uses_cache(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm_cache.sqlite"))
+    model = EchoChatModel(cache=cache)
+
+    assert model.invoke("hello").content == "hello"
+    # identical prompt is served from cache instead of the model
+    assert model.invoke("hello").content == "hello"
+    assert model.invoke("bye").content == "bye"
+    assert MODEL_CALLS == ["hello", "bye"]
+    assert cache.stats.hits == 1
+
+
+def test_cache_opt_in_per_chain(tmp_path):
+    cache_config = LLMCacheConfig(disk_path=str(tmp_path / "llm_cache.sqlite"))
+    config = MultiParserChainConfig(
+        parser_configs=[
+            KeywordPParserChainConfig(
+                name="keywords", llm_config=LLMConfig(use_cache=True)
+            ),
+            TopicsPParserChainConfig(name="topics"),
+        ],
+        metadata_extract_config=MetadataExtractionConfig(
+            extraction_method=MetadataExtractionType.NONE
+        ),
+        llm_cache_config=cache_config,
+    )
+    parser = MultiChainParser(config)
+    assert parser.pparsers["keywords"].model.cache is get_llm_cache(cache_config)
+    assert parser.pparsers["topics"].model.cache is None
@@ -0,0 +1,208 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from desci_sense.shared_functions.dataloaders.mastodon.mastodon_loader import (
+    MastodonLoader,
+)
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_status(account_id: str, day: int, num: int) -> dict:
+    created_at = START + timedelta(days=day, hours=num)
+    return {
+        # ids are derived from the creation time, like Mastodon snowflake ids
+        "id": str((int(created_at.timestamp() * 1000) << 16) + int(account_id)),
+        "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "content": f"<p>post {day}-{num} of {account_id}</p>",
+        "url": f"https://masto.test/@user{account_id}/{day}{num}",
+        "account": {
+            "id": account_id,
+            "username": f"user{account_id}",
+            "acct": f"user{account_id}",
+            "display_name": f"User {account_id}",
+        },
+        "card": None,
+        "reblog": None,
+        "in_reply_to_id": "1" if num == 1 else None,
+    }
+
+
+class FakeMastodonHandler(BaseHTTPRequestHandler):
+    # statuses of each account id, newest first
+    statuses = {}
+    requests = []
+    delay = 0
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+    # number of statuses requests answered as rate limited, until `rate_limit_reset`
+    rate_limited = 0
+    rate_limit_reset = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        FakeMastodonHandler.requests.append((url.path, query))
+        with FakeMastodonHandler.lock:
+            FakeMastodonHandler.in_flight += 1
+            FakeMastodonHandler.max_in_flight = max(
+                FakeMastodonHandler.max_in_flight, FakeMastodonHandler.in_flight
+            )
+        time.sleep(FakeMastodonHandler.delay)
+        with FakeMastodonHandler.lock:
+            FakeMastodonHandler.in_flight -= 1
+        if url.path == "/api/v1/accounts/lookup":
+            account_id = query["acct"].strip("@").split("@")[0].replace("user", "")
+            if account_id not in FakeMastodonHandler.statuses:
+                return self.send_json({"error": "Record not found"}, 404)
+            return self.send_json({"id": account_id, "username": query["acct"]})
+
+        if FakeMastodonHandler.rate_limited:
+            FakeMastodonHandler.rate_limited -= 1
+            return self.send_json({"error": "Too many requests"}, 429)
+        account_id = url.path.split("/")[-2]
+        statuses = FakeMastodonHandler.statuses[account_id]
+        if "max_id" in query:
+            statuses = [s for s in statuses if int(s["id"]) < int(query["max_id"])]
+        if "since_id" in query:
+            statuses = [s for s in statuses if int(s["id"]) > int(query["since_id"])]
+        self.send_json(statuses[: int(query.get("limit", 20))])
+
+    def send_json(self, response, status=200):
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            reset = datetime.now(timezone.utc) + timedelta(
+                seconds=FakeMastodonHandler.rate_limit_reset
+            )
+            self.send_header("X-RateLimit-Limit", "300")
+            self.send_header("X-RateLimit-Remaining", "0")
+            self.send_header("X-RateLimit-Reset", reset.isoformat())
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def loader():
+    # 3 statuses per day for 30 days, for 3 accounts
+    FakeMastodonHandler.statuses = {
+        account_id: [
+            make_status(account_id, day, num)
+            for day in reversed(range(30))
+            for num in reversed(range(3))
+        ]
+        for account_id in ["1", "2", "3"]
+    }
+    FakeMastodonHandler.requests = []
+    FakeMastodonHandler.delay = 0
+    FakeMastodonHandler.max_in_flight = 0
+    FakeMastodonHandler.rate_limited = 0
+    FakeMastodonHandler.rate_limit_reset = None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeMastodonHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield MastodonLoader(
+        base_url=f"http://127.0.0.1:{server.server_address[1]}",
+        access_token="token",
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def status_pages(account_id: str):
+    return [
+        q
+        for path, q in FakeMastodonHandler.requests
+        if path == f"/api/v1/accounts/{account_id}/statuses"
+    ]
+
+
+def test_iter_profile_timeline_stops_at_start_date(loader):
+    posts = list(
+        loader.iter_profile_timeline(
+            "@user1@masto.test",
+            start_date=datetime(2024, 1, 25),
+            end_date=datetime(2024, 1, 27),
+            page_size=4,
+        )
+    )
+    # 3 days, without replies
+    assert [p.content for p in posts] == [
+        f"post {day}-{num} of 1" for day in [26, 25, 24] for num in [2, 0]
+    ]
+    pages = status_pages("1")
+    # first page starts at the end date, and paging stops past the start date
+    assert len(pages) == 3
+    end = datetime(2024, 1, 28, tzinfo=timezone.utc)
+    assert int(pages[0]["max_id"]) >> 16 == int(end.timestamp()) * 1000
+
+    posts = list(
+        loader.iter_profile_timeline(
+            "@user1@masto.test", exclude_replies=False, min_id=posts[0].metadata["id"]
+        )
+    )
+    # only statuses newer than `min_id`
+    assert len(posts) == 9
+    assert [p.content for p in posts[-2:]] == ["post 27-1 of 1", "post 27-0 of 1"]
+
+
+def test_load_profile_timeline(loader):
+    posts = loader.load_profile_timeline(
+        "@user2@masto.test", max_toots=5, start_date=datetime(2024, 1, 1)
+    )
+    assert len(posts) == 5
+    # pages are sized to `max_toots`, and paging stops once they are loaded
+    pages = status_pages("2")
+    assert [page["limit"] for page in pages] == ["5", "5"]
+
+
+def test_iter_profiles(loader):
+    FakeMastodonHandler.delay = 0.2
+    accounts = ["@user1@masto.test", "@missing@masto.test", "@user3@masto.test"]
+    posts = list(
+        loader.iter_profiles(
+            accounts, max_workers=3, start_date=datetime(2024, 1, 28), page_size=4
+        )
+    )
+    assert sorted(p.author for p in posts) == ["User 1"] * 6 + ["User 3"] * 6
+    # accounts are loaded concurrently
+    assert FakeMastodonHandler.max_in_flight > 1
+
+    FakeMastodonHandler.max_in_flight = 0
+    posts = loader.load_profiles(accounts[::2], number_toots=5)
+    assert [p.author for p in posts] == ["User 1"] * 5 + ["User 3"] * 5
+    assert FakeMastodonHandler.max_in_flight > 1
+
+    # stopping early doesn't block on pending posts
+    stream = loader.iter_profiles(accounts, max_pending=1, page_size=2)
+    assert next(stream).author in ["User 1", "User 3"]
+    stream.close()
+
+
+def test_rate_limit_wait(loader):
+    FakeMastodonHandler.rate_limited = 1
+    FakeMastodonHandler.rate_limit_reset = 2
+    start = time.perf_counter()
+    posts = loader.load_profile_timeline("@user1@masto.test", max_toots=1)
+    assert len(posts) == 1
+    # the rate limited request is retried once the limit resets
+    assert time.perf_counter() - start > 0.5
+    assert len(status_pages("1")) == 2
@@ -0,0 +1,158 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import time
+
+from desci_sense.shared_functions.configs import MetadataCacheConfig
+from desci_sense.shared_functions.web_extractors.metadata_cache import (
+    InMemoryMetadataCache,
+    SQLiteMetadataCache,
+    TieredMetadataCache,
+    create_metadata_cache,
+)
+from desci_sense.shared_functions.web_extractors.metadata_extractors import (
+    extract_urls_citoid_metadata,
+)
+
+TEST_METADATA = {
+    "itemType": "journalArticle",
+    "title": "A test article",
+    "url": "https://example.org/article",
+    "abstractNote": "An abstract",
+}
+
+
+def test_memory_cache_lru_eviction():
+    cache = InMemoryMetadataCache(max_entries=2)
+    cache.set("a", {"title": "a"})
+    cache.set("b", {"title": "b"})
+    # access a so that b is least recently used
+    assert cache.get("a") == {"title": "a"}
+    cache.set("c", {"title": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats.evictions == 1
+    assert cache.stats.hits == 3
+    assert cache.stats.misses == 1
+
+
+def test_ttl_by_outcome():
+    cache = InMemoryMetadataCache(positive_ttl=100, placeholder_ttl=10, error_ttl=1)
+    now = time.time()
+    cache.set("ok", TEST_METADATA)
+    cache.set("placeholder", {"itemType": "forumPost", "title": "x post"})
+    cache.set("error", {"error": "Failed to fetch data after 5 attempts."})
+    cache.set("error_msg", {"msg": "Error: Unable to fetch data."})
+
+    assert cache.get_expiration("ok") >= now + 100
+    assert now + 10 <= cache.get_expiration("placeholder") < now + 100
+    assert now + 1 <= cache.get_expiration("error") < now + 10
+    assert now + 1 <= cache.get_expiration("error_msg") < now + 10
+
+
+def test_expired_entries_are_misses():
+    cache = InMemoryMetadataCache()
+    cache.set("a", TEST_METADATA, expires_at=time.time() - 1)
+    assert cache.get("a") is None
+    assert cache.stats.expirations == 1
+    assert len(cache) == 0
+
+
+def test_cached_values_are_copies():
+    cache = InMemoryMetadataCache()
+    cache.set("a", TEST_METADATA)
+    res = cache.get("a")
+    res["original_url"] = "a"
+    assert "original_url" not in cache.get("a")
+
+
+def test_sqlite_cache_persists(tmp_path):
+    db_path = str(tmp_path / "md_cache.sqlite")
+    cache = SQLiteMetadataCache(db_path, max_entries=2)
+    cache.set("a", TEST_METADATA)
+    cache.set("b", {"title": "b"})
+    cache.get("a")
+    cache.set("c", {"title": "c"})
+    assert len(cache) == 2
+    assert cache.get("b") is None
+
+    # reopen - entries should survive
+    reopened = SQLiteMetadataCache(db_path)
+    assert reopened.get("a") == TEST_METADATA
+    assert reopened.get("c") == {"title": "c"}
+
+
+def test_sqlite_cache_counts_entries(tmp_path):
+    db_path = str(tmp_path / "md_cache.sqlite")
+    cache = SQLiteMetadataCache(db_path, max_entries=3)
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+    cache.set("a", TEST_METADATA)
+    cache.set("a", {"title": "a"})  # replaced, not a new entry
+    cache.set("b", {"title": "b"}, expires_at=time.time() - 1)
+    assert cache.get("b") is None  # expired and deleted
+    cache.set("c", {"title": "c"})
+    cache.set("d", {"title": "d"})
+    assert cache.stats.evictions == 0
+    cache.set("e", {"title": "e"})
+    assert cache.stats.evictions == 1
+    assert cache.get("a") is None
+    assert len(cache) == 3
+    # entries aren't counted on every write
+    assert sum("COUNT(*)" in statement for statement in statements) == 1
+
+    # counted again when reopened
+    reopened = SQLiteMetadataCache(db_path, max_entries=2)
+    reopened.set("f", {"title": "f"})
+    assert reopened.stats.evictions == 2
+    assert len(reopened) == 2
+
+
+def test_tiered_cache_promotes_hits(tmp_path):
+    memory = InMemoryMetadataCache()
+    disk = SQLiteMetadataCache(str(tmp_path / "md_cache.sqlite"))
+    disk.set("a", TEST_METADATA)
+    cache = TieredMetadataCache([memory, disk])
+
+    assert cache.get("a") == TEST_METADATA
+    assert memory.get("a") == TEST_METADATA
+    assert memory.get_expiration("a") == disk.get_expiration("a")
+    assert cache.get("missing") is None
+    assert cache.stats.to_dict()["hits"] == 1
+    assert cache.stats.to_dict()["misses"] == 1
+
+
+def test_create_metadata_cache(tmp_path):
+    assert create_metadata_cache(MetadataCacheConfig(enabled=False)) is None
+    assert isinstance(create_metadata_cache(MetadataCacheConfig()), InMemoryMetadataCache)
+    cache = create_metadata_cache(
+        MetadataCacheConfig(disk_path=str(tmp_path / "md_cache.sqlite"))
+    )
+    assert isinstance(cache, TieredMetadataCache)
+
+
+def test_extract_uses_cache():
+    cache = InMemoryMetadataCache()
+    cache.set("https://example.org/article", TEST_METADATA)
+    # social media urls are resolved without calling citoid
+    urls = [
+        "https://example.org/article",
+        "https://x.com/user/status/1",
+        "https://example.org/article",
+    ]
+    res = extract_urls_citoid_metadata(urls, max_summary_length=30, cache=cache)
+    assert [r.url for r in res] == urls
+    assert res[0].title == TEST_METADATA["title"]
+    assert res[2].title == TEST_METADATA["title"]
+    assert res[1].item_type == "forumPost"
+
+    # second call is served entirely from the cache
+    res = extract_urls_citoid_metadata(urls[:2], max_summary_length=30, cache=cache)
+    assert res[1].item_type == "forumPost"
+    assert cache.stats.sets == 2
+    assert "original_url" not in cache.get("https://example.org/article")
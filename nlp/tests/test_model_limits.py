@@ -0,0 +1,304 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+
+from desci_sense.shared_functions.configs import (
+    KeywordPParserChainConfig,
+    LLMConfig,
+    LLMRateLimitConfig,
+    MetadataExtractionConfig,
+    MetadataExtractionType,
+    MultiParserChainConfig,
+    TopicsPParserChainConfig,
+)
+from desci_sense.shared_functions.parsers import create_model
+from desci_sense.shared_functions.parsers.model_limits import (
+    AdaptiveRateLimiter,
+    CircuitBreaker,
+    CircuitState,
+    LimitedChatOpenAI,
+    ModelUnavailableError,
+)
+from desci_sense.shared_functions.parsers.multi_chain_parser import MultiChainParser
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    # responds with the status codes in `responses[model]` in order, then 200
+    responses = {}
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        model = body["model"]
+        FakeOpenAIHandler.requests.append(model)
+        pending = FakeOpenAIHandler.responses.get(model) or []
+        status = pending.pop(0) if pending else 200
+        if status == 200:
+            response = {
+                "id": "completion",
+                "object": "chat.completion",
+                "created": 0,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": f"from {model}"},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7},
+            }
+        else:
+            response = {"error": {"message": "failed", "code": status}}
+        data = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0.2")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def openai_base():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    FakeOpenAIHandler.responses = {}
+    FakeOpenAIHandler.requests = []
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+
+
+def create_limited_model(
+    llm_type: str, openai_base: str, fallback_llm_type: str = None, **kwargs
+):
+    return create_model(
+        llm_type,
+        0.0,
+        openai_base,
+        "key",
+        fallback_llm_type=fallback_llm_type,
+        rate_limit_config=LLMRateLimitConfig(enabled=True, **kwargs),
+    )
+
+
+def test_rate_limiter():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(
+        LLMRateLimitConfig(requests_per_minute=60, burst_seconds=2, recovery_step=0.25),
+        clock=clock,
+    )
+    # burst of 2 requests, then 1 per second
+    assert [limiter.reserve() for _ in range(3)] == [0, 0, 1]
+
+    clock.now = 10
+    limiter.on_rate_limited(retry_after=5)
+    assert limiter.requests_per_minute == 30
+    assert limiter.reserve() == pytest.approx(5 + 1 / 0.5)
+    # requests limited by the same pause don't reduce the rate again
+    limiter.on_rate_limited(retry_after=5)
+    assert limiter.requests_per_minute == 30
+
+    limiter.on_success()
+    limiter.on_success()
+    limiter.on_success()
+    assert limiter.requests_per_minute == 60
+
+
+def test_token_rate_limiter():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(
+        LLMRateLimitConfig(
+            requests_per_minute=6000, tokens_per_minute=600, burst_seconds=1
+        ),
+        clock=clock,
+    )
+    assert limiter.reserve(10) == 0
+    assert limiter.reserve(10) == pytest.approx(1)
+    # the second request used less tokens than estimated
+    limiter.record_usage(10, 5)
+    assert limiter.reserve(5) == pytest.approx(1)
+
+
+def test_circuit_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+    # single probe after the timeout
+    clock.now = 10
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+
+    clock.now = 20
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.allow_request()
+
+
+def test_rate_limited_request_retried(openai_base):
+    model = create_limited_model("test/rate-limited", openai_base, recovery_step=0)
+    assert isinstance(model, LimitedChatOpenAI)
+    FakeOpenAIHandler.responses = {"test/rate-limited": [429]}
+
+    start = time.perf_counter()
+    assert model.invoke("hi").content == "from test/rate-limited"
+    # waited for Retry-After
+    assert time.perf_counter() - start >= 0.2
+    assert FakeOpenAIHandler.requests == ["test/rate-limited"] * 2
+    assert model.model_limits.limiter.requests_per_minute == 150
+
+    # other requests to the model wait for the pause too
+    FakeOpenAIHandler.responses = {"test/rate-limited": [429]}
+    other_model = create_limited_model("test/rate-limited", openai_base, recovery_step=0)
+    assert other_model.model_limits is model.model_limits
+
+    async def invoke_both():
+        return await asyncio.gather(model.ainvoke("a"), other_model.ainvoke("b"))
+
+    start = time.perf_counter()
+    asyncio.run(invoke_both())
+    assert time.perf_counter() - start >= 0.2
+    assert len(FakeOpenAIHandler.requests) == 5
+
+
+def test_circuit_breaker_fallback(openai_base):
+    model = create_limited_model(
+        "test/failing",
+        openai_base,
+        fallback_llm_type="test/fallback",
+        failure_threshold=2,
+        max_retries=1,
+        retry_backoff=0,
+    )
+    FakeOpenAIHandler.responses = {"test/failing": [500] * 10}
+
+    # retried, then the breaker opens and the fallback model is called
+    assert model.invoke("hi").content == "from test/fallback"
+    assert FakeOpenAIHandler.requests == [
+        "test/failing",
+        "test/failing",
+        "test/fallback",
+    ]
+    assert model.invoke("hi").content == "from test/fallback"
+    assert FakeOpenAIHandler.requests[-1] == "test/fallback"
+
+
+def test_circuit_breaker_fail_fast(openai_base):
+    model = create_limited_model(
+        "test/failing-no-fallback", openai_base, failure_threshold=1, max_retries=0
+    )
+    FakeOpenAIHandler.responses = {"test/failing-no-fallback": [500] * 10}
+
+    with pytest.raises(openai.InternalServerError):
+        model.invoke("hi")
+    with pytest.raises(ModelUnavailableError):
+        model.invoke("hi")
+    assert len(FakeOpenAIHandler.requests) == 1
+
+    # invalid requests don't count as failures
+    model = create_limited_model("test/invalid", openai_base, failure_threshold=1)
+    FakeOpenAIHandler.responses = {"test/invalid": [400]}
+    with pytest.raises(openai.BadRequestError):
+        model.invoke("hi")
+    assert model.invoke("hi").content == "from test/invalid"
+
+
+def test_chains_dont_retry_model_errors(openai_base):
+    config = MultiParserChainConfig(
+        parser_configs=[
+            KeywordPParserChainConfig(
+                name="keywords", llm_config=LLMConfig(llm_type="test/chain-failing")
+            )
+        ],
+        metadata_extract_config=MetadataExtractionConfig(
+            extraction_method=MetadataExtractionType.NONE
+        ),
+        llm_rate_limit_config=LLMRateLimitConfig(
+            enabled=True, failure_threshold=10, max_retries=0
+        ),
+    )
+    config.openrouter_api_config.openrouter_api_base = openai_base
+    parser = MultiChainParser(config)
+    FakeOpenAIHandler.responses = {"test/chain-failing": [500] * 10}
+
+    # the chain falls back without retrying the failed model call
+    result = parser.process_text("a post")
+    assert result["keywords"].extra["errors"] == "fallback"
+    assert FakeOpenAIHandler.requests == ["test/chain-failing"]
+
+
+def test_chains_retry_errors_of_plain_models(openai_base):
+    config = MultiParserChainConfig(
+        parser_configs=[
+            KeywordPParserChainConfig(
+                name="keywords", llm_config=LLMConfig(llm_type="test/chain-plain")
+            )
+        ],
+        metadata_extract_config=MetadataExtractionConfig(
+            extraction_method=MetadataExtractionType.NONE
+        ),
+    )
+    config.openrouter_api_config.openrouter_api_base = openai_base
+    parser = MultiChainParser(config)
+    assert not isinstance(parser.pparsers["keywords"].model, LimitedChatOpenAI)
+    # more failures than the model retries itself
+    FakeOpenAIHandler.responses = {"test/chain-plain": [429] * 3}
+
+    # the chain retries the failed model call
+    parser.process_text("a post")
+    assert len(FakeOpenAIHandler.requests) > 3
+
+
+def test_chains_share_model_limits():
+    llm_config = LLMConfig(llm_type="test/shared")
+    config = MultiParserChainConfig(
+        parser_configs=[
+            KeywordPParserChainConfig(name="keywords", llm_config=llm_config),
+            TopicsPParserChainConfig(name="topics", llm_config=llm_config),
+        ],
+        metadata_extract_config=MetadataExtractionConfig(
+            extraction_method=MetadataExtractionType.NONE
+        ),
+        llm_rate_limit_config=LLMRateLimitConfig(enabled=True),
+    )
+    parsers = [MultiChainParser(config) for _ in range(2)]
+    models = [p.pparsers[name].model for p in parsers for name in p.pparsers]
+    assert all(isinstance(model, LimitedChatOpenAI) for model in models)
+    assert all(model.model_limits is models[0].model_limits for model in models)
+
+    # limits are opt in
+    config.llm_rate_limit_config = LLMRateLimitConfig()
+    model = MultiChainParser(config).pparsers["keywords"].model
+    assert not isinstance(model, LimitedChatOpenAI)
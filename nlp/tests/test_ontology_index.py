@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import pytest
+from pydantic import ValidationError
+
+from desci_sense.shared_functions.schema.ontology_base import (
+    OntologyBase,
+    filter_ontology_by_version,
+)
+
+
+def get_df_templates(ont_df, subject_type: str, object_type: str):
+    # reference implementation filtering the ontology dataframe
+    return ont_df[
+        ont_df["valid_subject_types"].apply(lambda types: subject_type in types)
+        & ont_df["valid_object_types"].apply(lambda types: object_type in types)
+    ].to_dict(orient="records")
+
+
+def test_templates_match_dataframe_filter():
+    ontology = OntologyBase()
+    types = ["post", "ref", "nan", "unknown"]
+    for subject_type in types:
+        for object_type in types:
+            templates = ontology.get_valid_templates(subject_type, object_type)
+            assert templates == get_df_templates(
+                ontology.ont_df, subject_type, object_type
+            )
+            assert ontology.get_valid_labels(subject_type, object_type) == [
+                t["label"] for t in templates
+            ]
+            df_labels = ontology.get_valid_templates(
+                subject_type, object_type, as_dict=False
+            ).label.to_list()
+            assert df_labels == [t["label"] for t in templates]
+
+
+def test_concept_lookups():
+    ontology = OntologyBase()
+    for label in ontology.get_all_labels():
+        concept = ontology.get_concept_by_label(label)
+        assert concept.label == label
+        assert ontology.get_concept_by_display_name(concept.display_name) is concept
+        assert ontology.get_concept_by_uri(concept.uri) is concept
+        assert ontology.label_df.loc[label]["name"] == concept.name
+
+    concept = ontology.get_concept_by_label(ontology.default_mention_label())
+    with pytest.raises(ValidationError):
+        concept.label = "changed"
+
+    with pytest.raises(KeyError):
+        ontology.get_concept_by_label("not-a-label")
+
+
+def test_version_filter():
+    ontology = OntologyBase(versions=["v0"])
+    full_df = OntologyBase().ont_df
+    filtered_df = filter_ontology_by_version(full_df, allowed_versions=["v0"])
+    assert ontology.get_all_labels() == filtered_df.label.to_list()
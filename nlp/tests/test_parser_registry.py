@@ -0,0 +1,78 @@
+import sys
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+from desci_sense.shared_functions.main import (
+    get_multi_chain_parser,
+    get_parser_registry_key,
+    SM_FUNCTION_warm_parser,
+)
+from desci_sense.shared_functions.parsers.parser_registry import ParserRegistry
+from desci_sense.shared_functions.init import init_multi_chain_parser_config
+from desci_sense.shared_functions.configs import OpenrouterAPIConfig
+
+
+def get_test_config(ref_tagger_llm_type: str = "mistralai/mistral-7b-instruct"):
+    return {
+        "openrouter_api_key": "test-key",
+        "openrouter_api_base": "https://openrouter.ai/api/v1",
+        "openrouter_referer": "https://127.0.0.1:3000/",
+        "ref_tagger_llm_type": ref_tagger_llm_type,
+        "kw_llm_type": "mistralai/mistral-7b-instruct",
+        "topic_llm_type": "mistralai/mistral-7b-instruct",
+    }
+
+
+def test_registry_reuses_parser():
+    config = get_test_config()
+    parser_1 = get_multi_chain_parser(config)
+    parser_2 = get_multi_chain_parser(get_test_config())
+    assert parser_1 is parser_2
+
+    # config should not be modified by the registry
+    assert config == get_test_config()
+
+
+def test_registry_key_by_models():
+    config_1 = get_test_config()
+    config_2 = get_test_config(ref_tagger_llm_type="openai/gpt-4o-mini")
+    assert get_parser_registry_key(config_1) != get_parser_registry_key(config_2)
+
+    parser_1 = get_multi_chain_parser(config_1)
+    parser_2 = get_multi_chain_parser(config_2)
+    assert parser_1 is not parser_2
+
+    # api key should not be part of key in plain text
+    assert "test-key" not in get_parser_registry_key(config_1)
+
+
+def test_warm_parser():
+    assert SM_FUNCTION_warm_parser(get_test_config())
+
+
+def test_registry_concurrent_single_build():
+    registry = ParserRegistry()
+    num_builds = []
+
+    def config_factory():
+        num_builds.append(1)
+        return init_multi_chain_parser_config(
+            open_router_api_config=OpenrouterAPIConfig(
+                openrouter_api_key="test-key",
+                openrouter_referer="test-referer",
+            )
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        parsers = list(
+            executor.map(
+                lambda _: registry.get_or_create("key", config_factory), range(16)
+            )
+        )
+
+    assert len(num_builds) == 1
+    assert all(p is parsers[0] for p in parsers)
+    assert len(registry) == 1
@@ -1,6 +1,9 @@
 import sys
 from pathlib import Path
 import logging
+import pickle
+
+import pytest
 
 ROOT = Path(__file__).parents[1]
 sys.path.append(str(ROOT))
@@ -26,16 +29,25 @@ from desci_sense.shared_functions.interface import AppThread, ParsePostRequest
 from desci_sense.shared_functions.dataloaders import scrape_post
 from desci_sense.shared_functions.dataloaders.twitter.twitter_utils import (
     extract_external_ref_urls,
+    convert_vxtweet_to_ref_post,
     scrape_tweet,
     extract_twitter_status_id,
 )
+from desci_sense.shared_functions.preprocessing.threads import create_thread_from_posts
 from desci_sense.shared_functions.preprocessing import (
     convert_thread_interface_to_ref_post,
+    trim_ref_post,
+    trim_ref_urls,
     convert_app_post_to_ref_post,
     convert_app_post_to_quote_ref_post,
     ParserInput,
     preproc_parser_input,
+    trim_thread_by_length,
+)
+from desci_sense.shared_functions.dataloaders.mastodon.mastodon_utils import (
+    convert_post_json_to_ref_post,
 )
+from desci_sense.shared_functions.web_extractors.url_resolver import url_resolver
 
 TEST_THREAD_INTERFACE_2 = {
     "url": "https://example.com/post/2",
@@ -307,6 +319,83 @@ def test_thread_length():
     print(f"The thread is {thread.content}")
     assert thread.content == ''
 
+def test_thread_shares_immutable_posts():
+    thread = AppThread.model_validate(TEST_THREAD_INTERFACE_1)
+    thread_ref_post = convert_thread_interface_to_ref_post(thread)
+    posts = thread_ref_post.posts
+
+    # posts are shared, not copied, by threads built from them
+    new_thread = create_thread_from_posts(posts[:1])
+    assert new_thread.posts[0] is posts[0]
+    assert new_thread.posts[0].quoted_post is posts[0].quoted_post
+    pi = ParserInput(thread_post=new_thread)
+    assert pi.thread_post is new_thread
+
+    with pytest.raises(TypeError):
+        posts[0].content = "changed"
+
+    # modified versions are copies
+    changed = posts[0].copy(update={"content": "changed"})
+    assert changed.content == "changed"
+    assert posts[0].content != "changed"
+
+    assert pickle.loads(pickle.dumps(thread_ref_post)) == thread_ref_post
+
+
+def test_trim_reuses_resolved_urls(monkeypatch):
+    # long (Twitter Premium like) thread with shortened urls
+    short_urls = [f"https://short.example/{i}" for i in range(10)]
+    for i, url in enumerate(short_urls):
+        url_resolver.add_to_cache(url, f"https://example.org/paper/{i}")
+    padding = "lorem ipsum " * 200
+    thread = AppThread.model_validate(
+        {
+            "url": "https://x.com/user/status/1",
+            "thread": [
+                {
+                    "url": f"https://x.com/user/status/{i + 1}",
+                    "content": f"{padding}{short_urls[2 * i]} {padding}{short_urls[2 * i + 1]}",
+                }
+                for i in range(5)
+            ],
+            "author": {
+                "platformId": "twitter",
+                "id": "author_123",
+                "username": "user123",
+                "name": "John Doe",
+            },
+        }
+    )
+    thread_ref_post = convert_thread_interface_to_ref_post(thread)
+    assert thread_ref_post.char_length() > 20000
+
+    # trimming should only use the urls resolved above
+    url_resolver.clear_cache()
+    resolve_calls = []
+
+    async def aresolve_urls(urls):
+        resolve_calls.append(urls)
+        return urls
+
+    monkeypatch.setattr(url_resolver, "aresolve_urls", aresolve_urls)
+
+    max_chars = 2 * len(thread.thread[0].content) + 10
+    trimmed = trim_thread_by_length(thread_ref_post, max_chars)
+
+    assert resolve_calls == []
+    assert len(trimmed.posts) == 3
+    assert trimmed.char_length() <= max_chars
+    assert trimmed.posts[2].content == thread.thread[2].content[:10]
+    assert trimmed.posts[2].ref_urls == []
+    assert trimmed.md_ref_urls() == [
+        f"https://example.org/paper/{i}" for i in range(4)
+    ]
+    assert trimmed.content.endswith(trimmed.posts[2].content)
+    # original thread is unchanged
+    assert thread_ref_post.char_length() > 20000
+    assert len(thread_ref_post.posts[2].ref_urls) == 2
+
+
 if __name__ == "__main__":
     thread = AppThread.model_validate(TEST_THREAD)
     thread_ref_post = convert_thread_interface_to_ref_post(thread)
@@ -314,3 +403,79 @@ if __name__ == "__main__":
     proc_pi = preproc_parser_input(pi)
     
 
+
+
+class _SampleUnpickler(pickle.Unpickler):
+    # the sample was pickled when `shared_functions` was a top level package
+    def find_class(self, module, name):
+        if module.startswith("shared_functions"):
+            module = "desci_sense." + module
+        return super().find_class(module, name)
+
+
+def test_trim_posts_pickled_without_url_spans():
+    with open(ROOT / "parser_result_sample.pkl", "rb") as f:
+        post = _SampleUnpickler(f).load()["post"]
+    assert "ref_url_spans" not in post.__dict__
+    url_resolver.add_to_cache("https://www.abook.com", "https://www.abook.com/")
+
+    # spans are extracted from the content
+    assert trim_ref_urls(post, post.content) == ["https://www.abook.com/"]
+    trimmed = trim_ref_post(post, 20)
+    assert trimmed.content == post.content[:20]
+    assert trimmed.ref_urls == []
+    assert trimmed.ref_url_spans == []
+
+
+def test_loaders_record_ref_url_spans(monkeypatch):
+    resolved = {
+        "https://t.co/abc": "https://example.org/paper/1",
+        "https://t.co/def": "https://twitter.com/other/status/2",
+    }
+    resolve_calls = []
+
+    async def aresolve_urls(urls):
+        resolve_calls.append(urls)
+        return [resolved.get(url, url) for url in urls]
+
+    monkeypatch.setattr(url_resolver, "aresolve_urls", aresolve_urls)
+    url_resolver.clear_cache()
+
+    tweet = {
+        "user_name": "user123",
+        "text": "first https://t.co/abc and then https://t.co/def",
+        "tweetURL": "https://twitter.com/user123/status/1",
+        "tweetID": "1",
+        "date": "Wed Oct 10 20:19:24 +0000 2018",
+        "qrtURL": None,
+        "qrt": None,
+    }
+    post = convert_vxtweet_to_ref_post(tweet)
+    assert post.ref_urls == [
+        "https://example.org/paper/1",
+        "https://x.com/other/status/2",
+    ]
+    assert [url for _, _, url in post.ref_url_spans] == post.ref_urls
+    for start, end, _ in post.ref_url_spans:
+        assert post.content[start:end].startswith("https://")
+
+    # trimming uses the recorded spans
+    resolve_calls.clear()
+    trimmed = trim_ref_post(post, post.ref_url_spans[0][1] + 1)
+    assert resolve_calls == []
+    assert trimmed.ref_urls == ["https://example.org/paper/1"]
+
+    post = convert_post_json_to_ref_post(
+        {
+            "account": {"display_name": "John Doe"},
+            "content": "<p>see https://t.co/abc</p>",
+            "url": "https://mastodon.social/@user123/1",
+            "created_at": "2023-11-13T16:15:47.094Z",
+            "card": None,
+            "in_reply_to_id": None,
+            "reblog": None,
+        }
+    )
+    assert post.ref_urls == ["https://example.org/paper/1"]
+    assert post.ref_url_spans == [(4, 20, "https://example.org/paper/1")]
+    url_resolver.clear_cache()
@@ -0,0 +1,122 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+from jinja2 import Template
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.prompt_values import ChatPromptValue, StringPromptValue
+
+from desci_sense.shared_functions.configs import (
+    KeywordPParserChainConfig,
+    MultiParserChainConfig,
+    MultiRefTaggerChainConfig,
+    MetadataExtractionConfig,
+    PostRendererType,
+)
+from desci_sense.shared_functions.interface import RefMetadata
+from desci_sense.shared_functions.parsers.multi_chain_parser import MultiChainParser
+from desci_sense.shared_functions.prompting.prompt_layout import (
+    CACHE_CONTROL_HINT,
+    assemble_prompt,
+    render_prompt_prefix,
+)
+from desci_sense.shared_functions.schema.post import QuoteRefPost
+from desci_sense.shared_functions.preprocessing.threads import create_thread_from_posts
+
+
+def make_thread(content: str, ref_urls):
+    post = QuoteRefPost(
+        author="author",
+        url="https://x.com/author/status/1",
+        content=content,
+        ref_urls=ref_urls,
+        quoted_post=None,
+    )
+    return create_thread_from_posts([post])
+
+
+def create_parser(prefix_stable: bool, cache_control: bool = False):
+    kwargs = {
+        "prefix_stable_prompt": prefix_stable,
+        "prompt_cache_control": cache_control,
+        "post_renderer": PostRendererType.THREAD_REF_POST,
+    }
+    config = MultiParserChainConfig(
+        parser_configs=[
+            MultiRefTaggerChainConfig(name="refs_tagger", **kwargs),
+            KeywordPParserChainConfig(name="keywords", **kwargs),
+        ],
+        metadata_extract_config=MetadataExtractionConfig(extraction_method="none"),
+    )
+    return MultiChainParser(config)
+
+
+def test_render_prompt_prefix():
+    template = Template("Tags: {{ tags }}\n# Post:\n{{ post }}\n# Output:")
+    prefix = render_prompt_prefix(template, ["post"], tags="a, b")
+    assert prefix == "Tags: a, b\n# Post:\n"
+    assert template.render(tags="a, b", post="test").startswith(prefix)
+
+
+def test_assemble_prompt():
+    prompt = "static part\npost part"
+    assert assemble_prompt(prompt) == StringPromptValue(text=prompt)
+    # prefix not matching prompt
+    assert assemble_prompt(prompt, "other") == StringPromptValue(text=prompt)
+
+    assert assemble_prompt(prompt, "static part\n") == ChatPromptValue(
+        messages=[
+            SystemMessage(content="static part\n"),
+            HumanMessage(content="post part"),
+        ]
+    )
+
+    messages = assemble_prompt(prompt, "static part\n", cache_control=True).messages
+    assert messages[0].content == [
+        {"type": "text", "text": "static part\n", "cache_control": CACHE_CONTROL_HINT}
+    ]
+
+
+def test_prefix_stable_prompts():
+    parser = create_parser(prefix_stable=True, cache_control=True)
+    default_parser = create_parser(prefix_stable=False)
+    threads = [
+        make_thread(
+            f"post {i} about https://example.org/{i} and https://example.org/x{i}",
+            [f"https://example.org/{i}", f"https://example.org/x{i}"],
+        )
+        for i in range(2)
+    ]
+    md_dict = {
+        url: RefMetadata(ref_id=1, citoid_url=url, url=url, title=url)
+        for t in threads
+        for url in t.md_ref_urls()
+    }
+
+    for name in ["refs_tagger", "keywords"]:
+        pparser = parser.pparsers[name]
+        inputs = [pparser.instantiate_prompt(t, md_dict) for t in threads]
+        prefixes = [i[pparser.prefix_name] for i in inputs]
+
+        # same prefix for all posts, followed by the post content
+        assert len(prefixes[0]) > 0
+        assert prefixes[0] == prefixes[1]
+        for i, thread in zip(inputs, threads):
+            prompt = i[pparser.input_name]
+            assert prompt.startswith(prefixes[0])
+            assert thread.content.split(" ")[1] in prompt[len(prefixes[0]) :]
+
+            messages = pparser.assemble_input_prompt(i).to_messages()
+            assert messages[0].content[0]["text"] == prefixes[0]
+            assert messages[1].content == prompt[len(prefixes[0]) :]
+
+        # prompt text is the same as in the default layout
+        default_pparser = default_parser.pparsers[name]
+        default_inputs = default_pparser.instantiate_prompt(threads[0], md_dict)
+        assert default_pparser.prefix_name not in default_inputs
+        assert default_inputs[name + "_input"] == inputs[0][pparser.input_name]
+        assert default_pparser.assemble_input_prompt(
+            default_inputs
+        ) == StringPromptValue(text=default_inputs[name + "_input"])
@@ -0,0 +1,202 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from desci_sense.shared_functions.async_utils import SingleFlight
+from desci_sense.shared_functions.interface import ParsePostRequest, ParserResult
+from desci_sense.shared_functions.parsers.multi_chain_parser import MultiChainParser
+
+from utils import create_hashtags_parser_for_tests, create_parse_request
+
+
+def count_parser_runs(parser: MultiChainParser, monkeypatch, delay: float = 0.2):
+    """
+    Slow down processing of parser inputs, and return the list of processed
+    contents.
+    """
+    processed = []
+    process_parser_input = parser.process_parser_input
+    aprocess_parser_input = parser.aprocess_parser_input
+
+    def slow_process(parser_input, active_list=None):
+        processed.append(parser_input.thread_post.content)
+        time.sleep(delay)
+        return process_parser_input(parser_input, active_list)
+
+    async def aslow_process(parser_input, active_list=None):
+        processed.append(parser_input.thread_post.content)
+        await asyncio.sleep(delay)
+        return await aprocess_parser_input(parser_input, active_list)
+
+    monkeypatch.setattr(parser, "process_parser_input", slow_process)
+    monkeypatch.setattr(parser, "aprocess_parser_input", aslow_process)
+    return processed
+
+
+def test_single_flight_threads():
+    flight = SingleFlight()
+    calls = []
+    start = threading.Barrier(5)
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"result": len(calls)}
+
+    def call():
+        start.wait()
+        return flight.do("key", work)
+
+    with ThreadPoolExecutor(5) as executor:
+        results = list(executor.map(lambda _: call(), range(5)))
+
+    assert len(calls) == 1
+    assert all(res is results[0][0] and shared for res, shared in results)
+    assert not flight.in_flight("key")
+
+    # nothing is kept once the call is done
+    assert flight.do("key", work) == ({"result": 2}, False)
+
+
+def test_single_flight_async_errors():
+    flight = SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        raise ValueError("failed")
+
+    async def run():
+        return await asyncio.gather(
+            *[flight.ado("key", fail) for _ in range(3)], return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(isinstance(r, ValueError) for r in results)
+    assert not flight.in_flight("key")
+
+
+def test_single_flight_cancelled_callers():
+    flight = SingleFlight()
+    calls = []
+    cancelled = []
+
+    async def work():
+        calls.append(1)
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return len(calls)
+
+    async def run():
+        leader = asyncio.ensure_future(flight.ado("key", work))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.ensure_future(flight.ado("key", work))
+        await asyncio.sleep(0.05)
+        # the leader's client disconnects, the other caller still gets the result
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await waiter == (1, True)
+        assert not cancelled
+
+        # the call is cancelled once all its callers are
+        callers = [asyncio.ensure_future(flight.ado("key", work)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        assert cancelled == [1]
+        assert not flight.in_flight("key")
+        return await flight.ado("key", work)
+
+    assert asyncio.run(run()) == (3, False)
+
+
+def test_parse_request_key():
+    parser = create_hashtags_parser_for_tests()
+    request = create_parse_request("Thoughts on #science")
+    # same key for raw and reordered requests
+    reordered = {"post": dict(reversed(list(request["post"].items())))}
+    assert parser.parse_request_key(request) == parser.parse_request_key(reordered)
+    assert parser.parse_request_key(request) != parser.parse_request_key(
+        create_parse_request("Thoughts on #other")
+    )
+    assert parser.parse_request_key(request) != parser.parse_request_key(
+        request, active_list=["hashtags"]
+    )
+    validated = ParsePostRequest.model_validate(request)
+    assert parser.parse_request_key(validated) == parser.parse_request_key(
+        validated.model_copy(deep=True)
+    )
+
+    # the parser config is part of the key
+    other_parser = create_hashtags_parser_for_tests(coalesce_requests=False)
+    assert parser.parse_request_key(request) != other_parser.parse_request_key(
+        request
+    )
+
+
+def test_concurrent_parse_requests_coalesced(monkeypatch):
+    parser = create_hashtags_parser_for_tests()
+    processed = count_parser_runs(parser, monkeypatch)
+    requests = [
+        ParsePostRequest.model_validate(create_parse_request(f"Thoughts on #{tag}"))
+        for tag in ["science", "science", "science", "other"]
+    ]
+
+    with ThreadPoolExecutor(len(requests)) as executor:
+        results = list(executor.map(parser.process_parse_request, requests))
+
+    assert sorted(processed) == ["Thoughts on #other", "Thoughts on #science"]
+    assert all(isinstance(res, ParserResult) for res in results)
+    assert results[0] == results[1] == results[2]
+    # each caller gets its own copy of a shared result
+    assert len({id(res) for res in results}) == len(results)
+    assert results[3].filter_classification is not None
+
+    # requests are processed again once done
+    parser.process_parse_request(requests[0])
+    assert len(processed) == 3
+
+
+def test_concurrent_async_parse_requests_coalesced(monkeypatch):
+    parser = create_hashtags_parser_for_tests()
+    processed = count_parser_runs(parser, monkeypatch)
+
+    request = create_parse_request("Thoughts on #science")
+
+    async def run():
+        return await asyncio.gather(
+            *[parser.aprocess_parse_request(request) for _ in range(3)]
+        )
+
+    results = asyncio.run(run())
+    assert processed == ["Thoughts on #science"]
+    assert results[0] == results[1] == results[2]
+
+
+def test_coalescing_disabled(monkeypatch):
+    parser = create_hashtags_parser_for_tests(coalesce_requests=False)
+    processed = count_parser_runs(parser, monkeypatch)
+    request = create_parse_request("Thoughts on #science")
+    request = ParsePostRequest.model_validate(request)
+
+    with ThreadPoolExecutor(3) as executor:
+        list(executor.map(parser.process_parse_request, [request] * 3))
+
+    assert len(processed) == 3
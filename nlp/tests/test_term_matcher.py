@@ -0,0 +1,77 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import pytest
+
+from desci_sense.shared_functions.configs import ParserChainType
+from desci_sense.shared_functions.parsers.multi_reference_tagger import (
+    check_equivalence,
+)
+from desci_sense.shared_functions.postprocessing.output_processors import (
+    AllowedTermsParser,
+)
+from desci_sense.shared_functions.postprocessing.term_matcher import (
+    ALLOWED_TERMS_DELIMITER,
+    get_term_matcher,
+    get_term_matcher_from_text,
+)
+from desci_sense.shared_functions.schema.ontology_base import OntologyBase
+
+
+def pairwise_normalize(labels, allowed_terms):
+    # reference pairwise implementation
+    return [
+        term
+        for term in allowed_terms
+        for label in labels
+        if check_equivalence(term, label)
+    ]
+
+
+def test_normalize_matches_pairwise():
+    allowed_terms = OntologyBase().get_all_labels()
+    labels = [
+        "<endorses>",
+        "endorses",
+        "disagrees ",
+        "<not-a-label>",
+        "<call-for-papers>",
+        "callforpapers",
+    ]
+    matcher = get_term_matcher(allowed_terms)
+    assert matcher.normalize(labels) == pairwise_normalize(labels, allowed_terms)
+    assert matcher.normalize([]) == []
+
+
+def test_extract():
+    matcher = get_term_matcher(["<announce>", "<endorses>", "<event>"])
+    text = "Final Answer: <Event>, <endorses>, <announce> and <endorses> again"
+    assert matcher.extract(text) == ["<event>", "<endorses>", "<announce>"]
+    assert get_term_matcher([]).extract(text) == []
+
+
+def test_matchers_shared():
+    terms = ["<a>", "<b>"]
+    assert get_term_matcher(terms) is get_term_matcher(list(terms))
+
+    text = "output \n\n " + ALLOWED_TERMS_DELIMITER + str(terms)
+    assert get_term_matcher_from_text(text) is get_term_matcher(terms)
+
+    with pytest.raises(ValueError):
+        get_term_matcher_from_text("no allowed terms")
+
+
+def test_allowed_terms_parser():
+    text = (
+        "Reasoning Steps: some steps\nCandidate Tags: <a>\nFinal Answer: <b>, <A>"
+        + " \n\n "
+        + ALLOWED_TERMS_DELIMITER
+        + str(["<a>", "<b>", "<c>"])
+    )
+    parser = AllowedTermsParser(parser_chain_type=ParserChainType.REFERENCE_TAGGER)
+    output = parser.parse(text)
+    assert output.answer == ["<b>", "<a>"]
+    assert output.extra["allowed_tags"] == ["<a>", "<b>", "<c>"]
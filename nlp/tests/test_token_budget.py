@@ -0,0 +1,183 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import tiktoken
+
+from desci_sense.shared_functions.configs import (
+    KeywordPParserChainConfig,
+    MetadataExtractionConfig,
+    MultiParserChainConfig,
+    MultiRefTaggerChainConfig,
+    PostRendererType,
+    TokenBudgetConfig,
+)
+from desci_sense.shared_functions.interface import RefMetadata
+from desci_sense.shared_functions.parsers.multi_chain_parser import MultiChainParser
+from desci_sense.shared_functions.schema.post import RefPost, QuoteRefPost
+from desci_sense.shared_functions.preprocessing import (
+    ParserInput,
+    preproc_parser_input,
+)
+from desci_sense.shared_functions.preprocessing.threads import create_thread_from_posts
+from desci_sense.shared_functions.preprocessing.token_budget import (
+    TokenCounter,
+    allocate_token_budget,
+    count_post_tokens,
+    fit_post_metadata_to_budget,
+    get_thread_char_limit,
+)
+
+# byte level encoding (one token per utf-8 byte), doesn't need downloaded files
+BYTE_ENCODING = tiktoken.Encoding(
+    name="bytes",
+    pat_str=r"[\s\S]",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={},
+)
+
+
+def make_thread(num_posts: int, post_length: int):
+    posts = []
+    for i in range(num_posts):
+        url = f"https://example.org/paper/{i}"
+        content = "x" * (post_length - len(url) - 1) + " " + url
+        quoted_post = RefPost(
+            author="quoted author",
+            url=f"https://x.com/quoted/status/{i}",
+            content="q" * post_length,
+        )
+        posts.append(
+            QuoteRefPost(
+                author="author",
+                url=f"https://x.com/author/status/{i}",
+                content=content,
+                ref_urls=[url],
+                ref_url_spans=[(post_length - len(url), post_length, url)],
+                quoted_post=quoted_post,
+                quoted_url=quoted_post.url,
+            )
+        )
+    return create_thread_from_posts(posts)
+
+
+def test_allocate_token_budget():
+    assert allocate_token_budget([10, 100, 100], 90) == [10, 40, 40]
+    assert allocate_token_budget([10, 20], 100) == [10, 20]
+    assert allocate_token_budget([10, 20], -5) == [0, 0]
+    assert allocate_token_budget([], 10) == []
+
+
+def test_token_counter():
+    counter = TokenCounter(BYTE_ENCODING)
+    assert counter.count("héllo") == 6
+    # the split character is dropped
+    assert counter.truncate("héllo", 2) == "h"
+    assert counter.truncate("héllo", 3) == "hé"
+    assert counter.truncate("héllo", 10) == "héllo"
+    assert counter.truncate("héllo", 0) == ""
+
+    # approximate counts without an encoding
+    approx_counter = TokenCounter()
+    assert approx_counter.count("abcde") == 2
+    assert approx_counter.truncate("abcdefghij", 2) == "abcdefgh"
+
+
+def test_thread_char_limit():
+    counter = TokenCounter(BYTE_ENCODING)
+    thread = make_thread(3, 100)
+    # with one byte per char, token and char limits are the same
+    assert get_thread_char_limit(thread, 250, counter) == 250
+    assert get_thread_char_limit(thread, 10000, counter) == thread.char_length()
+
+
+def test_preproc_token_budget(monkeypatch):
+    counter = TokenCounter(BYTE_ENCODING)
+    monkeypatch.setattr(
+        "desci_sense.shared_functions.preprocessing.get_token_counter",
+        lambda encoding_name: counter,
+    )
+    thread = make_thread(10, 100)
+    parser_input = ParserInput(thread_post=thread, max_posts=30)
+    budget_config = TokenBudgetConfig(max_input_tokens=500, metadata_fraction=0.2)
+
+    preproc_input = preproc_parser_input(parser_input, budget_config)
+    trimmed = preproc_input.post_to_parse
+
+    assert count_post_tokens(trimmed, counter) == 400
+    assert len(trimmed.posts) == 2
+    assert trimmed.md_ref_urls() == [
+        "https://example.org/paper/0",
+        "https://example.org/paper/1",
+    ]
+    assert preproc_input.unparsed_urls == [
+        f"https://example.org/paper/{i}" for i in range(2, 10)
+    ]
+
+    # without a budget only the char limit applies
+    preproc_input = preproc_parser_input(parser_input, TokenBudgetConfig())
+    assert preproc_input.post_to_parse.char_length() == thread.char_length()
+
+
+def test_fit_metadata_to_budget():
+    counter = TokenCounter(BYTE_ENCODING)
+    thread = make_thread(2, 100)
+    md_dict = {
+        url: RefMetadata(
+            ref_id=i + 1,
+            citoid_url=url,
+            url=url,
+            title=f"paper {i}",
+            summary=("s" * 1000) if i == 0 else "short summary",
+        )
+        for i, url in enumerate(thread.md_ref_urls())
+    }
+    max_tokens = count_post_tokens(thread, counter) + 600
+
+    fitted = fit_post_metadata_to_budget(thread, md_dict, max_tokens, counter)
+
+    md_tokens = sum(counter.count(md.to_str()) for md in fitted.values())
+    assert md_tokens <= 600
+    assert fitted[thread.md_ref_urls()[1]] is md_dict[thread.md_ref_urls()[1]]
+    assert 0 < len(fitted[thread.md_ref_urls()[0]].summary) < 1000
+    # original metadata is unchanged
+    assert len(md_dict[thread.md_ref_urls()[0]].summary) == 1000
+
+
+def test_chain_token_budget(monkeypatch):
+    counter = TokenCounter(BYTE_ENCODING)
+    for module in ["preprocessing", "parsers.post_parser_chain"]:
+        monkeypatch.setattr(
+            f"desci_sense.shared_functions.{module}.get_token_counter",
+            lambda encoding_name: counter,
+        )
+    config = MultiParserChainConfig(
+        parser_configs=[
+            MultiRefTaggerChainConfig(
+                name="refs_tagger",
+                post_renderer=PostRendererType.THREAD_REF_POST,
+            ),
+            KeywordPParserChainConfig(name="keywords", max_prompt_tokens=3000),
+        ],
+        metadata_extract_config=MetadataExtractionConfig(extraction_method="none"),
+        token_budget_config=TokenBudgetConfig(metadata_fraction=0.2),
+    )
+    parser = MultiChainParser(config)
+    thread = make_thread(10, 100)
+    keywords = parser.pparsers["keywords"]
+
+    # the static prompt prefix counts against the chain's prompt budget
+    prefix_tokens = counter.count(keywords.get_static_prompt_prefix(thread))
+    assert prefix_tokens > 0
+    assert keywords.get_prompt_prefix(thread) == ""
+    budget = keywords.get_input_token_budget(thread)
+    assert budget == 3000 - prefix_tokens
+    # chains without a prompt budget fall back to the global budget
+    assert parser.pparsers["refs_tagger"].get_input_token_budget(thread) is None
+
+    # the thread is trimmed to the smallest chain budget
+    parser_input = ParserInput(thread_post=thread, max_posts=30)
+    trimmed = parser.preproc_parser_input(parser_input).post_to_parse
+    assert count_post_tokens(trimmed, counter) == int(budget * 0.8)
@@ -0,0 +1,142 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from desci_sense.shared_functions.configs import TracingConfig
+from desci_sense.shared_functions.interface import ParsePostRequest
+from desci_sense.shared_functions.tracing import (
+    OTLPExporter,
+    get_current_trace,
+    span,
+    start_trace,
+)
+
+from utils import create_hashtags_parser_for_tests, create_parse_request
+
+PARSE_REQUEST = create_parse_request("Thoughts on #science")
+
+STAGES = [
+    "parse_request",
+    "convert_parse_request",
+    "resolve_urls",
+    "preprocess",
+    "extract_metadata",
+    "instantiate_prompts",
+    "chains",
+    "chain.hashtags",
+    "post_process",
+]
+
+
+def test_spans():
+    # no-op outside a trace
+    with span("outside") as s:
+        assert s is None
+    assert get_current_trace() is None
+
+    with start_trace("root", service="test") as trace:
+        with span("stage", size=2):
+            with span("sub_stage"):
+                pass
+        with span("stage"):
+            pass
+    assert get_current_trace() is None
+
+    spans = {s.name: s for s in trace.spans}
+    assert [s.name for s in trace.spans] == ["sub_stage", "stage", "stage", "root"]
+    assert spans["sub_stage"].parent_id == trace.spans[1].span_id
+    assert trace.spans[1].parent_id == spans["root"].span_id
+    assert trace.spans[1].attributes == {"size": 2}
+    assert set(trace.timings()) == {"root", "stage", "sub_stage"}
+
+
+def test_span_error():
+    try:
+        with start_trace("root") as trace:
+            with span("failing"):
+                raise ValueError("failed")
+    except ValueError:
+        pass
+    assert trace.spans[0].error == "ValueError: failed"
+
+
+def test_parse_request_timings(tmp_path):
+    jsonl_path = tmp_path / "traces.jsonl"
+    parser = create_hashtags_parser_for_tests(
+        tracing_config=TracingConfig(
+            enabled=True, log=False, jsonl_path=str(jsonl_path)
+        )
+    )
+    request = ParsePostRequest.model_validate(PARSE_REQUEST)
+
+    result = parser.process_parse_request(request)
+    assert set(result.metadata["timings_ms"]) == set(STAGES)
+    assert all(t >= 0 for t in result.metadata["timings_ms"].values())
+
+    # chain spans are recorded from the worker threads of the parallel chain
+    trace = json.loads(jsonl_path.read_text().splitlines()[0])
+    assert trace["trace_id"] == result.metadata["trace_id"]
+    spans = {s["name"]: s for s in trace["spans"]}
+    assert spans["chain.hashtags"]["parent_id"] == spans["chains"]["span_id"]
+    assert spans["resolve_urls"]["parent_id"] == spans["convert_parse_request"]["span_id"]
+
+    result = asyncio.run(parser.aprocess_parse_request(PARSE_REQUEST))
+    assert set(result.metadata["timings_ms"]) == set(STAGES)
+    assert len(jsonl_path.read_text().splitlines()) == 2
+
+
+def test_tracing_disabled():
+    parser = create_hashtags_parser_for_tests(tracing_config=TracingConfig())
+    result = parser.process_parse_request(
+        ParsePostRequest.model_validate(PARSE_REQUEST)
+    )
+    assert "timings_ms" not in result.metadata
+    assert parser.trace_exporters == []
+
+
+class FakeCollectorHandler(BaseHTTPRequestHandler):
+    payloads = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        FakeCollectorHandler.payloads.append(json.loads(body))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_otlp_exporter():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeCollectorHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    exporter = OTLPExporter(
+        f"http://127.0.0.1:{server.server_port}/v1/traces", service_name="test"
+    )
+    try:
+        with start_trace("root", [exporter]) as trace:
+            with span("stage", num_posts=3):
+                pass
+        exporter.flush()
+    finally:
+        server.shutdown()
+
+    (payload,) = FakeCollectorHandler.payloads
+    resource_spans = payload["resourceSpans"][0]
+    assert resource_spans["resource"]["attributes"] == [
+        {"key": "service.name", "value": {"stringValue": "test"}}
+    ]
+    stage, root = resource_spans["scopeSpans"][0]["spans"]
+    assert stage["traceId"] == root["traceId"] == trace.trace_id
+    assert stage["parentSpanId"] == root["spanId"]
+    assert "parentSpanId" not in root
+    assert stage["attributes"] == [{"key": "num_posts", "value": {"intValue": "3"}}]
+    assert int(stage["endTimeUnixNano"]) >= int(stage["startTimeUnixNano"])
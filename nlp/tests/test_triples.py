@@ -0,0 +1,159 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import json
+import re
+from datetime import date
+
+import pytest
+from rdflib import Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+from rdflib.namespace import RDF, RDFS
+
+from desci_sense.shared_functions.interface import ParserResult, ParserSupport
+from desci_sense.shared_functions.postprocessing import (
+    convert_keywords_to_rdf_triplets,
+    convert_triplets_to_graph,
+    convert_triplets_to_triple_list,
+    create_quoted_post_triplet,
+)
+from desci_sense.shared_functions.schema.ontology_base import OntologyBase
+from desci_sense.shared_functions.triples import TripleList
+from utils import check_uris_in_graph
+
+POST = URIRef("https://sense-nets.xyz/mySemanticPost")
+
+
+def get_triplets():
+    triplets = convert_keywords_to_rdf_triplets(
+        ["ai", 'quoted "text"', "line\nbreak", "ünïcode"]
+    )
+    triplets.append(create_quoted_post_triplet("https://x.com/user/status/2"))
+    return triplets
+
+
+def get_triples():
+    return [
+        (
+            POST,
+            URIRef("http://purl.org/spar/cito/discusses"),
+            URIRef("https://arxiv.org/abs/1"),
+        ),
+        (POST, RDF.type, URIRef("https://sense-nets.xyz/other")),
+        (
+            URIRef("https://arxiv.org/abs/1"),
+            URIRef("https://sense-nets.xyz/hasZoteroItemType"),
+            Literal("preprint"),
+        ),
+        (POST, URIRef("https://schema.org/keywords"), Literal("bonjour", lang="fr")),
+        (POST, URIRef("https://schema.org/keywords"), Literal('line\nbreak "quoted"')),
+    ] + [t.to_tuple() for t in get_triplets()]
+
+
+def test_turtle_identical_to_graph():
+    triplets = get_triplets()
+    graph = convert_triplets_to_graph(triplets)
+    triples = convert_triplets_to_triple_list(triplets)
+    assert triples.serialize(format="turtle") == graph.serialize(format="turtle")
+
+    # duplicates are dropped like in a graph
+    triples.add(triplets[0].to_tuple())
+    assert len(triples) == len(graph)
+
+
+def normalize_generated_prefixes(turtle: str) -> str:
+    # rdflib numbers generated prefixes (ns1, ns2, ...) in hash order
+    prefixes = re.findall(r"@prefix (ns\d+): <([^>]*)>", turtle)
+    for prefix, namespace in prefixes:
+        turtle = re.sub(rf"\b{prefix}:", f"<{namespace}>:", turtle)
+    return "\n".join(sorted(turtle.splitlines()))
+
+
+def test_turtle_matches_rdflib():
+    post_type = URIRef("https://sense-nets.xyz/other")
+    extra = [
+        (POST, RDF.type, URIRef("https://sense-nets.xyz/second")),
+        (post_type, RDF.type, RDFS.Class),
+        (post_type, RDFS.label, Literal("other")),
+        (POST, URIRef("https://schema.org/datePublished"), Literal(date(2024, 1, 1))),
+        (POST, URIRef("https://schema.org/position"), Literal(2)),
+        (POST, URIRef("https://example.org/p(1)"), URIRef("https://schema.org/")),
+    ]
+    triples = TripleList(get_triples() + extra)
+    graph = Graph()
+    for t in triples:
+        graph.add(t)
+    turtle = triples.serialize(format="turtle")
+    assert normalize_generated_prefixes(turtle) == normalize_generated_prefixes(
+        graph.serialize(format="turtle")
+    )
+    assert isomorphic(Graph().parse(data=turtle, format="turtle"), graph)
+
+    # no graph is built to serialize
+    triples = TripleList(get_triples())
+    triples.serialize(format="turtle")
+    assert triples._graph is None
+
+
+def test_direct_writers_match_rdflib():
+    triples = TripleList(get_triples())
+    graph = Graph()
+    for t in get_triples():
+        graph.add(t)
+
+    nt = triples.serialize(format="nt")
+    assert sorted(nt.splitlines()) == sorted(graph.serialize(format="nt").splitlines())
+
+    for fmt in ["nt", "nquads", "trig", "json-ld"]:
+        parsed = Graph().parse(data=triples.serialize(format=fmt), format=fmt)
+        assert isomorphic(parsed, graph), fmt
+
+    jsonld = json.loads(triples.serialize(format="json-ld"))
+    assert jsonld[0]["@type"] == ["https://sense-nets.xyz/other"]
+
+
+def test_graph_api():
+    triples = TripleList(get_triples())
+    assert (POST, RDF.type, URIRef("https://sense-nets.xyz/other")) in triples
+    assert Literal("ai") in triples.all_nodes()
+    graph = triples.to_graph()
+    assert set(graph) == set(triples)
+    # graph kept in sync after creation
+    triples.add((POST, RDF.type, URIRef("https://sense-nets.xyz/new")))
+    assert len(triples.to_graph()) == len(triples)
+
+
+def test_wildcard_patterns():
+    triples = TripleList(get_triples())
+    graph = triples.to_graph()
+    arxiv = URIRef("https://arxiv.org/abs/1")
+    for pattern in [
+        (arxiv, None, None),
+        (None, None, arxiv),
+        (POST, URIRef("https://schema.org/keywords"), None),
+        (None, RDF.type, None),
+        (None, None, URIRef("https://not-in-graph.org")),
+        (None, None, None),
+    ]:
+        assert set(triples.triples(pattern)) == set(graph.triples(pattern))
+        assert (pattern in triples) == (pattern in graph)
+
+    check_uris_in_graph(triples, [str(POST), str(arxiv), str(RDF.type)])
+    with pytest.raises(AssertionError):
+        check_uris_in_graph(triples, ["https://not-in-graph.org"])
+
+
+def test_parser_result_roundtrip():
+    ontology = OntologyBase()
+    support = ParserSupport(ontology=ontology.ontology_interface)
+    graph = convert_triplets_to_graph(get_triplets())
+    # graphs are still accepted
+    res = ParserResult(semantics=graph, support=support)
+    assert isinstance(res.semantics, TripleList)
+    assert res.model_dump()["semantics"] == graph.serialize(format="turtle")
+
+    loaded = ParserResult.model_validate_json(res.model_dump_json())
+    assert set(loaded.semantics) == set(graph)
@@ -0,0 +1,90 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import io
+import json
+import zipfile
+
+import pytest
+
+from desci_sense.dataloaders.twitter.twitter_archive_loader import (
+    TwitterArchiveLoader,
+    iter_js_records,
+)
+
+
+def make_tweet(tweet_id: int, created_at: str, ref_urls=()):
+    return {
+        "tweet": {
+            "id": str(tweet_id),
+            "full_text": f"tweet number {tweet_id}",
+            "created_at": created_at,
+            "entities": {"urls": [{"expanded_url": url} for url in ref_urls]},
+        }
+    }
+
+
+def to_js(name: str, items) -> str:
+    return f"window.YTD.{name}.part0 = " + json.dumps(items, indent=2)
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    tweets = [
+        make_tweet(1, "Mon Jan 01 10:00:00 +0000 2024", ["https://example.com/a"]),
+        make_tweet(2, "Fri Mar 01 10:00:00 +0000 2024"),
+        make_tweet(3, "Tue Dec 31 23:59:59 +0000 2019"),
+    ]
+    more_tweets = [make_tweet(4, "Sat Jun 01 10:00:00 +0000 2024")]
+    path = tmp_path / "twitter-archive.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr(
+            "archive/data/account.js",
+            to_js("account", [{"account": {"username": "test_user"}}]),
+        )
+        zf.writestr("archive/data/tweets.js", to_js("tweets", tweets))
+        zf.writestr("archive/data/tweets-part1.js", to_js("tweets", more_tweets))
+        zf.writestr("archive/data/like.js", to_js("like", [{"like": {}}]))
+    return path
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 20])
+def test_iter_js_records(chunk_size):
+    items = [{"a": 1, "b": "x ] , {"}, [1, 2], 3, "s", {"c": None}]
+    text = to_js("tweets", items)
+    assert list(iter_js_records(io.StringIO(text), chunk_size)) == items
+    assert list(iter_js_records(io.StringIO("window.YTD.tweets.part0 = []"))) == []
+    assert list(iter_js_records(io.StringIO(""))) == []
+    with pytest.raises(ValueError):
+        list(iter_js_records(io.StringIO('x = [{"a": 1}, {"b"'), chunk_size))
+
+
+def test_iter_archive(archive_path):
+    loader = TwitterArchiveLoader()
+    posts = list(loader.iter_archive(str(archive_path)))
+    assert [p.url for p in posts] == [
+        f"https://twitter.com/test_user/status/{i}" for i in [1, 2, 3, 4]
+    ]
+    assert posts[0].author == "test_user"
+    assert posts[0].ref_urls == ["https://example.com/a"]
+
+    # nothing extracted next to the archive
+    assert list(archive_path.parent.iterdir()) == [archive_path]
+
+    posts = loader.load_archive(str(archive_path), cutoff_date="2024-02-01")
+    assert [p.url.split("/")[-1] for p in posts] == ["2", "4"]
+
+
+def test_iter_archive_batches(archive_path):
+    loader = TwitterArchiveLoader()
+    batches = list(loader.iter_archive_batches(str(archive_path), batch_size=3))
+    assert [len(b) for b in batches] == [3, 1]
+    batches = list(
+        loader.iter_archive_batches(
+            str(archive_path), batch_size=3, cutoff_date="2020-01-01"
+        )
+    )
+    assert [[p.url.split("/")[-1] for p in b] for b in batches] == [["1", "2", "4"]]
@@ -0,0 +1,118 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+sys.path.append(str(ROOT))
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from desci_sense.shared_functions import utils
+from desci_sense.shared_functions.preprocessing import (
+    convert_parse_request_to_parser_input,
+)
+from desci_sense.shared_functions.web_extractors.url_resolver import URLResolver
+
+
+class RedirectHandler(BaseHTTPRequestHandler):
+    requests_made = []
+
+    def do_HEAD(self):
+        RedirectHandler.requests_made.append(self.path)
+        if self.path.startswith("/short/"):
+            self.send_response(301)
+            self.send_header("Location", "/long/" + self.path.split("/")[-1])
+        else:
+            self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RedirectHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    RedirectHandler.requests_made = []
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_resolve_and_cache(server_url):
+    resolver = URLResolver()
+    urls = [f"{server_url}/short/{i}" for i in range(5)]
+    res = resolver.resolve_urls(urls + urls)
+    assert res == [f"{server_url}/long/{i}" for i in range(5)] * 2
+
+    # each distinct url requested once, then served from cache
+    num_requests = len(RedirectHandler.requests_made)
+    assert num_requests == 10  # short + long per url
+    assert resolver.resolve_urls(urls) == res[:5]
+    assert resolver.resolve_urls(res[:5]) == res[:5]
+    assert len(RedirectHandler.requests_made) == num_requests
+
+
+def test_skip_known_domains():
+    resolver = URLResolver()
+    urls = ["https://x.com/user/status/1", "https://www.arxiv.org/abs/1234"]
+    assert resolver.resolve_urls(urls) == urls
+
+
+def test_failed_url_returned_unchanged():
+    resolver = URLResolver(timeout=2)
+    urls = ["httpsss://ept.ms/3VUYqTRsdfs/ff"]
+    assert resolver.resolve_urls(urls) == urls
+
+
+def test_resolve_inside_running_loop(server_url):
+    resolver = URLResolver()
+
+    async def resolve():
+        # sync api called from async code
+        return resolver.resolve_urls([f"{server_url}/short/a"])
+
+    assert asyncio.run(resolve()) == [f"{server_url}/long/a"]
+
+
+def test_parse_request_urls_resolved_in_one_pass(server_url, monkeypatch):
+    batches = []
+    resolve_urls = utils.resolve_urls
+
+    def record_resolve_urls(urls):
+        batches.append(list(urls))
+        return resolve_urls(urls)
+
+    monkeypatch.setattr(utils, "resolve_urls", record_resolve_urls)
+    author = {"id": "1", "name": "A", "username": "a", "platformId": "twitter"}
+    urls = [f"{server_url}/short/{name}" for name in ["p1", "p2", "q1"]]
+    quoted_thread = {
+        "author": author,
+        "thread": [{"url": "https://x.com/b/status/3", "content": f"see {urls[2]}"}],
+    }
+    parse_request = {
+        "post": {
+            "author": author,
+            "thread": [
+                {"url": "https://x.com/a/status/1", "content": f"see {urls[0]}"},
+                {
+                    "url": "https://x.com/a/status/2",
+                    "content": f"and {urls[1]}",
+                    "quotedThread": quoted_thread,
+                },
+            ],
+        }
+    }
+
+    parser_input = convert_parse_request_to_parser_input(parse_request)
+    # urls of all posts, including quoted posts, are resolved in the first batch
+    assert batches[0] == urls
+    assert sorted(RedirectHandler.requests_made) == sorted(
+        [f"/short/{name}" for name in ["p1", "p2", "q1"]]
+        + [f"/long/{name}" for name in ["p1", "p2", "q1"]]
+    )
+    assert f"{server_url}/long/p1" in parser_input.thread_post.ref_urls
@@ -4,7 +4,7 @@ from pathlib import Path
 ROOT = Path(__file__).parents[1]
 sys.path.append(str(ROOT))
 
-from typing import Optional
+from typing import Dict, Optional
 from rdflib import Graph, URIRef
 from confection import Config
 
@@ -37,8 +37,19 @@ from desci_sense.shared_functions.configs import (
     validate_env_var,
     MultiParserChainConfig,
     ParserChainType,
+    HashtagPParserChainConfig,
+    MetadataExtractionConfig,
+    MetadataExtractionType,
+    PostProcessType,
 )
 
+TEST_AUTHOR = {
+    "id": "1",
+    "name": "Test Author",
+    "username": "test_author",
+    "platformId": "twitter",
+}
+
 TEST_THREAD = {
     "author": {
         "id": "2111",
@@ -231,6 +242,47 @@ def create_multi_chain_for_tests():
     return MultiChainParser(multi_config)
 
 
+def create_parse_request(*contents: str) -> Dict:
+    """
+    Raw parse request of a thread by `TEST_AUTHOR` with a post for each of
+    `contents`.
+    """
+    return {
+        "post": {
+            "author": TEST_AUTHOR,
+            "url": "https://x.com/test_author/status/1",
+            "thread": [
+                {"url": f"https://x.com/test_author/status/{i}", "content": content}
+                for i, content in enumerate(contents, 1)
+            ],
+        }
+    }
+
+
+def create_hashtags_config_for_tests(
+    post_process_type: PostProcessType = PostProcessType.FIREBASE, **kwargs
+) -> MultiParserChainConfig:
+    """
+    Config of a parser running only the hashtags chain, so no models are
+    called and no metadata is fetched. `kwargs` set other config fields.
+    """
+    return MultiParserChainConfig(
+        parser_configs=[HashtagPParserChainConfig(name="hashtags")],
+        post_process_type=post_process_type,
+        metadata_extract_config=MetadataExtractionConfig(
+            extraction_method=MetadataExtractionType.NONE
+        ),
+        **kwargs,
+    )
+
+
+def create_hashtags_parser_for_tests(
+    post_process_type: PostProcessType = PostProcessType.FIREBASE, **kwargs
+) -> MultiChainParser:
+    config = create_hashtags_config_for_tests(post_process_type, **kwargs)
+    return MultiChainParser(config)
+
+
 def check_uris_in_graph(graph: Graph, uris: list):
     """
     Test to assert the presence of a list of URIs in the given RDFLib graph.